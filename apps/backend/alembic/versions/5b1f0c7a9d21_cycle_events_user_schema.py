@@ -0,0 +1,58 @@
+"""cycle_events user schema
+
+Revision ID: 5b1f0c7a9d21
+Revises: e2c6674d7970
+Create Date: 2026-10-18 10:12:40.118203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1f0c7a9d21'
+down_revision: Union[str, Sequence[str], None] = 'e2c6674d7970'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # cycle_events pasa al esquema de app/db/models.py (user_id/type/date/meta);
+    # las columnas heredadas cycle_id/description se conservan sin mapear.
+    op.add_column('cycle_events', sa.Column('user_id', sa.String(), nullable=True))
+    op.add_column('cycle_events', sa.Column('type', sa.String(), nullable=True))
+    op.add_column('cycle_events', sa.Column('date', sa.Date(), nullable=True))
+    op.add_column('cycle_events', sa.Column('meta', sa.JSON(), nullable=True))
+    # Filas heredadas: sin usuario (ninguna consulta por user_id las ve), se
+    # rellenan para poder exigir NOT NULL
+    op.execute("UPDATE cycle_events SET type = 'legacy' WHERE type IS NULL")
+    op.execute("UPDATE cycle_events SET date = CURRENT_DATE WHERE date IS NULL")
+    with op.batch_alter_table('cycle_events') as batch_op:
+        batch_op.alter_column('type', existing_type=sa.String(), nullable=False)
+        batch_op.alter_column('date', existing_type=sa.Date(), nullable=False)
+    op.create_index(op.f('ix_cycle_events_user_id'), 'cycle_events', ['user_id'], unique=False)
+    op.create_table('cycle_summaries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.String(), nullable=True),
+    sa.Column('start_date', sa.Date(), nullable=False),
+    sa.Column('end_date', sa.Date(), nullable=True),
+    sa.Column('average_length', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_cycle_summaries_id'), 'cycle_summaries', ['id'], unique=False)
+    op.create_index(op.f('ix_cycle_summaries_user_id'), 'cycle_summaries', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_cycle_summaries_user_id'), table_name='cycle_summaries')
+    op.drop_index(op.f('ix_cycle_summaries_id'), table_name='cycle_summaries')
+    op.drop_table('cycle_summaries')
+    op.drop_index(op.f('ix_cycle_events_user_id'), table_name='cycle_events')
+    op.drop_column('cycle_events', 'meta')
+    op.drop_column('cycle_events', 'date')
+    op.drop_column('cycle_events', 'type')
+    op.drop_column('cycle_events', 'user_id')
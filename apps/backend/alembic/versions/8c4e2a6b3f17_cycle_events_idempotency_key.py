@@ -0,0 +1,30 @@
+"""cycle_events idempotency key
+
+Revision ID: 8c4e2a6b3f17
+Revises: 5b1f0c7a9d21
+Create Date: 2026-10-18 11:02:09.530417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c4e2a6b3f17'
+down_revision: Union[str, Sequence[str], None] = '5b1f0c7a9d21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('cycle_events', sa.Column('idempotency_key', sa.String(length=64), nullable=True))
+    op.create_index('uq_cycle_events_user_idempotency', 'cycle_events', ['user_id', 'idempotency_key'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_cycle_events_user_idempotency', table_name='cycle_events')
+    op.drop_column('cycle_events', 'idempotency_key')
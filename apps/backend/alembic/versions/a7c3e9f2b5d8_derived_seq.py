@@ -0,0 +1,32 @@
+"""derived_seq and created_seq for background derived work
+
+Revision ID: a7c3e9f2b5d8
+Revises: f6b2d8e4a1c9
+Create Date: 2026-10-18 21:12:47.530216
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c3e9f2b5d8'
+down_revision: Union[str, Sequence[str], None] = 'f6b2d8e4a1c9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('cycle_sync_state', sa.Column('derived_seq', sa.BigInteger(), server_default='0', nullable=False))
+    op.add_column('cycle_events', sa.Column('created_seq', sa.BigInteger(), nullable=True))
+    # Hasta ahora los derivados se aplicaban en la misma transacción que el evento
+    op.execute("UPDATE cycle_sync_state SET derived_seq = change_seq")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('cycle_events', 'created_seq')
+    op.drop_column('cycle_sync_state', 'derived_seq')
@@ -0,0 +1,31 @@
+"""cycle_summaries incremental
+
+Revision ID: a93d51e0c6b4
+Revises: 8c4e2a6b3f17
+Create Date: 2026-10-18 12:20:47.301166
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a93d51e0c6b4'
+down_revision: Union[str, Sequence[str], None] = '8c4e2a6b3f17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('cycle_summaries', sa.Column('cycle_length', sa.Integer(), nullable=True))
+    op.create_index('uq_cycle_summaries_user_start', 'cycle_summaries', ['user_id', 'start_date'], unique=True)
+    # Rellenar con: python -m app.services.summaries rebuild
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_cycle_summaries_user_start', table_name='cycle_summaries')
+    op.drop_column('cycle_summaries', 'cycle_length')
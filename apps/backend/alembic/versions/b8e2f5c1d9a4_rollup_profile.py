@@ -0,0 +1,39 @@
+"""profile the analytics rollups of each user are counted under
+
+Revision ID: b8e2f5c1d9a4
+Revises: a7c3e9f2b5d8
+Create Date: 2026-10-18 23:40:12.318806
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8e2f5c1d9a4'
+down_revision: Union[str, Sequence[str], None] = 'a7c3e9f2b5d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('cycle_sync_state', sa.Column('rollup_pais', sa.String(), nullable=True))
+    op.add_column('cycle_sync_state', sa.Column('rollup_ciudad', sa.String(), nullable=True))
+    op.add_column('cycle_sync_state', sa.Column('rollup_edad', sa.Integer(), nullable=True))
+    # Hasta ahora los rollups se movían al guardar el perfil: están con el actual
+    op.execute(
+        "UPDATE cycle_sync_state SET "
+        "rollup_pais = (SELECT pais FROM users WHERE users.firebase_uid = cycle_sync_state.user_id), "
+        "rollup_ciudad = (SELECT ciudad FROM users WHERE users.firebase_uid = cycle_sync_state.user_id), "
+        "rollup_edad = (SELECT edad FROM users WHERE users.firebase_uid = cycle_sync_state.user_id)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('cycle_sync_state', 'rollup_edad')
+    op.drop_column('cycle_sync_state', 'rollup_ciudad')
+    op.drop_column('cycle_sync_state', 'rollup_pais')
@@ -0,0 +1,165 @@
+"""cycle_events covering indexes and optional partitioning
+
+Revision ID: c7e1f4a2b8d0
+Revises: a93d51e0c6b4
+Create Date: 2026-10-18 14:41:05.772930
+
+Índices compuestos para el patrón de acceso real de cycle_events:
+- (user_id, date DESC, id DESC) INCLUDE (type): el keyset de /cycle/history
+  (ORDER BY date DESC, id DESC) se lee en orden directo del índice.
+- (user_id, date DESC) WHERE type IN ('period_start', 'period_end'): inicios
+  recientes para la predicción y el rebuild de resúmenes sin tocar síntomas.
+En PostgreSQL se construyen con CREATE INDEX CONCURRENTLY (sin bloquear
+escrituras), por eso van en un autocommit_block.
+
+Particionado opcional (solo PostgreSQL), por hash de user_id:
+
+    alembic -x partition=hash:16 upgrade head
+
+Crea cycle_events particionada, copia los datos y crea en cada partición los
+índices CONCURRENTLY, adjuntándolos al índice padre. Después bloquea las
+escrituras en cycle_events (SHARE ROW EXCLUSIVE), vuelve a copiar lo que cambió
+mientras tanto e intercambia los nombres en esa misma transacción, así que no se
+pierde ningún evento. La tabla original queda como cycle_events_unpartitioned
+para poder volver atrás; el downgrade la vuelve a llenar entera desde la
+particionada (con los borrados lógicos y change_seq posteriores) antes de
+restaurarla.
+La clave primaria pasa a (id, user_id): las filas heredadas sin usuario de
+5b1f0c7a9d21 (que ninguna consulta por user_id ve) reciben user_id '' antes de
+copiar. y la unicidad de (user_id,
+idempotency_key) se conserva tal cual, que es el destino de los ON CONFLICT de
+insert_events, el importador y el write-behind. No se ofrece particionado por
+rango de date: PostgreSQL exige la clave de partición en todo índice único, y
+(user_id, idempotency_key, date) dejaría de deduplicar reintentos con otra fecha.
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7e1f4a2b8d0'
+down_revision: Union[str, Sequence[str], None] = 'a93d51e0c6b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+HISTORY_INDEX = 'ix_cycle_events_user_date_id'
+PERIOD_INDEX = 'ix_cycle_events_user_period_date'
+
+
+def _is_postgres() -> bool:
+    return op.get_bind().dialect.name == 'postgresql'
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            HISTORY_INDEX, 'cycle_events',
+            ['user_id', sa.text('date DESC'), sa.text('id DESC')],
+            postgresql_include=['type'],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            PERIOD_INDEX, 'cycle_events',
+            ['user_id', sa.text('date DESC')],
+            postgresql_where=sa.text("type IN ('period_start', 'period_end')"),
+            postgresql_concurrently=True,
+        )
+        # Prefijo del índice compuesto: ya no aporta nada y encarece cada INSERT
+        op.drop_index(op.f('ix_cycle_events_user_id'), table_name='cycle_events', postgresql_concurrently=True)
+
+    partition = context.get_x_argument(as_dictionary=True).get('partition')
+    if partition and _is_postgres():
+        _partition(partition)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if _is_postgres() and op.get_bind().execute(
+        sa.text("SELECT to_regclass('cycle_events_unpartitioned')")
+    ).scalar():
+        _unpartition()
+
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_cycle_events_user_id'), 'cycle_events', ['user_id'], unique=False, postgresql_concurrently=True)
+        op.drop_index(PERIOD_INDEX, table_name='cycle_events', postgresql_concurrently=True)
+        op.drop_index(HISTORY_INDEX, table_name='cycle_events', postgresql_concurrently=True)
+
+
+# --- Particionado ---
+
+def _partition(spec: str) -> None:
+    strategy, _, arg = spec.partition(':')
+    if strategy != 'hash':
+        raise ValueError(f"partition debe ser hash:N, no {spec!r}")
+    partitions = _hash_partitions(int(arg or 16))
+
+    # user_id entra en la clave primaria: las filas heredadas no pueden ir con NULL
+    op.execute("UPDATE cycle_events SET user_id = '' WHERE user_id IS NULL")
+
+    op.execute(f"""
+        CREATE TABLE cycle_events_partitioned (
+            LIKE cycle_events INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+            PRIMARY KEY (id, user_id)
+        ) PARTITION BY HASH (user_id)
+    """)
+    for name, bounds in partitions:
+        op.execute(f"CREATE TABLE {name} PARTITION OF cycle_events_partitioned {bounds}")
+
+    # Índices padre ON ONLY (inválidos hasta adjuntar todas las particiones)
+    indexes = {
+        'uq_cycle_events_p_user_idempotency': "UNIQUE INDEX {name} ON {table} (user_id, idempotency_key)",
+        'ix_cycle_events_p_user_date_id': "INDEX {name} ON {table} (user_id, date DESC, id DESC) INCLUDE (type)",
+        'ix_cycle_events_p_user_period_date': (
+            "INDEX {name} ON {table} (user_id, date DESC) WHERE type IN ('period_start', 'period_end')"
+        ),
+    }
+    for name, ddl in indexes.items():
+        op.execute("CREATE " + ddl.format(name=name, table='ONLY cycle_events_partitioned'))
+
+    op.execute("INSERT INTO cycle_events_partitioned SELECT * FROM cycle_events")
+
+    with op.get_context().autocommit_block():
+        for partition_name, _ in partitions:
+            for name, ddl in indexes.items():
+                child = f"{name}_{partition_name}"
+                op.execute("CREATE " + ddl.replace("INDEX", "INDEX CONCURRENTLY", 1).format(name=child, table=partition_name))
+                op.execute(f"ALTER INDEX {name} ATTACH PARTITION {child}")
+
+    # Lo escrito durante la construcción de índices: se bloquean las escrituras y se
+    # vuelve a copiar lo que cambió, en la misma transacción que el intercambio
+    op.execute("LOCK TABLE cycle_events IN SHARE ROW EXCLUSIVE MODE")
+    op.execute("""
+        DELETE FROM cycle_events_partitioned p
+        WHERE NOT EXISTS (
+            SELECT 1 FROM cycle_events c WHERE c.id = p.id AND to_jsonb(c) = to_jsonb(p)
+        )
+    """)
+    op.execute("""
+        INSERT INTO cycle_events_partitioned
+        SELECT * FROM cycle_events c
+        WHERE NOT EXISTS (SELECT 1 FROM cycle_events_partitioned p WHERE p.id = c.id)
+    """)
+    op.execute("ALTER TABLE cycle_events RENAME TO cycle_events_unpartitioned")
+    op.execute("ALTER TABLE cycle_events_partitioned RENAME TO cycle_events")
+    op.execute("ALTER SEQUENCE cycle_events_id_seq OWNED BY cycle_events.id")
+
+
+def _hash_partitions(modulus: int):
+    return [
+        (f"cycle_events_h{i:02d}", f"FOR VALUES WITH (MODULUS {modulus}, REMAINDER {i})")
+        for i in range(modulus)
+    ]
+
+
+def _unpartition() -> None:
+    # Copia completa: desde el particionado también cambiaron filas ya existentes
+    # (borrados lógicos, change_seq), no solo se añadieron
+    op.execute("LOCK TABLE cycle_events IN SHARE ROW EXCLUSIVE MODE")
+    op.execute("TRUNCATE cycle_events_unpartitioned")
+    op.execute("INSERT INTO cycle_events_unpartitioned SELECT * FROM cycle_events")
+    op.execute("ALTER SEQUENCE cycle_events_id_seq OWNED BY cycle_events_unpartitioned.id")
+    op.execute("DROP TABLE cycle_events")
+    op.execute("ALTER TABLE cycle_events_unpartitioned RENAME TO cycle_events")
@@ -0,0 +1,46 @@
+"""cycle_events change_seq and tombstones
+
+Revision ID: d4f8b1e9a2c3
+Revises: c7e1f4a2b8d0
+Create Date: 2026-10-18 15:27:39.118402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4f8b1e9a2c3'
+down_revision: Union[str, Sequence[str], None] = 'c7e1f4a2b8d0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('cycle_sync_state',
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('change_seq', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.add_column('cycle_events', sa.Column('change_seq', sa.BigInteger(), nullable=True))
+    op.add_column('cycle_events', sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True))
+    # Los eventos existentes heredan su id: es creciente dentro de cada usuario
+    op.execute("UPDATE cycle_events SET change_seq = id")
+    op.execute(
+        "INSERT INTO cycle_sync_state (user_id, change_seq) "
+        "SELECT user_id, MAX(change_seq) FROM cycle_events WHERE user_id IS NOT NULL GROUP BY user_id"
+    )
+    op.create_index('ix_cycle_events_user_change_seq', 'cycle_events', ['user_id', 'change_seq'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Los tombstones no existían antes de esta revisión
+    op.execute("DELETE FROM cycle_events WHERE deleted_at IS NOT NULL")
+    op.drop_index('ix_cycle_events_user_change_seq', table_name='cycle_events')
+    op.drop_column('cycle_events', 'deleted_at')
+    op.drop_column('cycle_events', 'change_seq')
+    op.drop_table('cycle_sync_state')
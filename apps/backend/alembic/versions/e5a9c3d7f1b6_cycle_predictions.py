@@ -0,0 +1,39 @@
+"""cycle_predictions
+
+Revision ID: e5a9c3d7f1b6
+Revises: d4f8b1e9a2c3
+Create Date: 2026-10-18 16:08:12.530917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a9c3d7f1b6'
+down_revision: Union[str, Sequence[str], None] = 'd4f8b1e9a2c3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('cycle_predictions',
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('model', sa.String(), nullable=False),
+    sa.Column('next_period_start', sa.Date(), nullable=False),
+    sa.Column('confidence_days', sa.Integer(), nullable=False),
+    sa.Column('fertile_start', sa.Date(), nullable=False),
+    sa.Column('fertile_end', sa.Date(), nullable=False),
+    sa.Column('change_seq', sa.BigInteger(), nullable=False),
+    sa.Column('computed_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('user_id', 'model')
+    )
+    # Rellenar con: python -m app.services.prediction_job run
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('cycle_predictions')
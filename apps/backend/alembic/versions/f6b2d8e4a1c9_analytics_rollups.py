@@ -0,0 +1,37 @@
+"""analytics_rollups
+
+Revision ID: f6b2d8e4a1c9
+Revises: e5a9c3d7f1b6
+Create Date: 2026-10-18 18:41:05.204119
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6b2d8e4a1c9'
+down_revision: Union[str, Sequence[str], None] = 'e5a9c3d7f1b6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('analytics_rollups',
+    sa.Column('dimension', sa.String(length=16), nullable=False),
+    sa.Column('key', sa.String(length=128), nullable=False),
+    sa.Column('metric', sa.String(length=32), nullable=False),
+    sa.Column('bucket', sa.String(length=64), nullable=False),
+    sa.Column('shard', sa.SmallInteger(), nullable=False),
+    sa.Column('count', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('dimension', 'key', 'metric', 'bucket', 'shard')
+    )
+    # Rellenar con: python -m app.services.analytics rebuild
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('analytics_rollups')
@@ -0,0 +1,29 @@
+"""GET condicional (If-None-Match) con ETags basados en la versión de caché del usuario."""
+from typing import Optional
+
+from fastapi import Request, Response, status
+
+from app.core.cache import cache
+
+CACHE_CONTROL = "private, no-cache"  # el cliente guarda la respuesta pero revalida siempre
+VARY = "Authorization"  # la respuesta depende del usuario del token
+
+
+async def not_modified(request: Request, response: Response, uid: str, name: str, params: str = "") -> Optional[Response]:
+    """
+    Fija ETag en la respuesta y devuelve un 304 listo si el cliente ya tiene esa
+    versión. No toca la base de datos: solo lee la versión del usuario.
+    """
+    tag = await cache.etag(uid, name, params)
+    if tag is None:
+        return None
+    response.headers["ETag"] = tag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    response.headers["Vary"] = VARY
+    candidates = {value.strip() for value in request.headers.get("if-none-match", "").split(",")}
+    if tag in candidates or "*" in candidates:
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers={"ETag": tag, "Cache-Control": CACHE_CONTROL, "Vary": VARY},
+        )
+    return None
@@ -1,28 +1,14 @@
 # apps/backend/app/api/deps.py
-import os
-from typing import Generator
+from typing import Generator, Optional
 
-import firebase_admin
-from firebase_admin import auth as firebase_auth, credentials
-from fastapi import Depends, HTTPException, Security, status
+from fastapi import Depends, HTTPException, Query, Security, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.db.session import SessionLocal
-from app.core.config import settings  # ✅ IMPORTANTE
-
-print("DEBUG FIREBASE_CREDENTIALS:", os.getcwd(), settings.FIREBASE_CREDENTIALS)
-
-# --- Inicializar Firebase Admin (una sola vez) ---
-if not firebase_admin._apps:
-    cred_path = settings.FIREBASE_CREDENTIALS
-    if not cred_path or not os.path.exists(cred_path):
-        import os
-        print("DEBUG FIREBASE_CREDENTIALS:", os.path.abspath(cred_path))
-        print("EXISTS:", os.path.exists(cred_path))
-        raise RuntimeError(f"FIREBASE_CREDENTIALS no está definido o el fichero no existe: {cred_path}")
-    cred = credentials.Certificate(cred_path)
-    firebase_admin.initialize_app(cred)
+from app.core.security import ExpiredTokenError, TokenError, verify_id_token
+from app.core.tickets import TicketError, stream_tickets
 
 # --- Seguridad HTTP Bearer para leer Authorization header ---
 security = HTTPBearer()
@@ -37,21 +23,51 @@ def get_db() -> Generator[Session, None, None]:
         db.close()
 
 
-def get_current_user(
+async def get_current_user(
     token: HTTPAuthorizationCredentials = Security(security),
 ) -> dict:
     """
     Valida el idToken de Firebase y devuelve el token decodificado (claims).
     Lanza HTTPException 401 si inválido.
     """
-    id_token = token.credentials
+    return await _verify(token.credentials)
+
+
+async def _verify(id_token: str) -> dict:
     try:
-        decoded_token = firebase_auth.verify_id_token(id_token)
-    except firebase_auth.InvalidIdTokenError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ID token inválido")
-    except firebase_auth.ExpiredIdTokenError:
+        return await verify_id_token(id_token)
+    except ExpiredTokenError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ID token expirado")
+    except TokenError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ID token inválido")
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autorizado")
 
-    return decoded_token
+
+async def get_stream_user(
+    token: Optional[HTTPAuthorizationCredentials] = Security(HTTPBearer(auto_error=False)),
+    ticket: Optional[str] = Query(None, description="Ticket de POST /cycle/live/ticket, para EventSource"),
+) -> dict:
+    """
+    Como get_current_user, o con un ticket de un solo uso en ?ticket= (EventSource
+    no envía cabeceras). El idToken nunca va en la URL: acabaría en los logs.
+    """
+    if token:
+        return await _verify(token.credentials)
+    if not ticket:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    try:
+        return {"uid": await stream_tickets.redeem(ticket)}
+    except TicketError as e:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"No autorizado: {e}")
+
+
+async def require_admin(user: dict = Depends(get_current_user)) -> dict:
+    """
+    Solo administradores: claim personalizado `admin` de Firebase o UID incluido
+    en ADMIN_UIDS. Lanza HTTPException 403 si no.
+    """
+    admins = {uid.strip() for uid in settings.ADMIN_UIDS.split(",") if uid.strip()}
+    if user.get("admin") is not True and user.get("uid") not in admins:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo administradores")
+    return user
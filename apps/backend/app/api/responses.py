@@ -0,0 +1,40 @@
+"""
+Respuestas serializadas directamente a bytes por pydantic-core (Rust), sin pasar
+por jsonable_encoder, y msgpack opcional para clientes que lo pidan con
+`Accept: application/x-msgpack`.
+"""
+from typing import Any, Optional
+
+import msgpack
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from pydantic_core import to_json, to_jsonable_python
+
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+# Cabeceras fijadas por la ruta (p. ej. ETag) que se conservan al devolver una Response propia
+FORWARDED_HEADERS = ("etag", "cache-control")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return to_json(content)
+
+
+class MsgpackResponse(Response):
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        # Fechas y demás tipos no nativos de msgpack van como en JSON (ISO 8601)
+        return msgpack.packb(to_jsonable_python(content), use_bin_type=True)
+
+
+def negotiated(request: Request, content: Any, response: Optional[Response] = None) -> Response:
+    """JSON o msgpack según Accept; copia las cabeceras ya fijadas en `response`."""
+    headers = {"Vary": "Accept"}
+    if response is not None:
+        headers.update({k: v for k, v in response.headers.items() if k in FORWARDED_HEADERS})
+        if "vary" in response.headers:
+            headers["Vary"] = f"{response.headers['vary']}, Accept"
+    if MSGPACK_MEDIA_TYPE in request.headers.get("accept", ""):
+        return MsgpackResponse(content, headers=headers)
+    return FastJSONResponse(content, headers=headers)
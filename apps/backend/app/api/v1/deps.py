@@ -1,8 +1,8 @@
 from fastapi import Header, HTTPException, status
 from typing import Optional
-from firebase_admin import auth
+from app.core.security import verify_id_token
 
-def get_current_uid(authorization: Optional[str] = Header(None)) -> str:
+async def get_current_uid(authorization: Optional[str] = Header(None)) -> str:
     """
     Lee 'Authorization: Bearer <id_token>' y devuelve el UID de Firebase.
     Lanza 401 si el token es inválido o falta.
@@ -15,7 +15,7 @@ def get_current_uid(authorization: Optional[str] = Header(None)) -> str:
     token = authorization.split(" ", 1)[1]
 
     try:
-        decoded = auth.verify_id_token(token)
+        decoded = await verify_id_token(token)
         return decoded["uid"]
     except Exception:
         raise HTTPException(
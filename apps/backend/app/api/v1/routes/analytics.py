@@ -0,0 +1,23 @@
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api.deps import require_admin
+from app.db import get_async_db
+from app.services.analytics import report
+
+router = APIRouter(prefix="/analytics", tags=["analytics"], dependencies=[Depends(require_admin)])
+
+
+@router.get("/{metric}")
+async def get_rollup(
+    metric: Literal["cycle_length", "period_length", "symptom"],
+    dimension: Literal["all", "pais", "ciudad", "edad"] = Query("all"),
+    key: Optional[str] = Query(None, description="Un solo valor de la dimensión (p. ej. CO o CO/Bogotá)"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Histograma precalculado de `metric` agrupado por `dimension`: se leen los
+    rollups (cubos x fragmentos), nunca los eventos.
+    """
+    return await report(db, metric, dimension, key)
@@ -1,26 +1,302 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from app.db import get_db
-from app.api.deps import get_current_user
+import base64
+import logging
+from datetime import date
+from typing import AsyncIterator, Literal, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic_core import to_json
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db import get_async_db
+from app.db.session import AsyncSessionLocal
+from app.api.conditional import not_modified
+from app.api.deps import get_current_user, get_stream_user
+from app.api.responses import negotiated
+from app.core.cache import cache
+from app.core.config import settings
+from app.core.pubsub import broker
+from app.core.throttling import deduplicator, limit_ip, limit_uid, request_key
+from app.core.tickets import stream_tickets
 from app.models.cycle import CycleEvent
-from app.schemas.cycles import CycleEventCreate
+from app.schemas.cycles import (
+    CalendarMonth, CycleEventBatch, CycleEventBatchResult, CycleEventCreate, CycleHistoryPage, CycleSyncResponse,
+)
+from app.services import derived
+from app.services.calendar_view import build_month
+from app.services.prediction import PredictionError
+from app.services.events import delete_event, insert_events, validate_events
+from app.services.timeline import timelines
+from app.services.write_behind import ensure_flushed, write_behind
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/cycle", tags=["cycle"])
 
-@router.post("/events")
-def register_event(event: CycleEventCreate, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    new_event = CycleEvent(
-        user_id=user["uid"],
-        type=event.type,
-        date=event.date,
-        meta=event.meta
+HISTORY_COLUMNS = (CycleEvent.id, CycleEvent.user_id, CycleEvent.type, CycleEvent.date, CycleEvent.meta)
+STREAM_BATCH_SIZE = 500
+SYNC_COLUMNS = (CycleEvent.id, CycleEvent.type, CycleEvent.date, CycleEvent.meta, CycleEvent.change_seq, CycleEvent.deleted_at)
+
+
+def encode_cursor(event_date: date, event_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{event_date.isoformat()}:{event_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[date, int]:
+    try:
+        raw_date, raw_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return date.fromisoformat(raw_date), int(raw_id)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor inválido")
+
+
+def encode_sync_cursor(change_seq: int) -> str:
+    return base64.urlsafe_b64encode(f"s:{change_seq}".encode()).decode()
+
+
+def decode_sync_cursor(cursor: str) -> int:
+    try:
+        prefix, raw_seq = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        if prefix != "s":
+            raise ValueError(prefix)
+        return int(raw_seq)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor inválido")
+
+
+def history_query(uid: str, before: Optional[str], since: Optional[date]):
+    """Keyset sobre (date, id) descendente; nunca usa OFFSET."""
+    stmt = select(*HISTORY_COLUMNS).where(CycleEvent.user_id == uid, CycleEvent.deleted_at.is_(None))
+    if before:
+        stmt = stmt.where(tuple_(CycleEvent.date, CycleEvent.id) < tuple_(*decode_cursor(before)))
+    if since:
+        stmt = stmt.where(CycleEvent.date >= since)
+    return stmt.order_by(CycleEvent.date.desc(), CycleEvent.id.desc())
+
+
+async def stream_history(stmt) -> AsyncIterator[bytes]:
+    """Emite NDJSON desde un cursor del lado del servidor, por lotes, sin instancias ORM."""
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for rows in result.partitions():
+            yield b"".join(
+                to_json(row._asdict()) + b"\n"
+                for row in rows
+            )
+
+
+async def _register_event(db: AsyncSession, uid: str, event: CycleEventCreate) -> dict:
+    if write_behind is not None:
+        try:
+            [key] = await write_behind.enqueue(uid, [event])
+            return {"status": "queued", "event_id": None, "idempotency_key": key}
+        except Exception as exc:
+            # Si la cola no está disponible se escribe directamente
+            logger.warning("Write-behind no disponible, insertando en línea: %s", exc)
+    [(event_id, created)] = await insert_events(db, uid, [event])
+    await db.commit()
+    if created:
+        await cache.bump(uid)
+        await derived.submit(uid, [event.date])
+    return {"status": "ok" if created else "duplicate", "event_id": event_id}
+
+@router.post("/events", dependencies=[Depends(limit_ip("events"))])
+async def register_event(
+    event: CycleEventCreate,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_current_user),
+):
+    """
+    Registra un evento. Límite por IP (antes de verificar el token) y por usuario;
+    peticiones idénticas simultáneas comparten un único INSERT. Resúmenes, analítica y
+    predicciones se actualizan después en segundo plano (app.services.derived).
+    """
+    await limit_uid("events", user["uid"])
+    result = await deduplicator.run(
+        request_key("events", user["uid"], await request.body()),
+        lambda: _register_event(db, user["uid"], event),
+    )
+    if result["status"] == "queued":
+        return JSONResponse(result, status_code=status.HTTP_202_ACCEPTED)
+    return result
+
+@router.post("/events/batch", response_model=CycleEventBatchResult, dependencies=[Depends(limit_ip("events_batch"))])
+async def register_events_batch(batch: CycleEventBatch, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user)):
+    """
+    Ingesta de la cola offline del móvil: un solo INSERT multi-fila en una transacción.
+    Los eventos con idempotency_key ya registrada se reportan como "duplicate".
+    Mismos límites por IP y por usuario que POST /events.
+    """
+    await limit_uid("events_batch", user["uid"])
+    valid, errors = validate_events(batch.events)
+    items = [{"index": index, "status": "error", "errors": errs} for index, errs in errors.items()]
+
+    if valid:
+        results = await insert_events(db, user["uid"], list(valid.values()))
+        await db.commit()
+        fresh = [event.date for event, (_, created) in zip(valid.values(), results) if created]
+        if fresh:
+            await cache.bump(user["uid"])
+            await derived.submit(user["uid"], fresh)
+        for index, (event_id, created) in zip(valid, results):
+            items.append({"index": index, "status": "created" if created else "duplicate", "event_id": event_id})
+
+    items.sort(key=lambda item: item["index"])
+    return {
+        "created": sum(item["status"] == "created" for item in items),
+        "duplicates": sum(item["status"] == "duplicate" for item in items),
+        "errors": len(errors),
+        "items": items,
+    }
+
+@router.delete("/events/{event_id}")
+async def remove_event(event_id: int, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user)):
+    """Borrado lógico: el tombstone se propaga a los demás dispositivos por /cycle/sync."""
+    await ensure_flushed(user["uid"])
+    deleted = await delete_event(db, user["uid"], event_id)
+    if deleted is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Evento no encontrado")
+    await db.commit()
+    await cache.bump(user["uid"])
+    await derived.submit(user["uid"], [deleted[1]])
+    return {"status": "deleted", "event_id": event_id}
+
+@router.post("/live/ticket")
+async def live_ticket(user=Depends(get_current_user)):
+    """Ticket de un solo uso para abrir /cycle/live?ticket= con EventSource."""
+    return {"ticket": stream_tickets.issue(user["uid"]), "expires_in": settings.STREAM_TICKET_TTL}
+
+@router.get("/live")
+async def live_updates(user=Depends(get_stream_user)):
+    """
+    Server-Sent Events: tras cada escritura propia (en cualquier dispositivo) llega un
+    `update` con la predicción y los días del calendario que cambiaron. Acepta
+    Authorization o, para EventSource (que no envía cabeceras), ?ticket= de
+    POST /cycle/live/ticket; cada ticket abre una sola conexión, así que para
+    reconectar el cliente pide otro.
+    """
+    return StreamingResponse(
+        broker.stream(user["uid"]),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    db.add(new_event)
-    db.commit()
-    db.refresh(new_event)
-    return {"status": "ok", "event_id": new_event.id}
-
-@router.get("/history")
-def get_cycle_history(db: Session = Depends(get_db), user=Depends(get_current_user)):
-    events = db.query(CycleEvent).filter_by(user_id=user["uid"]).order_by(CycleEvent.date.desc()).all()
-    return events
+
+@router.get("/sync", response_model=CycleSyncResponse)
+async def sync_events(
+    request: Request,
+    cursor: Optional[str] = Query(None, description="Cursor devuelto por la última sincronización"),
+    limit: int = Query(1000, ge=1, le=5000),
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_current_user),
+):
+    """
+    Sincronización incremental para clientes offline-first.
+    Devuelve los eventos creados o modificados y los ids borrados desde `cursor`,
+    en orden de change_seq. Sin cursor devuelve todo desde el principio.
+    Si `more` es true hay que volver a llamar con el nuevo cursor.
+    """
+    after = decode_sync_cursor(cursor) if cursor else 0
+    await ensure_flushed(user["uid"])
+
+    async def load_changes():
+        rows = (await db.execute(
+            select(*SYNC_COLUMNS)
+            .where(CycleEvent.user_id == user["uid"], CycleEvent.change_seq > after)
+            .order_by(CycleEvent.change_seq)
+            .limit(limit + 1)
+        )).all()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            "cursor": encode_sync_cursor(rows[-1].change_seq) if rows else cursor,
+            "more": more,
+            "events": [
+                {"id": row.id, "type": row.type, "date": row.date, "meta": row.meta}
+                for row in rows if row.deleted_at is None
+            ],
+            "deleted": [row.id for row in rows if row.deleted_at is not None],
+        }
+
+    return negotiated(request, await cache.get_or_set(user["uid"], "sync", f"{after}:{limit}", load_changes))
+
+@router.get("/history", response_model=CycleHistoryPage)
+async def get_cycle_history(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Tamaño de página (100 por defecto en JSON)"),
+    before: Optional[str] = Query(None, description="Cursor `next_cursor` de la página anterior"),
+    since: Optional[date] = Query(None, description="Solo eventos con fecha >= since"),
+    format: Literal["json", "ndjson"] = Query("json"),
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_current_user),
+):
+    """
+    Historial paginado por cursor (más reciente primero).
+    Con format=ndjson se transmite el historial completo fila a fila.
+    """
+    await ensure_flushed(user["uid"])
+
+    if format == "ndjson":
+        stmt = history_query(user["uid"], before, since)
+        if limit:
+            stmt = stmt.limit(limit)
+        return StreamingResponse(stream_history(stmt), media_type="application/x-ndjson")
+
+    cursor = decode_cursor(before) if before else None
+    page_size = limit or 100
+    params = f"{page_size}:{before}:{since}"
+    if (unchanged := await not_modified(request, response, user["uid"], "history", params)) is not None:
+        return unchanged
+
+    async def load_page():
+        timeline = await timelines.resident(db, user["uid"])
+        if timeline is None:
+            # Timeline fría o que no cabe en caché: keyset acotado a la página
+            rows = (await db.execute(history_query(user["uid"], before, since).limit(page_size + 1))).all()
+            next_cursor = None
+            if len(rows) > page_size:
+                rows = rows[:page_size]
+                next_cursor = encode_cursor(rows[-1].date, rows[-1].id)
+            return {"events": [row._asdict() for row in rows], "next_cursor": next_cursor}
+
+        # Misma página que el keyset de history_query, resuelta con búsqueda binaria en la timeline
+        lo, hi = timeline.span(since)
+        if cursor:
+            hi = max(lo, min(hi, timeline.position(*cursor)))
+        indexes = range(hi - 1, max(lo, hi - page_size) - 1, -1)
+        next_cursor = None
+        if hi - lo > page_size:
+            next_cursor = encode_cursor(date.fromordinal(timeline.ordinals[indexes[-1]]), timeline.ids[indexes[-1]])
+        return {"events": timeline.events(indexes), "next_cursor": next_cursor}
+
+    return negotiated(request, await cache.get_or_set(user["uid"], "history", params, load_page), response)
+
+@router.get("/calendar", response_model=CalendarMonth)
+async def get_calendar(
+    request: Request,
+    response: Response,
+    month: Optional[str] = Query(None, pattern=r"^\d{4}-(0[1-9]|1[0-2])$", description="YYYY-MM (mes actual por defecto)"),
+    model: str = Query("default"),
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_current_user),
+):
+    """
+    Estado de cada día del mes como máscara de bits (ver `flags`):
+    1 periodo, 2 periodo previsto, 4 ventana fértil, 8 síntomas registrados.
+    """
+    year, month_number = map(int, (month or date.today().strftime("%Y-%m")).split("-"))
+    await ensure_flushed(user["uid"])
+    params = f"{year:04d}-{month_number:02d}:{model}"
+    if (unchanged := await not_modified(request, response, user["uid"], "calendar", params)) is not None:
+        return unchanged
+
+    async def load_month():
+        result = await build_month(db, user["uid"], year, month_number, model)
+        await db.commit()  # load_prediction puede guardar una predicción recalculada
+        return result
+
+    try:
+        return negotiated(request, await cache.get_or_set(user["uid"], "calendar", params, load_month), response)
+    except PredictionError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
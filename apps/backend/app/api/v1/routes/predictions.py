@@ -1,14 +1,48 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api.conditional import not_modified
 from app.api.deps import get_current_user
+from app.api.responses import negotiated
+from app.core.cache import cache
+from app.db import get_async_db
 from app.schemas.predict import PredictRequest, PredictResponse
+from app.services.prediction import PredictionError, load_prediction
+from app.services.write_behind import ensure_flushed
 
 router = APIRouter(prefix="/predict", tags=["predict"])
 
+
+async def _prediction(db: AsyncSession, uid: str, model: str) -> dict:
+    async def load():
+        result = await load_prediction(db, uid, model)
+        await db.commit()
+        return result
+
+    try:
+        return await cache.get_or_set(uid, "predict", model, load)
+    except PredictionError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
 @router.post("/", response_model=PredictResponse)
-def make_prediction(data: PredictRequest, user=Depends(get_current_user)):
-    # Aquí conectarás tu modelo más adelante
-    return {
-        "next_period_start": "2025-11-18",
-        "confidence_days": 3,
-        "fertile_window": ["2025-11-03", "2025-11-04"]
-    }
+async def make_prediction(
+    data: PredictRequest,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_current_user),
+):
+    await ensure_flushed(user["uid"])
+    return negotiated(request, await _prediction(db, user["uid"], data.model))
+
+@router.get("/", response_model=PredictResponse)
+async def get_prediction(
+    request: Request,
+    response: Response,
+    model: str = Query("default"),
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_current_user),
+):
+    """Igual que POST, pero admite If-None-Match: 304 si no hubo cambios desde el último ETag."""
+    await ensure_flushed(user["uid"])
+    if (unchanged := await not_modified(request, response, user["uid"], "predict", model)) is not None:
+        return unchanged
+    return negotiated(request, await _prediction(db, user["uid"], model), response)
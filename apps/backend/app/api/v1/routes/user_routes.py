@@ -1,89 +1,136 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, status
-from sqlalchemy.orm import Session
-from app.db.session import get_db
+from typing import Literal
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import get_async_db
 from app.models.user import User
 from app.schemas.users import UserCreate, UserOut
+from app.api.conditional import not_modified
+from app.api.responses import negotiated
 from app.api.v1.deps import get_current_uid
-from firebase_admin import auth as firebase_auth
+from app.core.cache import cache
+from app.core.throttling import deduplicator, limit_ip, limit_uid, request_key
+from app.services.derived import ensure_derived
+from app.services.export import FILENAMES, MEDIA_TYPES, stream_export
+from app.services.users import submit_profile_changes, sync_user, user_row
+from app.services.write_behind import ensure_flushed
 
 router = APIRouter()
 
 @router.get("/me")
-def get_current_user(authorization: str = Header(None), db: Session = Depends(get_db)):
+async def get_current_user(
+    request: Request,
+    response: Response,
+    firebase_uid: str = Depends(get_current_uid),
+    db: AsyncSession = Depends(get_async_db),
+):
     """
     Devuelve el usuario actual autenticado por Firebase.
+    Con If-None-Match y sin cambios responde 304 sin consultar la base de datos.
     """
-    if not authorization:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing Authorization header")
+    if (unchanged := await not_modified(request, response, firebase_uid, "me")) is not None:
+        return unchanged
 
-    try:
-        token = authorization.split("Bearer ")[1]
-        decoded_token = firebase_auth.verify_id_token(token)
-        firebase_uid = decoded_token["uid"]
-    except Exception as e:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"Invalid or expired Firebase ID token: {e}")
+    async def load_user():
+        result = await db.execute(select(User).where(User.firebase_uid == firebase_uid))
+        user = result.scalars().first()
+        if not user:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found in database")
 
-    user = db.query(User).filter(User.firebase_uid == firebase_uid).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found in database")
+        return {
+            "message": "Authenticated",
+            "user": {
+                "id": user.id,
+                "firebase_uid": user.firebase_uid,
+                "nombre": user.nombre,
+                "correo": user.correo,
+            },
+        }
 
-    return {
-        "message": "Authenticated",
-        "user": {
-            "id": user.id,
-            "firebase_uid": user.firebase_uid,
-            "nombre": user.nombre,
-            "correo": user.correo,
+    return negotiated(request, await cache.get_or_set(firebase_uid, "me", "", load_user), response)
+
+@router.get("/me/export", dependencies=[Depends(limit_ip("export"))])
+async def export_current_user(
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    firebase_uid: str = Depends(get_current_uid),
+):
+    """
+    Exporta todos los datos del usuario (perfil, eventos y resúmenes).
+    ndjson -> .ndjson.gz; csv -> .zip con un CSV por tabla. Se transmite por lotes.
+    """
+    await limit_uid("export", firebase_uid)
+    await ensure_flushed(firebase_uid)
+    await ensure_derived(firebase_uid)  # cycle_summaries al día
+    return StreamingResponse(
+        stream_export([firebase_uid], format),
+        media_type=MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{FILENAMES[format]}"',
+            # Ya va comprimido: así GZipMiddleware no lo vuelve a comprimir
+            "Content-Encoding": "identity",
+            "Cache-Control": "no-store",
         },
-    }
+    )
 
-@router.post("/register")
-def register_user(payload: UserCreate, db: Session = Depends(get_db)):
+@router.post("/register", dependencies=[Depends(limit_ip("register"))])
+async def register_user(
+    payload: UserCreate,
+    request: Request,
+    firebase_uid: str = Depends(get_current_uid),
+    db: AsyncSession = Depends(get_async_db),
+):
     """
     Guarda en PostgreSQL los datos de un usuario ya creado en Firebase.
-    No crea usuarios en Firebase, solo los sincroniza.
+    No crea usuarios en Firebase, solo los sincroniza. Requiere el idToken del
+    propio usuario: nadie puede sobrescribir el perfil de otro UID.
+    Limitado por IP y por firebase_uid; registros idénticos simultáneos se resuelven una sola vez.
     """
-
-    # 1️⃣ Verificar si ya existe en la base de datos
-    existing_user = db.query(User).filter(User.correo == payload.correo).first()
-    if existing_user:
+    if payload.firebase_uid != firebase_uid:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="El correo ya está registrado en la base de datos."
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="El firebase_uid no corresponde al token",
         )
+    await limit_uid("register", firebase_uid)
+    return await deduplicator.run(
+        request_key("register", firebase_uid, await request.body()),
+        lambda: _register_user(db, payload),
+    )
 
-    # 2️⃣ Crear usuario en PostgreSQL
+async def _register_user(db: AsyncSession, payload: UserCreate) -> dict:
+    # 1️⃣ Crear o sincronizar en una sola sentencia (INSERT ... ON CONFLICT DO UPDATE)
     try:
-        db_user = User(
-            firebase_uid=payload.firebase_uid,
-            nombre=payload.nombre,
-            correo=payload.correo,
-            ciudad=payload.ciudad,
-            pais=payload.pais,
-            direccion=payload.direccion,
-            edad=payload.edad,
+        db_user = await sync_user(db, payload.firebase_uid, payload.model_dump())
+        await db.commit()
+    except IntegrityError:
+        # El único conflicto posible aquí es el correo de otra cuenta
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El correo ya está registrado en la base de datos."
         )
-        db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
-
-        return {
-            "message": "Usuario guardado correctamente en PostgreSQL",
-            "user": {
-                "id": db_user.id,
-                "firebase_uid": db_user.firebase_uid,
-                "correo": db_user.correo,
-                "nombre": db_user.nombre
-            }
-        }
-
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error al guardar usuario en la base de datos: {str(e)}"
         )
 
+    # 2️⃣ Invalidar la caché del usuario y mover sus rollups si cambió de perfil
+    await cache.bump(db_user.firebase_uid)
+    await submit_profile_changes([user_row(payload.firebase_uid, payload.model_dump())])
+
+    return {
+        "message": "Usuario guardado correctamente en PostgreSQL",
+        "user": {
+            "id": db_user.id,
+            "firebase_uid": db_user.firebase_uid,
+            "correo": db_user.correo,
+            "nombre": db_user.nombre
+        }
+    }
+
 @router.get("/ping")
-def ping():
+async def ping():
     return {"message": "pong"}
@@ -0,0 +1,226 @@
+# apps/backend/app/core/cache.py
+"""
+Caché de respuestas por usuario con claves versionadas.
+
+Cada usuario tiene un contador de versión en Redis (`cu:ver:<uid>`); las
+entradas se guardan bajo `cu:c:<uid>:<versión>:<nombre>:<params>`. Las rutas de
+escritura llaman a `bump(uid)` después del commit, así que una entrada antigua
+deja de ser alcanzable sin tener que borrarla. Encima de Redis hay una LRU en
+proceso que evita traer y decodificar el payload cuando la versión no cambió;
+si Redis no responde, la LRU local sirve también como almacén de versiones.
+Una versión local no ve los bump de otros workers, así que lo cacheado con
+ella va a una caché aparte que solo dura `local_ttl` segundos (CACHE_LOCAL_TTL).
+
+Las versiones nunca retroceden. Un contador que no existe (caducado, desalojado
+o tras un FLUSH) se crea con la hora actual en microsegundos, por encima de
+cualquier versión anterior, y no en 0, así que no reaparecen entradas viejas de
+la LRU. Un bump que no llega a Redis deja al usuario marcado y se repite en
+cuanto Redis vuelve a responder, antes de leer ninguna versión.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from cachetools import LRUCache, TTLCache
+from pydantic_core import to_json
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "cu"
+VERSION_TTL = 30 * 24 * 3600  # mayor que CACHE_TTL: una versión nunca caduca antes que sus entradas
+
+
+def dumps(value: Any) -> bytes:
+    return to_json(value)
+
+
+def _now_us() -> int:
+    return time.time_ns() // 1000
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        redis: Optional[Any] = None,
+        ttl: int = 3600,
+        local_maxsize: int = 10_000,
+        retry_after: float = 5.0,
+        local_ttl: float = 5.0,
+    ):
+        self.redis = redis
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self._local: TTLCache = TTLCache(maxsize=local_maxsize, ttl=ttl)
+        self._local_only: TTLCache = TTLCache(maxsize=local_maxsize, ttl=local_ttl)  # versiones locales
+        self._local_versions: LRUCache = LRUCache(maxsize=local_maxsize)
+        self._dirty: set = set()  # bumps pendientes de llegar a Redis
+        self._lock = threading.Lock()
+        self._redis_down_until = 0.0
+        self.hits = 0
+        self.local_hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    # --- Redis con "circuit breaker" ---
+
+    def _redis_available(self) -> bool:
+        return self.redis is not None and time.monotonic() >= self._redis_down_until
+
+    def _redis_failed(self, exc: Exception) -> None:
+        self.errors += 1
+        self._redis_down_until = time.monotonic() + self.retry_after
+        logger.warning("Redis no disponible, usando caché local: %s", exc)
+
+    # --- Versiones ---
+
+    async def version(self, uid: str) -> str:
+        """Versión actual; las locales llevan otro prefijo para no chocar con las de Redis."""
+        if self._redis_available():
+            try:
+                if self._dirty:
+                    await self._retry_bumps()
+                key = f"{PREFIX}:ver:{uid}"
+                value = await self.redis.get(key)
+                if value is None:
+                    async with self.redis.pipeline(transaction=False) as pipe:
+                        pipe.set(key, _now_us(), nx=True, ex=VERSION_TTL)
+                        pipe.get(key)
+                        _, value = await pipe.execute()
+                return f"r{int(value)}"
+            except Exception as exc:
+                self._redis_failed(exc)
+        with self._lock:
+            return f"l{self._local_versions.get(uid, 0)}"
+
+    async def bump(self, uid: str) -> None:
+        """Invalida todo lo cacheado del usuario; llamar después del commit."""
+        with self._lock:
+            self._local_versions[uid] = self._local_versions.get(uid, 0) + 1
+        if self._redis_available():
+            try:
+                await self._bump_redis([uid])
+                return
+            except Exception as exc:
+                self._redis_failed(exc)
+        with self._lock:
+            self._dirty.add(uid)
+
+    async def _bump_redis(self, uids) -> None:
+        # Sin contador se parte de la hora actual (SET NX): nunca se vuelve a una versión usada
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for uid in uids:
+                key = f"{PREFIX}:ver:{uid}"
+                pipe.set(key, _now_us(), nx=True, ex=VERSION_TTL)
+                pipe.incr(key)
+                pipe.expire(key, VERSION_TTL)
+            await pipe.execute()
+
+    async def _retry_bumps(self) -> None:
+        with self._lock:
+            uids = sorted(self._dirty)
+        await self._bump_redis(uids)
+        with self._lock:
+            self._dirty.difference_update(uids)
+
+    async def etag(self, uid: str, name: str, params: str) -> Optional[str]:
+        """
+        ETag débil derivado de la versión del usuario. Solo con versiones de Redis:
+        las locales no ven los bump de otros procesos y darían 304 con datos viejos.
+        El UID entra en el resumen: dos usuarios con la misma versión no comparten ETag.
+        """
+        version = await self.version(uid)
+        if not version.startswith("r"):
+            return None
+        digest = hashlib.sha1(f"{uid}:{name}:{params}".encode()).hexdigest()[:12]
+        return f'W/"{version}.{digest}"'
+
+    # --- Lectura a través de la caché ---
+
+    async def get_or_set(
+        self,
+        uid: str,
+        name: str,
+        params: str,
+        loader: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """Devuelve el valor cacheado o ejecuta `loader` y lo guarda (JSON)."""
+        version = await self.version(uid)
+        key = f"{PREFIX}:c:{uid}:{version}:{name}:{params}"
+        local = self._local if version.startswith("r") else self._local_only
+
+        with self._lock:
+            value = local.get(key)
+        if value is not None:
+            self.hits += 1
+            self.local_hits += 1
+            return value
+
+        if self._redis_available():
+            try:
+                raw = await self.redis.get(key)
+                if raw is not None:
+                    value = json.loads(raw)
+                    with self._lock:
+                        self._local[key] = value
+                    self.hits += 1
+                    return value
+            except Exception as exc:
+                self._redis_failed(exc)
+
+        self.misses += 1
+        value = await loader()
+        with self._lock:
+            local[key] = value
+        if self._redis_available():
+            try:
+                await self.redis.set(key, dumps(value), ex=self.ttl)
+            except Exception as exc:
+                self._redis_failed(exc)
+        return value
+
+    def clear(self) -> None:
+        """Vacía las cachés en proceso (no toca Redis)."""
+        with self._lock:
+            self._local.clear()
+            self._local_only.clear()
+
+    async def close(self) -> None:
+        if self.redis is not None:
+            await self.redis.aclose()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "local_hits": self.local_hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "pending_bumps": len(self._dirty),
+            "redis": self._redis_available(),
+        }
+
+
+def _redis_client() -> Optional[Any]:
+    if not settings.CACHE_REDIS_ENABLED:
+        return None
+    import redis.asyncio as aioredis
+
+    return aioredis.from_url(
+        settings.REDIS_URL,
+        socket_timeout=settings.REDIS_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_TIMEOUT,
+    )
+
+
+cache = ResponseCache(
+    redis=_redis_client(),
+    ttl=settings.CACHE_TTL,
+    local_maxsize=settings.CACHE_LOCAL_SIZE,
+    local_ttl=settings.CACHE_LOCAL_TTL,
+)
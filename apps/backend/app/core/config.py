@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic_settings import BaseSettings
 
 
@@ -7,16 +9,73 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str
     POSTGRES_DB: str
     POSTGRES_URL: str
+    POSTGRES_ASYNC_URL: Optional[str] = None  # por defecto se deriva de POSTGRES_URL
+
+    # Pool de conexiones (aplica al engine síncrono y al asíncrono)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800  # segundos; evita conexiones cortadas por el proxy
+    DB_POOL_PRE_PING: bool = True
 
     # Redis
     REDIS_URL: str = "redis://localhost:6379/0"
+    REDIS_TIMEOUT: float = 0.25  # segundos; si Redis tarda más se usa la caché local
+
+    # Caché de respuestas por usuario
+    CACHE_REDIS_ENABLED: bool = True
+    CACHE_TTL: int = 3600
+    CACHE_LOCAL_SIZE: int = 10_000
+    CACHE_LOCAL_TTL: float = 5.0  # segundos que vive lo cacheado sin Redis (otros workers no lo invalidan)
+    TIMELINE_CACHE_MB: int = 64  # timelines compactas por usuario en memoria (0 = desactivado)
+
+    # Write-behind de POST /cycle/events: "off", "redis" o "file" (sustituto local)
+    WRITE_BEHIND: str = "off"
+    WRITE_BEHIND_DIR: str = "write_behind"
+    WRITE_BEHIND_BATCH_USERS: int = 200  # usuarios por transacción de volcado
+    WRITE_BEHIND_FLUSH_INTERVAL: float = 0.5  # segundos que un evento puede esperar
+    WRITE_BEHIND_LEASE: float = 30.0  # segundos tras los que un volcado de un proceso caído se reintenta
+
+    # Actualizaciones en vivo por SSE (Redis pub/sub, en proceso si no está)
+    LIVE_REDIS_ENABLED: bool = True
+    LIVE_QUEUE_SIZE: int = 16  # mensajes pendientes por conexión; se descartan los más antiguos
+    LIVE_HEARTBEAT: float = 25.0  # segundos entre latidos a las conexiones inactivas
+    STREAM_TICKET_TTL: int = 30  # segundos para abrir /cycle/live con un ticket de un solo uso
+
+    # Cola de trabajos derivados: "memory" (sustituto local), "redis" u "off" (en la petición)
+    JOBS: str = "memory"
+    JOBS_WORKERS: int = 2  # trabajadores en el proceso de la API (0 = solo python -m app.services.jobs worker)
+    JOBS_COALESCE_DELAY: float = 0.25  # segundos que un trabajo espera a fusionarse con los siguientes
+    JOBS_MAX_ATTEMPTS: int = 5
+    JOBS_RETRY_DELAY: float = 1.0  # espera del primer reintento; se duplica en cada uno
+    JOBS_LEASE: float = 60.0  # segundos tras los que un trabajo de un worker caído vuelve a la cola
+
+    # Límite de peticiones (ventana deslizante en Redis, en memoria si no está)
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_REDIS_ENABLED: bool = True
+    RATE_LIMIT_PER_UID: str = "60/60"  # peticiones/segundos por usuario y ruta
+    RATE_LIMIT_PER_IP: str = "300/60"
+    TRUSTED_PROXIES: str = ""  # IPs o redes (CIDR) de los proxies delante de la API, separadas por comas
+    DEDUP_TTL: float = 10.0  # segundos que una petición idéntica espera a la líder
+
+    # Analítica de población (rollups en analytics_rollups)
+    ANALYTICS_SHARDS: int = 16  # fragmentos por contador; reparte los bloqueos de escritura
+    ANALYTICS_CACHE_TTL: int = 60  # segundos que se reutiliza un informe leído
 
     # App
     SECRET_KEY: str
+    ADMIN_UIDS: str = ""  # firebase_uid separados por comas con acceso a /analytics
+
+    # Observabilidad
+    SERVER_TIMING: bool = False  # cabecera Server-Timing en cada respuesta
+    PROFILE_SLOWEST_N: int = 0  # >0 activa cProfile muestreado de las peticiones más lentas
+    PROFILE_SAMPLE_RATE: float = 0.01
+    PROFILE_DIR: str = "profiles"
 
     # Firebase
     FIREBASE_PROJECT_ID: str
     FIREBASE_CREDENTIALS: str  # corregido el nombre para que coincida con .env
+    TOKEN_CACHE_SIZE: int = 10_000  # claims de ID tokens verificados en memoria
 
     class Config:
         env_file = ".env"
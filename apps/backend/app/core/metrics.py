@@ -0,0 +1,187 @@
+# apps/backend/app/core/metrics.py
+"""
+Instrumentación por petición.
+
+`MetricsMiddleware` (ASGI puro, sin BaseHTTPMiddleware) abre un RequestStats en
+un ContextVar; los hooks de SQLAlchemy y el verificador de tokens suman ahí sus
+tiempos. Al terminar, los totales se agregan por ruta en `registry`, que se
+expone en formato Prometheus en /metrics. Las métricas son por proceso.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats:
+    __slots__ = ("db_queries", "db_time", "auth_time")
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.auth_time = 0.0
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+def record_auth(elapsed: float) -> None:
+    stats = current_request.get()
+    if stats is not None:
+        stats.auth_time += elapsed
+
+
+# --- Hooks de SQLAlchemy ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = current_request.get()
+    if stats is not None:
+        stats.db_queries += 1
+        stats.db_time += elapsed
+
+
+def install_db_hooks(sync_engine) -> None:
+    """Cuenta consultas y tiempo de BD; para un AsyncEngine pasar `.sync_engine`."""
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# --- Agregación por ruta ---
+
+class RouteMetrics:
+    __slots__ = ("statuses", "buckets", "duration_sum", "count", "db_queries", "db_time", "auth_time", "response_bytes")
+
+    def __init__(self):
+        self.statuses: Dict[int, int] = {}
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.duration_sum = 0.0
+        self.count = 0
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.auth_time = 0.0
+        self.response_bytes = 0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._routes: Dict[Tuple[str, str], RouteMetrics] = {}
+        self._lock = threading.Lock()
+        # Fuentes extra (p. ej. token_verifier.stats) registradas como gauges
+        self._collectors: Dict[str, Callable[[], dict]] = {}
+
+    def observe(self, method: str, route: str, status: int, duration: float, stats: RequestStats, size: int) -> None:
+        with self._lock:
+            metrics = self._routes.get((method, route))
+            if metrics is None:
+                metrics = self._routes[(method, route)] = RouteMetrics()
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+            index = bisect_left(DURATION_BUCKETS, duration)
+            if index < len(metrics.buckets):
+                metrics.buckets[index] += 1
+            metrics.duration_sum += duration
+            metrics.count += 1
+            metrics.db_queries += stats.db_queries
+            metrics.db_time += stats.db_time
+            metrics.auth_time += stats.auth_time
+            metrics.response_bytes += size
+
+    def register_collector(self, prefix: str, collect: Callable[[], dict]) -> None:
+        self._collectors[prefix] = collect
+
+    def render(self) -> str:
+        """Texto de exposición Prometheus (0.0.4)."""
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines: List[str] = ["# TYPE http_requests_total counter"]
+            for (method, route), m in routes:
+                for status, n in sorted(m.statuses.items()):
+                    lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {n}')
+
+            lines.append("# TYPE http_request_duration_seconds histogram")
+            for (method, route), m in routes:
+                labels = f'method="{method}",route="{route}"'
+                cumulative = 0
+                for bound, n in zip(DURATION_BUCKETS, m.buckets):
+                    cumulative += n
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {m.count}')
+                lines.append(f"http_request_duration_seconds_sum{{{labels}}} {m.duration_sum:.6f}")
+                lines.append(f"http_request_duration_seconds_count{{{labels}}} {m.count}")
+
+            for name, attr in (
+                ("http_db_queries_total", "db_queries"),
+                ("http_db_duration_seconds_total", "db_time"),
+                ("http_auth_duration_seconds_total", "auth_time"),
+                ("http_response_bytes_total", "response_bytes"),
+            ):
+                lines.append(f"# TYPE {name} counter")
+                for (method, route), m in routes:
+                    lines.append(f'{name}{{method="{method}",route="{route}"}} {getattr(m, attr)}')
+
+        for prefix, collect in self._collectors.items():
+            for key, value in collect().items():
+                if isinstance(value, (bool, int, float)):
+                    lines.append(f"# TYPE {prefix}_{key} gauge")
+                    lines.append(f"{prefix}_{key} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+# --- Middleware ASGI ---
+
+class MetricsMiddleware:
+    def __init__(self, app, server_timing: bool = False, profiler=None):
+        self.app = app
+        self.server_timing = server_timing
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        status_code = 500
+        size = 0
+        profile = self.profiler.start() if self.profiler else None
+
+        async def send_wrapper(message):
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if self.server_timing:
+                    elapsed = time.perf_counter() - start
+                    value = (
+                        f"app;dur={elapsed * 1000:.2f}, db;dur={stats.db_time * 1000:.2f};desc=\"{stats.db_queries} queries\", "
+                        f"auth;dur={stats.auth_time * 1000:.2f}"
+                    )
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", value.encode())]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            registry.observe(scope["method"], route_path, status_code, duration, stats, size)
+            if profile is not None:
+                self.profiler.stop(profile, duration, f"{scope['method']} {route_path}")
+            current_request.reset(token)
@@ -0,0 +1,51 @@
+# apps/backend/app/core/profiling.py
+"""
+Perfilado opcional de las peticiones más lentas.
+
+Se activa con PROFILE_SLOWEST_N > 0. Una fracción PROFILE_SAMPLE_RATE de las
+peticiones se ejecuta bajo cProfile (una a la vez por proceso) y solo se
+conservan en PROFILE_DIR los .prof de las N más lentas. Se abren con snakeviz o
+se convierten a flamegraph con flameprof. Ojo: cProfile mide el hilo del event
+loop completo, así que incluye corrutinas de otras peticiones concurrentes.
+"""
+import cProfile
+import heapq
+import os
+import random
+import re
+import time
+from typing import List, Optional, Tuple
+
+
+class SlowRequestProfiler:
+    def __init__(self, directory: str, keep: int = 10, sample_rate: float = 0.01):
+        self.directory = directory
+        self.keep = keep
+        self.sample_rate = sample_rate
+        self._busy = False
+        self._slowest: List[Tuple[float, str]] = []  # min-heap (duración, ruta del .prof)
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self) -> Optional[cProfile.Profile]:
+        if self._busy or random.random() >= self.sample_rate:
+            return None
+        self._busy = True
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def stop(self, profile: cProfile.Profile, duration: float, label: str) -> None:
+        profile.disable()
+        self._busy = False
+        if len(self._slowest) >= self.keep and duration <= self._slowest[0][0]:
+            return
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", label).strip("_")
+        path = os.path.join(self.directory, f"{duration * 1000:08.1f}ms-{slug}-{time.time_ns()}.prof")
+        profile.dump_stats(path)
+        heapq.heappush(self._slowest, (duration, path))
+        if len(self._slowest) > self.keep:
+            _, evicted = heapq.heappop(self._slowest)
+            try:
+                os.remove(evicted)
+            except OSError:
+                pass
@@ -0,0 +1,221 @@
+# apps/backend/app/core/pubsub.py
+"""
+Difusión de mensajes por usuario a las conexiones abiertas (SSE).
+
+Cada worker mantiene un único reparto en asyncio: un dict uid -> colas de los
+suscriptores locales. Entre workers y nodos los mensajes viajan por Redis
+pub/sub en un canal por usuario (`cu:live:<uid>`), con una sola conexión de
+pub/sub por worker que se suscribe al canal de un usuario mientras tenga alguna
+conexión abierta en ese worker. Si Redis no responde, el mismo reparto sirve
+como broker en proceso (solo llegan los mensajes publicados en este worker).
+
+Un suscriptor inactivo solo cuesta su cola y su generador: no hay temporizador
+por conexión, el latido (comentario SSE) lo reparte una sola tarea para todos.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "cu:live"
+PING = b": ping\n\n"
+
+
+class Subscription:
+    __slots__ = ("uid", "queue")
+
+    def __init__(self, uid: str, size: int):
+        self.uid = uid
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=size)
+
+    def offer(self, message: bytes) -> None:
+        """Entrega sin bloquear; un cliente lento pierde el mensaje más antiguo."""
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+
+class Broker:
+    def __init__(
+        self,
+        redis: Optional[Any] = None,
+        queue_size: int = 16,
+        heartbeat: float = 25.0,
+        retry_after: float = 5.0,
+    ):
+        self.redis = redis
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.retry_after = retry_after
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._pubsub: Optional[Any] = None
+        self._tasks: list = []
+        self._redis_down_until = 0.0
+        self.published = 0
+        self.delivered = 0
+        self.errors = 0
+
+    # --- Redis con "circuit breaker" ---
+
+    def _redis_available(self) -> bool:
+        return self.redis is not None and time.monotonic() >= self._redis_down_until
+
+    def _redis_failed(self, exc: Exception) -> None:
+        self.errors += 1
+        self._redis_down_until = time.monotonic() + self.retry_after
+        logger.warning("Redis no disponible, difundiendo solo en este proceso: %s", exc)
+
+    def _channel(self, uid: str) -> str:
+        return f"{PREFIX}:{uid}"
+
+    # --- Suscriptores locales ---
+
+    async def subscribe(self, uid: str) -> Subscription:
+        subscription = Subscription(uid, self.queue_size)
+        subscribers = self._subscribers.setdefault(uid, set())
+        subscribers.add(subscription)
+        if len(subscribers) == 1 and self._pubsub is not None:
+            try:
+                await self._pubsub.subscribe(self._channel(uid))
+            except Exception as exc:
+                self._redis_failed(exc)
+        return subscription
+
+    async def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._subscribers.get(subscription.uid)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.uid]
+            if self._pubsub is not None:
+                try:
+                    await self._pubsub.unsubscribe(self._channel(subscription.uid))
+                except Exception as exc:
+                    self._redis_failed(exc)
+
+    def _deliver(self, uid: str, message: bytes) -> None:
+        for subscription in self._subscribers.get(uid, ()):
+            subscription.offer(message)
+            self.delivered += 1
+
+    async def stream(self, uid: str) -> AsyncIterator[bytes]:
+        """Mensajes del usuario (ya formateados como SSE) hasta que el cliente se desconecta."""
+        subscription = await self.subscribe(uid)
+        try:
+            yield b"retry: 5000\n\n"
+            while True:
+                yield await subscription.queue.get()
+        finally:
+            await self.unsubscribe(subscription)
+
+    # --- Publicación ---
+
+    async def has_subscribers(self, uid: str) -> bool:
+        """¿Hay alguna conexión abierta del usuario en cualquier worker?"""
+        if uid in self._subscribers:
+            return True
+        if self._redis_available():
+            try:
+                [(_, count)] = await self.redis.pubsub_numsub(self._channel(uid))
+                return count > 0
+            except Exception as exc:
+                self._redis_failed(exc)
+        return False
+
+    async def publish(self, uid: str, message: bytes) -> None:
+        self.published += 1
+        if self._redis_available() and self._pubsub is not None:
+            try:
+                await self.redis.publish(self._channel(uid), message)
+                return
+            except Exception as exc:
+                self._redis_failed(exc)
+        self._deliver(uid, message)
+
+    # --- Tareas de fondo ---
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            for subscribers in list(self._subscribers.values()):
+                for subscription in subscribers:
+                    if not subscription.queue.full():
+                        subscription.queue.put_nowait(PING)
+
+    async def _listen(self) -> None:
+        """Lee el pub/sub de Redis y reparte; tras un fallo se reconecta y resuscribe."""
+        while True:
+            if not self._redis_available():
+                await asyncio.sleep(self.retry_after)
+                continue
+            try:
+                self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                # Canal de control: la conexión queda suscrita aunque no haya usuarios
+                await self._pubsub.subscribe(f"{PREFIX}:_", *map(self._channel, list(self._subscribers)))
+                while True:
+                    message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message and message["type"] == "message":
+                        channel = message["channel"]
+                        channel = channel.decode() if isinstance(channel, bytes) else channel
+                        self._deliver(channel[len(PREFIX) + 1:], message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                self._redis_failed(exc)
+            finally:
+                pubsub, self._pubsub = self._pubsub, None
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks.append(asyncio.create_task(self._heartbeat(), name="live-heartbeat"))
+        if self.redis is not None:
+            self._tasks.append(asyncio.create_task(self._listen(), name="live-pubsub"))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        if self.redis is not None:
+            await self.redis.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._subscribers),
+            "connections": sum(len(s) for s in self._subscribers.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "errors": self.errors,
+            "redis": self._redis_available() and self._pubsub is not None,
+        }
+
+
+def _redis_client() -> Optional[Any]:
+    if not settings.LIVE_REDIS_ENABLED:
+        return None
+    import redis.asyncio as aioredis
+
+    # get_message lleva su propio timeout, así que el pub/sub inactivo no agota socket_timeout
+    return aioredis.from_url(
+        settings.REDIS_URL,
+        socket_timeout=settings.REDIS_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_TIMEOUT,
+    )
+
+
+broker = Broker(redis=_redis_client(), queue_size=settings.LIVE_QUEUE_SIZE, heartbeat=settings.LIVE_HEARTBEAT)
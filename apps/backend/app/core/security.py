@@ -0,0 +1,254 @@
+# apps/backend/app/core/security.py
+"""
+Verificación local de Firebase ID tokens.
+
+Las llaves públicas de Google se traen al arrancar la app y se refrescan en un
+hilo de fondo, así que una verificación no espera a la red. Un `kid` que no
+conocemos (Google rotó las llaves antes de nuestro refresco, o el arranque no
+pudo traerlas) fuerza un refresco, en un hilo para no bloquear el event loop y
+como mucho uno cada `cooldown` segundos. Los claims ya verificados se guardan en
+una caché TTL/LRU acotada, con clave el hash del token y caducidad limitada por
+el `exp` del propio token.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+import urllib.request
+from typing import Any, Callable, Dict, Optional
+
+import jwt
+from cachetools import TLRUCache
+from cryptography.x509 import load_pem_x509_certificate
+
+from app.core.config import settings
+from app.core.metrics import record_auth
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_CERTS_URL = (
+    "https://www.googleapis.com/robot/v1/metadata/x509/"
+    "securetoken@system.gserviceaccount.com"
+)
+ISSUER_PREFIX = "https://securetoken.google.com/"
+
+
+class TokenError(Exception):
+    """El ID token no es válido (formato, firma, audiencia o emisor)."""
+
+
+class ExpiredTokenError(TokenError):
+    """El ID token es válido pero su `exp` ya pasó."""
+
+
+class UnknownKeyError(TokenError):
+    """El `kid` del token no está entre las llaves de firma que tenemos."""
+
+    def __init__(self, kid: str):
+        super().__init__("Llave de firma desconocida")
+        self.kid = kid
+
+
+def _max_age(cache_control: Optional[str], default: int = 3600) -> int:
+    for directive in (cache_control or "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name.lower() == "max-age" and value.isdigit():
+            return int(value)
+    return default
+
+
+class SigningKeys:
+    """Llaves públicas de Google (kid -> llave RSA) refrescadas en segundo plano."""
+
+    def __init__(self, url: str = GOOGLE_CERTS_URL, retry_delay: float = 30.0, cooldown: float = 30.0):
+        self.url = url
+        self.retry_delay = retry_delay
+        self.cooldown = cooldown
+        self._keys: Dict[str, Any] = {}
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._forced_lock = threading.Lock()
+        self._forced_until = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def get(self, kid: str) -> Optional[Any]:
+        """Llave del `kid` ya en memoria; nunca va a la red."""
+        return self._keys.get(kid)
+
+    async def prime(self) -> None:
+        """Trae las llaves al arrancar, en un hilo; si falla, lo reintenta el hilo de fondo."""
+        try:
+            await asyncio.to_thread(self.refresh, False)
+        except Exception as exc:
+            logger.warning("No se pudieron traer las llaves de Firebase al arrancar: %s", exc)
+
+    def refresh_unknown(self, kid: str) -> bool:
+        """
+        Refresco forzado por un `kid` desconocido, como mucho uno cada `cooldown`
+        segundos (un token con un kid inventado no puede martillear a Google).
+        Bloquea: llamar desde un hilo. Devuelve si el kid ya se conoce.
+        """
+        with self._forced_lock:
+            if kid in self._keys:
+                return True  # otra petición ya lo trajo mientras esperábamos
+            now = time.monotonic()
+            if now < self._forced_until:
+                return False
+            self._forced_until = now + self.cooldown
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("No se pudieron refrescar las llaves de Firebase")
+                return False
+            return kid in self._keys
+
+    def fetch(self) -> tuple[Dict[str, str], int]:
+        """Descarga los certificados PEM y devuelve (certs, max_age)."""
+        with urllib.request.urlopen(self.url, timeout=10) as resp:
+            body = resp.read()
+            max_age = _max_age(resp.headers.get("Cache-Control"))
+        return json.loads(body), max_age
+
+    def refresh(self, force: bool = True) -> None:
+        with self._lock:
+            if not force and self._keys and time.time() < self._expires_at:
+                return
+            certs, max_age = self.fetch()
+            self._keys = {
+                kid: load_pem_x509_certificate(pem.encode()).public_key()
+                for kid, pem in certs.items()
+            }
+            self._expires_at = time.time() + max_age
+
+    def start(self) -> None:
+        """Lanza el hilo que mantiene las llaves al día (idempotente)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="firebase-signing-keys", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        force = False  # si prime() ya las trajo, la primera vuelta no repite la descarga
+        while not self._stop.is_set():
+            try:
+                self.refresh(force=force)
+                # Refrescar al 80% de la vida útil para no servir nunca llaves caducadas.
+                delay = max(self.retry_delay, (self._expires_at - time.time()) * 0.8)
+            except Exception:
+                logger.exception("No se pudieron refrescar las llaves de Firebase")
+                delay = self.retry_delay
+            force = True
+            self._stop.wait(delay)
+
+
+class TokenVerifier:
+    """Verifica ID tokens de Firebase y cachea los claims hasta su `exp`."""
+
+    def __init__(
+        self,
+        project_id: str,
+        keys: Optional[SigningKeys] = None,
+        maxsize: int = 10_000,
+        leeway: int = 0,
+        timer: Callable[[], float] = time.time,
+    ):
+        self.project_id = project_id
+        self.issuer = ISSUER_PREFIX + project_id
+        self.keys = keys or SigningKeys()
+        self.leeway = leeway
+        self._timer = timer
+        self._cache: TLRUCache = TLRUCache(maxsize=maxsize, ttu=self._until_exp, timer=timer)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _until_exp(_key: bytes, claims: dict, _now: float) -> float:
+        return claims["exp"]
+
+    async def verify_async(self, id_token: str) -> dict:
+        """
+        Como verify, pero con un kid desconocido refresca las llaves (en un hilo,
+        con su cooldown) y lo intenta una vez más.
+        """
+        try:
+            return self.verify(id_token)
+        except UnknownKeyError as e:
+            if not await asyncio.to_thread(self.keys.refresh_unknown, e.kid):
+                raise
+        return self.verify(id_token)
+
+    def verify(self, id_token: str) -> dict:
+        """Devuelve los claims del token (con `uid`) o lanza TokenError; no va a la red."""
+        key = hashlib.sha256(id_token.encode()).digest()
+        with self._lock:
+            claims = self._cache.get(key)
+            if claims is not None:
+                self.hits += 1
+                return claims
+            self.misses += 1
+
+        claims = self._decode(id_token)
+        with self._lock:
+            self._cache[key] = claims
+        return claims
+
+    def _decode(self, id_token: str) -> dict:
+        try:
+            header = jwt.get_unverified_header(id_token)
+        except jwt.PyJWTError as e:
+            raise TokenError(f"Token mal formado: {e}") from e
+
+        if header.get("alg") != "RS256":
+            raise TokenError("Algoritmo de firma no soportado")
+        kid = header.get("kid", "")
+        public_key = self.keys.get(kid)
+        if public_key is None:
+            raise UnknownKeyError(kid)
+
+        try:
+            claims = jwt.decode(
+                id_token,
+                public_key,
+                algorithms=["RS256"],
+                audience=self.project_id,
+                issuer=self.issuer,
+                leeway=self.leeway,
+                options={"require": ["exp", "iat", "aud", "iss", "sub"]},
+            )
+        except jwt.ExpiredSignatureError as e:
+            raise ExpiredTokenError("Token expirado") from e
+        except jwt.PyJWTError as e:
+            raise TokenError(str(e)) from e
+
+        sub = claims["sub"]
+        if not isinstance(sub, str) or not sub or len(sub) > 128:
+            raise TokenError("Claim 'sub' inválido")
+        if claims.get("auth_time", 0) > self._timer() + self.leeway:
+            raise TokenError("Claim 'auth_time' en el futuro")
+
+        claims["uid"] = sub
+        return claims
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._cache)}
+
+
+token_verifier = TokenVerifier(settings.FIREBASE_PROJECT_ID, maxsize=settings.TOKEN_CACHE_SIZE)
+
+
+async def verify_id_token(id_token: str) -> dict:
+    """Punto único de verificación usado por todas las dependencias de auth."""
+    start = time.perf_counter()
+    try:
+        return await token_verifier.verify_async(id_token)
+    finally:
+        record_auth(time.perf_counter() - start)
@@ -0,0 +1,128 @@
+# apps/backend/app/core/startup.py
+"""
+Informe de tiempos de arranque.
+
+Se importa lo primero en app.main. Siempre mide el tiempo total de imports y
+cada paso de inicialización del lifespan; con STARTUP_TIMING=1 instala además
+un hook de importación que registra el tiempo propio de cada módulo.
+No importa settings ni nada pesado para no falsear la medición.
+"""
+import importlib.abc
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("app.startup")
+
+
+class _TimedLoader(importlib.abc.Loader):
+    def __init__(self, loader, timer: "ImportTimer"):
+        self._loader = loader
+        self._timer = timer
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._timer.enter()
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._timer.leave(module.__name__, time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class ImportTimer(importlib.abc.MetaPathFinder):
+    """Envuelve los loaders para medir el tiempo propio (sin submódulos) de cada import."""
+
+    def __init__(self):
+        self.self_times: Dict[str, float] = {}
+        self._children: List[float] = []
+        self._finding = False
+
+    def find_spec(self, fullname, path, target=None):
+        if self._finding:
+            return None
+        self._finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                        spec.loader = _TimedLoader(spec.loader, self)
+                    return spec
+            return None
+        finally:
+            self._finding = False
+
+    def enter(self) -> None:
+        self._children.append(0.0)
+
+    def leave(self, name: str, elapsed: float) -> None:
+        children = self._children.pop()
+        self.self_times[name] = elapsed - children
+        if self._children:
+            self._children[-1] += elapsed
+
+    def install(self) -> None:
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self) -> None:
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+
+class StartupReport:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.imports_done: Optional[float] = None
+        self.steps: List[Tuple[str, float]] = []
+        self.import_timer: Optional[ImportTimer] = None
+        if os.getenv("STARTUP_TIMING", "").lower() in ("1", "true", "yes"):
+            self.import_timer = ImportTimer()
+            self.import_timer.install()
+
+    @contextmanager
+    def step(self, name: str) -> Iterator[None]:
+        if self.imports_done is None:
+            self.finish_imports()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - start))
+
+    def finish_imports(self) -> None:
+        self.imports_done = time.perf_counter()
+        if self.import_timer:
+            self.import_timer.uninstall()
+
+    def as_dict(self, top: int = 25) -> dict:
+        imports_done = self.imports_done or time.perf_counter()
+        report = {
+            "imports_ms": round((imports_done - self.started) * 1000, 2),
+            "steps_ms": {name: round(elapsed * 1000, 2) for name, elapsed in self.steps},
+        }
+        if self.import_timer:
+            slowest = sorted(self.import_timer.self_times.items(), key=lambda item: item[1], reverse=True)
+            report["slowest_modules_ms"] = {name: round(t * 1000, 2) for name, t in slowest[:top]}
+        return report
+
+    def log(self) -> None:
+        report = self.as_dict()
+        lines = [f"⏱️ Arranque: imports {report['imports_ms']} ms"]
+        lines += [f"   paso {name}: {ms} ms" for name, ms in report["steps_ms"].items()]
+        lines += [f"   módulo {name}: {ms} ms" for name, ms in report.get("slowest_modules_ms", {}).items()]
+        logger.info("\n".join(lines))
+
+
+startup_report = StartupReport()
@@ -0,0 +1,290 @@
+# apps/backend/app/core/throttling.py
+"""
+Límite de peticiones y deduplicación de peticiones en vuelo.
+
+- SlidingWindowLimiter: ventana deslizante aproximada con dos contadores fijos
+  (actual y anterior, ponderado por el tiempo que queda de solapamiento), un
+  solo viaje a Redis por comprobación y memoria O(1) por clave. Compartido por
+  todos los workers y nodos a través de Redis; si Redis no responde, el mismo
+  algoritmo corre en memoria del proceso.
+- InflightDeduplicator: de varias peticiones idénticas simultáneas solo una
+  (la líder) llega a la base de datos; las demás esperan y reciben su mismo
+  resultado. En el proceso con un Future; entre workers con una clave en Redis
+  que la líder rellena con el resultado (y que dura RESULT_TTL_MS más, lo que
+  además absorbe reintentos inmediatos de clientes que repiten la petición).
+"""
+import asyncio
+import hashlib
+import ipaddress
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from cachetools import TTLCache
+from fastapi import HTTPException, Request, status
+
+from app.core.cache import dumps
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "cu"
+PENDING = b"pending"
+RESULT_TTL_MS = 2000  # el resultado se conserva un momento para seguidoras rezagadas
+_FAILED = object()  # la líder falló con un error no HTTP: cada seguidora reintenta
+
+
+def parse_rate(rate: str) -> Tuple[int, int]:
+    """'60/60' -> (60 peticiones, 60 segundos)."""
+    limit, window = rate.split("/")
+    return int(limit), int(window)
+
+
+class _RedisBreaker:
+    """Mismo "circuit breaker" que ResponseCache: tras un fallo se usa la ruta local un rato."""
+
+    def __init__(self, redis: Optional[Any], retry_after: float = 5.0):
+        self.redis = redis
+        self.retry_after = retry_after
+        self._redis_down_until = 0.0
+        self.errors = 0
+
+    def _redis_available(self) -> bool:
+        return self.redis is not None and time.monotonic() >= self._redis_down_until
+
+    def _redis_failed(self, exc: Exception) -> None:
+        self.errors += 1
+        self._redis_down_until = time.monotonic() + self.retry_after
+        logger.warning("Redis no disponible, limitando en memoria: %s", exc)
+
+
+class SlidingWindowLimiter(_RedisBreaker):
+    def __init__(self, redis: Optional[Any] = None, local_maxsize: int = 100_000, retry_after: float = 5.0):
+        super().__init__(redis, retry_after)
+        self._local: Dict[int, TTLCache] = {}
+        self._local_maxsize = local_maxsize
+        self.allowed = 0
+        self.rejected = 0
+
+    def _counts_local(self, key: str, window: int, current: int) -> Tuple[int, int]:
+        counters = self._local.setdefault(window, TTLCache(maxsize=self._local_maxsize, ttl=2 * window))
+        counters[(key, current)] = counters.get((key, current), 0) + 1
+        return counters[(key, current)], counters.get((key, current - 1), 0)
+
+    async def _counts(self, key: str, window: int, current: int) -> Tuple[int, int]:
+        if self._redis_available():
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.incr(f"{PREFIX}:rl:{key}:{current}")
+                    pipe.expire(f"{PREFIX}:rl:{key}:{current}", 2 * window)
+                    pipe.get(f"{PREFIX}:rl:{key}:{current - 1}")
+                    count, _, previous = await pipe.execute()
+                return int(count), int(previous or 0)
+            except Exception as exc:
+                self._redis_failed(exc)
+        return self._counts_local(key, window, current)
+
+    async def hit(self, key: str, limit: int, window: int) -> Optional[int]:
+        """Cuenta una petición; devuelve None si se permite o los segundos de Retry-After."""
+        now = time.time()
+        current = int(now // window)
+        count, previous = await self._counts(key, window, current)
+        elapsed = now - current * window
+        estimate = previous * (window - elapsed) / window + count
+        if estimate <= limit:
+            self.allowed += 1
+            return None
+        self.rejected += 1
+        return max(1, int(window - elapsed))
+
+    def stats(self) -> dict:
+        return {"allowed": self.allowed, "rejected": self.rejected, "errors": self.errors, "redis": self._redis_available()}
+
+
+class InflightDeduplicator(_RedisBreaker):
+    def __init__(self, redis: Optional[Any] = None, ttl: float = 10.0, poll: float = 0.02, retry_after: float = 5.0):
+        super().__init__(redis, retry_after)
+        self.ttl = ttl
+        self.poll = poll
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.shared = 0
+
+    async def run(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Ejecuta `call` una sola vez por clave mientras esté en vuelo. Los
+        HTTPException de la líder se reproducen en las seguidoras; cualquier
+        otro error no se comparte y cada seguidora reintenta por su cuenta.
+        """
+        local = self._inflight.get(key)
+        if local is not None:
+            outcome = await asyncio.shield(local)
+            if outcome is not _FAILED:
+                self.shared += 1
+                if isinstance(outcome, HTTPException):
+                    raise outcome
+                return outcome
+            return await self.run(key, call)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._run_shared(key, call)
+        except HTTPException as exc:
+            future.set_result(exc)
+            raise
+        except BaseException:
+            future.set_result(_FAILED)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
+
+    async def _run_shared(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        redis_key = f"{PREFIX}:dd:{key}"
+        if not self._redis_available():
+            self.leaders += 1
+            return await call()
+        try:
+            leader = await self.redis.set(redis_key, PENDING, nx=True, px=int(self.ttl * 1000))
+        except Exception as exc:
+            self._redis_failed(exc)
+            leader = True
+
+        if not leader:
+            stored = await self._wait(redis_key)
+            if stored is not None:
+                self.shared += 1
+                if stored["status"] >= 400:
+                    raise HTTPException(status_code=stored["status"], detail=stored["body"].get("detail"))
+                return stored["body"]
+
+        self.leaders += 1
+        try:
+            result = await call()
+        except HTTPException as exc:
+            await self._store(redis_key, {"status": exc.status_code, "body": {"detail": exc.detail}})
+            raise
+        except BaseException:
+            await self._forget(redis_key)
+            raise
+        await self._store(redis_key, {"status": status.HTTP_200_OK, "body": result})
+        return result
+
+    async def _wait(self, redis_key: str) -> Optional[dict]:
+        deadline = time.monotonic() + self.ttl
+        while time.monotonic() < deadline:
+            try:
+                raw = await self.redis.get(redis_key)
+            except Exception as exc:
+                self._redis_failed(exc)
+                return None
+            if raw is None:
+                return None  # la líder falló: se ejecuta aquí
+            if raw != PENDING:
+                return json.loads(raw)
+            await asyncio.sleep(self.poll)
+        return None
+
+    async def _store(self, redis_key: str, value: dict) -> None:
+        try:
+            await self.redis.set(redis_key, dumps(value), px=RESULT_TTL_MS)
+        except Exception as exc:
+            self._redis_failed(exc)
+
+    async def _forget(self, redis_key: str) -> None:
+        try:
+            await self.redis.delete(redis_key)
+        except Exception as exc:
+            self._redis_failed(exc)
+
+    def stats(self) -> dict:
+        return {"leaders": self.leaders, "shared": self.shared, "inflight": len(self._inflight), "errors": self.errors}
+
+
+def _redis_client() -> Optional[Any]:
+    if not settings.RATE_LIMIT_REDIS_ENABLED:
+        return None
+    import redis.asyncio as aioredis
+
+    return aioredis.from_url(
+        settings.REDIS_URL,
+        socket_timeout=settings.REDIS_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_TIMEOUT,
+    )
+
+
+_redis = _redis_client()
+limiter = SlidingWindowLimiter(redis=_redis)
+deduplicator = InflightDeduplicator(redis=_redis, ttl=settings.DEDUP_TTL)
+
+
+async def close() -> None:
+    if _redis is not None:
+        await _redis.aclose()
+
+
+def request_key(scope: str, uid: str, body: bytes) -> str:
+    return f"{scope}:{uid}:{hashlib.sha256(body).hexdigest()}"
+
+
+async def enforce(scope: str, key: str, rate: str) -> None:
+    """429 con Retry-After si `key` superó `rate` en `scope`."""
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+    limit, window = parse_rate(rate)
+    retry_after = await limiter.hit(f"{scope}:{key}", limit, window)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Demasiadas peticiones, inténtalo más tarde",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+TRUSTED_NETWORKS = [
+    ipaddress.ip_network(network.strip(), strict=False)
+    for network in settings.TRUSTED_PROXIES.split(",") if network.strip()
+]
+
+
+def _trusted(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_NETWORKS)
+
+
+def client_ip(request: Request) -> str:
+    """
+    IP del cliente. Si la conexión viene de un proxy de confianza (TRUSTED_PROXIES)
+    se recorre X-Forwarded-For de derecha a izquierda y se toma el primer salto que
+    no es un proxy: los de la izquierda los pone el cliente y pueden ser falsos.
+    """
+    host = request.client.host if request.client else "unknown"
+    if not _trusted(host):
+        return host
+    hops = [
+        hop.strip()
+        for header in request.headers.getlist("x-forwarded-for")
+        for hop in header.split(",") if hop.strip()
+    ]
+    for hop in reversed(hops):
+        if not _trusted(hop):
+            return hop
+    return hops[0] if hops else host
+
+
+def limit_ip(scope: str):
+    """Dependencia: límite por IP del cliente (ver client_ip), antes de verificar el token."""
+    async def dependency(request: Request) -> None:
+        await enforce(f"{scope}:ip", client_ip(request), settings.RATE_LIMIT_PER_IP)
+    return dependency
+
+
+async def limit_uid(scope: str, uid: str) -> None:
+    await enforce(f"{scope}:uid", uid, settings.RATE_LIMIT_PER_UID)
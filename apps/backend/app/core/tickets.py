@@ -0,0 +1,137 @@
+# apps/backend/app/core/tickets.py
+"""
+Tickets de un solo uso para abrir GET /cycle/live con EventSource.
+
+EventSource no admite cabeceras, y un idToken en la URL (válido una hora) acaba
+en los logs de acceso del servidor y de los proxies. El cliente canjea su
+idToken en POST /cycle/live/ticket por un ticket firmado con SECRET_KEY (HMAC)
+que caduca a los STREAM_TICKET_TTL segundos y solo abre una conexión: la marca
+de usado va a Redis (SET NX), compartida por todos los workers, y a una caché en
+proceso que la sustituye si Redis no responde.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import time
+from typing import Any, Optional
+
+from cachetools import TTLCache
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "cu"
+
+
+class TicketError(Exception):
+    """Ticket con firma falsa, mal formado, caducado o ya usado."""
+
+
+class StreamTickets:
+    def __init__(
+        self,
+        secret: str,
+        redis: Optional[Any] = None,
+        ttl: int = 30,
+        local_maxsize: int = 100_000,
+        retry_after: float = 5.0,
+    ):
+        self.secret = secret.encode()
+        self.redis = redis
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self._used: TTLCache = TTLCache(maxsize=local_maxsize, ttl=ttl + 1)
+        self._redis_down_until = 0.0
+        self.issued = 0
+        self.redeemed = 0
+        self.rejected = 0
+        self.errors = 0
+
+    # --- Redis con "circuit breaker" ---
+
+    def _redis_available(self) -> bool:
+        return self.redis is not None and time.monotonic() >= self._redis_down_until
+
+    def _redis_failed(self, exc: Exception) -> None:
+        self.errors += 1
+        self._redis_down_until = time.monotonic() + self.retry_after
+        logger.warning("Redis no disponible, tickets de un solo uso en memoria: %s", exc)
+
+    # --- Tickets ---
+
+    def _sign(self, payload: str) -> str:
+        return hmac.new(self.secret, payload.encode(), hashlib.sha256).hexdigest()
+
+    def issue(self, uid: str) -> str:
+        raw = json.dumps([uid, int(time.time()) + self.ttl, secrets.token_hex(16)]).encode()
+        payload = base64.urlsafe_b64encode(raw).decode().rstrip("=")
+        self.issued += 1
+        return f"{payload}.{self._sign(payload)}"
+
+    async def redeem(self, ticket: str) -> str:
+        """Devuelve el UID del ticket y lo marca como usado; TicketError si no vale."""
+        try:
+            uid = await self._redeem(ticket)
+        except TicketError:
+            self.rejected += 1
+            raise
+        self.redeemed += 1
+        return uid
+
+    async def _redeem(self, ticket: str) -> str:
+        payload, _, signature = ticket.partition(".")
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            raise TicketError("firma inválida")
+        try:
+            uid, expires, nonce = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        except (TypeError, ValueError):
+            raise TicketError("ticket mal formado")
+        if time.time() > expires:
+            raise TicketError("ticket caducado")
+        if not await self._claim(nonce):
+            raise TicketError("ticket ya usado")
+        return uid
+
+    async def _claim(self, nonce: str) -> bool:
+        # También en local: si Redis cae después, este proceso sigue sin aceptarlo
+        if nonce in self._used:
+            return False
+        self._used[nonce] = True
+        if self._redis_available():
+            try:
+                return bool(await self.redis.set(f"{PREFIX}:ticket:{nonce}", 1, nx=True, ex=self.ttl + 1))
+            except Exception as exc:
+                self._redis_failed(exc)
+        return True
+
+    async def close(self) -> None:
+        if self.redis is not None:
+            await self.redis.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "issued": self.issued,
+            "redeemed": self.redeemed,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "redis": self._redis_available(),
+        }
+
+
+def _redis_client() -> Optional[Any]:
+    if not settings.LIVE_REDIS_ENABLED:
+        return None
+    import redis.asyncio as aioredis
+
+    return aioredis.from_url(
+        settings.REDIS_URL,
+        socket_timeout=settings.REDIS_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_TIMEOUT,
+    )
+
+
+stream_tickets = StreamTickets(settings.SECRET_KEY, redis=_redis_client(), ttl=settings.STREAM_TICKET_TTL)
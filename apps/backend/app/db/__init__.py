@@ -1 +1 @@
-from .session import get_db, engine, Base
+from .session import get_db, get_async_db, engine, async_engine, Base
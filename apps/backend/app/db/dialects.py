@@ -0,0 +1,7 @@
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+def insert(db, table):
+    """INSERT del dialecto de la sesión o conexión (con on_conflict_do_* y RETURNING)."""
+    dialect = getattr(db, "bind", db).dialect.name
+    return sqlite.insert(table) if dialect == "sqlite" else postgresql.insert(table)
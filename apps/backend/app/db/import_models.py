@@ -1,3 +1,4 @@
 # Importa los modelos aquí para que Alembic los detecte
 from app.models.user import User
 from app.models.cycle import Cycle
+from app.db.models import AnalyticsRollup, CycleEvent, CyclePrediction, CycleSummary, CycleSyncState
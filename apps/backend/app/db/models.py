@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, JSON, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, SmallInteger, String, Date, DateTime, JSON, ForeignKey, Index, text
 from sqlalchemy.orm import relationship
 from app.db.session import Base
 
@@ -6,10 +6,54 @@ class CycleEvent(Base):
     __tablename__ = "cycle_events"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(String, index=True)
+    user_id = Column(String)
     type = Column(String, nullable=False)  # Ej: 'period_start'
     date = Column(Date, nullable=False)
     meta = Column(JSON, nullable=True)
+    idempotency_key = Column(String(64), nullable=True)
+    # Secuencia de cambios por usuario (alta, edición o borrado) para /cycle/sync
+    change_seq = Column(BigInteger, nullable=True)
+    # change_seq del alta; el de un borrado lo sustituye (NULL: anterior a app.services.derived)
+    created_seq = Column(BigInteger, nullable=True)
+    deleted_at = Column(DateTime(timezone=True), nullable=True)  # tombstone
+
+    __table_args__ = (
+        Index("uq_cycle_events_user_idempotency", "user_id", "idempotency_key", unique=True),
+        Index("ix_cycle_events_user_change_seq", "user_id", "change_seq"),
+        # Keyset de /cycle/history (date DESC, id DESC); INCLUDE type en Postgres
+        Index("ix_cycle_events_user_date_id", "user_id", text("date DESC"), text("id DESC"),
+              postgresql_include=["type"]),
+        # Inicios/fines de periodo para predicción y resúmenes
+        Index("ix_cycle_events_user_period_date", "user_id", text("date DESC"),
+              postgresql_where=text("type IN ('period_start', 'period_end')")),
+    )
+
+class CycleSyncState(Base):
+    """Último change_seq asignado a cada usuario; la fila se bloquea al escribir."""
+    __tablename__ = "cycle_sync_state"
+
+    user_id = Column(String, primary_key=True)
+    change_seq = Column(BigInteger, nullable=False, default=0)
+    # Hasta qué change_seq se aplicaron resúmenes y rollups (app.services.derived)
+    derived_seq = Column(BigInteger, nullable=False, default=0, server_default="0")
+    # Perfil con el que están contados sus rollups; si el del usuario cambia, el
+    # trabajo derivado mueve su aportación (sin sentido mientras derived_seq = 0)
+    rollup_pais = Column(String, nullable=True)
+    rollup_ciudad = Column(String, nullable=True)
+    rollup_edad = Column(Integer, nullable=True)
+
+class CyclePrediction(Base):
+    """Predicción precalculada por el job nocturno (app.services.prediction_job)."""
+    __tablename__ = "cycle_predictions"
+
+    user_id = Column(String, primary_key=True)
+    model = Column(String, primary_key=True)
+    next_period_start = Column(Date, nullable=False)
+    confidence_days = Column(Integer, nullable=False)
+    fertile_start = Column(Date, nullable=False)
+    fertile_end = Column(Date, nullable=False)
+    change_seq = Column(BigInteger, nullable=False)  # change_seq del usuario al calcularla
+    computed_at = Column(DateTime(timezone=True), nullable=False)
 
 class CycleSummary(Base):
     __tablename__ = "cycle_summaries"
@@ -18,4 +62,24 @@ class CycleSummary(Base):
     user_id = Column(String, index=True)
     start_date = Column(Date, nullable=False)
     end_date = Column(Date, nullable=True)
-    average_length = Column(Integer, nullable=True)
+    average_length = Column(Integer, nullable=True)  # duración esperada del ciclo
+    cycle_length = Column(Integer, nullable=True)  # NULL mientras el ciclo sigue abierto
+
+    __table_args__ = (
+        Index("uq_cycle_summaries_user_start", "user_id", "start_date", unique=True),
+    )
+
+class AnalyticsRollup(Base):
+    """
+    Histogramas agregados por población (app.services.analytics): un contador
+    por cubo y por fragmento. Se suman al leer, así que se pueden fusionar.
+    """
+    __tablename__ = "analytics_rollups"
+
+    dimension = Column(String(16), primary_key=True)  # "all", "pais", "ciudad" o "edad"
+    key = Column(String(128), primary_key=True)  # valor de la dimensión ("" para "all")
+    metric = Column(String(32), primary_key=True)  # "cycle_length", "period_length" o "symptom"
+    bucket = Column(String(64), primary_key=True)
+    # Fragmento aleatorio: las filas más calientes no serializan todas las escrituras
+    shard = Column(SmallInteger, primary_key=True)
+    count = Column(BigInteger, nullable=False, default=0)
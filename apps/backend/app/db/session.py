@@ -1,14 +1,59 @@
+from typing import AsyncGenerator
+
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy.ext.declarative import DeclarativeMeta
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import Session
 from app.core.config import settings
+from app.core.metrics import install_db_hooks
+from app.db.base import Base
 
 SQLALCHEMY_DATABASE_URL = settings.POSTGRES_URL
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# Drivers asyncio equivalentes a los drivers síncronos
+ASYNC_DRIVERS = {
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_url(url: str) -> str:
+    """Convierte la URL síncrona (psycopg2) en su equivalente asyncio."""
+    parsed = make_url(url)
+    drivername = ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername)
+    return parsed.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+POOL_OPTIONS = {
+    "pool_size": settings.DB_POOL_SIZE,
+    "max_overflow": settings.DB_MAX_OVERFLOW,
+    "pool_timeout": settings.DB_POOL_TIMEOUT,
+    "pool_recycle": settings.DB_POOL_RECYCLE,
+    "pool_pre_ping": settings.DB_POOL_PRE_PING,
+}
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **POOL_OPTIONS)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base: DeclarativeMeta = declarative_base()
+
+async_engine = create_async_engine(
+    settings.POSTGRES_ASYNC_URL or async_database_url(SQLALCHEMY_DATABASE_URL),
+    **POOL_OPTIONS,
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# Nº de consultas y tiempo de BD por petición (ver app.core.metrics)
+install_db_hooks(engine)
+install_db_hooks(async_engine.sync_engine)
+
+
+def dispose_inherited_pools() -> None:
+    """Inicializador de procesos hijos: las conexiones del padre no se comparten tras fork."""
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+
 
 def get_db():
     db = SessionLocal()
@@ -16,3 +61,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """Dependencia: sesión asíncrona; no ocupa un hilo del threadpool por petición."""
+    async with AsyncSessionLocal() as db:
+        yield db
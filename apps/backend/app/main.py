@@ -1,21 +1,66 @@
+from app.core.startup import startup_report  # 👈 primero: mide el resto de imports
+
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse
+from app.api.responses import FastJSONResponse
 from app.api.v1 import api_router
-from app.db.base import Base
-from app.models.cycle import Cycle, CycleEvent
-from app.models.user import User
-from app.db.session import engine
+from app.api.v1.routes.analytics import router as analytics_router
 from app.api.v1.routes.cycles import router as cycles_router
 from app.api.v1.routes.predictions import router as predictions_router
 from app.api.v1.routes.user_routes import router as users_router
+from app.core.cache import cache
+from app.core.config import settings
+from app.core.metrics import MetricsMiddleware, registry
+from app.core.pubsub import broker
+from app.core.profiling import SlowRequestProfiler
+from app.core.security import token_verifier
+from app.core.tickets import stream_tickets
+from app.core import throttling
+from app.db.session import async_engine, engine
+from app.services.jobs import jobs
+from app.services.timeline import timelines
+from app.services.write_behind import write_behind
+
+
+# 🔹 Arranque y parada. El esquema lo gestiona Alembic (alembic upgrade head);
+# los ID tokens se verifican con las llaves públicas, sin Firebase Admin.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    with startup_report.step("firebase_signing_keys"):
+        # Llaves de firma en memoria antes de la primera petición, refrescadas en segundo plano
+        await token_verifier.keys.prime()
+        token_verifier.keys.start()
+    if write_behind is not None:
+        write_behind.start()
+    broker.start()  # 🔹 latidos y pub/sub de Redis para /cycle/live
+    jobs.start()  # 🔹 trabajo derivado de las escrituras (resúmenes, analítica, predicciones)
+    app.state.startup_report = startup_report.as_dict()
+    startup_report.log()
+
+    yield
+
+    if write_behind is not None:
+        await write_behind.stop()  # vuelca lo pendiente antes de cerrar
+    await jobs.stop()  # después del write-behind: su volcado encola trabajos
+    await broker.stop()
+    token_verifier.keys.stop()
+    await cache.close()
+    await throttling.close()
+    await stream_tickets.close()
+    await async_engine.dispose()
+    engine.dispose()
 
-# 🔹 Inicializa la base de datos
-Base.metadata.create_all(bind=engine)
 
 # 🔹 Inicializa la app FastAPI
 app = FastAPI(
     title="Copa Uva API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,  # render en Rust (pydantic-core)
 )
 
 # 🔹 Permitir CORS (para comunicación con Next.js)
@@ -27,36 +72,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 🔹 Compresión de respuestas grandes (historial, sync); las pequeñas van tal cual
+app.add_middleware(GZipMiddleware, minimum_size=500)
+
+# 🔹 Métricas por ruta (tiempo, consultas y tiempo de BD, verificación de token, bytes)
+app.add_middleware(
+    MetricsMiddleware,
+    server_timing=settings.SERVER_TIMING,
+    profiler=SlowRequestProfiler(
+        settings.PROFILE_DIR,
+        keep=settings.PROFILE_SLOWEST_N,
+        sample_rate=settings.PROFILE_SAMPLE_RATE,
+    ) if settings.PROFILE_SLOWEST_N > 0 else None,
+)
+registry.register_collector("auth_token_cache", token_verifier.stats)
+registry.register_collector("response_cache", cache.stats)
+registry.register_collector("rate_limit", throttling.limiter.stats)
+registry.register_collector("request_dedup", throttling.deduplicator.stats)
+registry.register_collector("timelines", timelines.stats)
+registry.register_collector("live", broker.stats)
+registry.register_collector("stream_tickets", stream_tickets.stats)
+registry.register_collector("jobs", jobs.stats)
+if write_behind is not None:
+    registry.register_collector("write_behind", write_behind.stats)
+
 # 🔹 Rutas principales
 app.include_router(api_router, prefix="/api/v1")
 app.include_router(cycles_router, prefix="/api/v1")
 app.include_router(predictions_router, prefix="/api/v1")
+app.include_router(analytics_router, prefix="/api/v1")
 app.include_router(users_router, prefix="/api/v1/users", tags=["Users"])
 
-# 🔹 Inicializar Firebase Admin SDK
-import os
-import firebase_admin
-from firebase_admin import credentials
-from app.core.config import settings
-
-try:
-    cred_path = settings.FIREBASE_CREDENTIALS
-
-    # Si la ruta no es absoluta, la convertimos relativa al backend
-    if not os.path.isabs(cred_path):
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        cred_path = os.path.join(base_dir, "..", cred_path)
-        cred_path = os.path.normpath(cred_path)
-
-    if not firebase_admin._apps:
-        cred = credentials.Certificate(cred_path)
-        firebase_admin.initialize_app(cred)
-        print(f"✅ Firebase Admin inicializado correctamente desde {cred_path}")
-
-except Exception as e:
-    print(f"⚠️ Error al inicializar Firebase Admin: {e}")
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 # 🔹 Ruta de prueba
 @app.get("/")
 def root():
-    return {"message": "Bienvenida a Copa Uva API 💜"}
\ No newline at end of file
+    return {"message": "Bienvenida a Copa Uva API 💜"}
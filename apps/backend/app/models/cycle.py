@@ -1,13 +1,8 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String
 from app.db.base import Base
+from app.db.models import CycleEvent  # esquema real de cycle_events (user_id/type/date/meta)
 
 class Cycle(Base):
     __tablename__ = "cycles"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
-
-class CycleEvent(Base):
-    __tablename__ = "cycle_events"
-    id = Column(Integer, primary_key=True, index=True)
-    cycle_id = Column(Integer, ForeignKey("cycles.id"))
-    description = Column(String)
@@ -1,15 +1,79 @@
-from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+from typing import Optional, Dict, Any, List
 from datetime import date
 
+MAX_BATCH_EVENTS = 5000
+MAX_SYMPTOM_NAMES = 20
+MAX_SYMPTOM_NAME_LENGTH = 64
+
 class CycleEventCreate(BaseModel):
     type: str
     date: date
     meta: Optional[Dict[str, Any]] = None
+    # Clave generada por el cliente; reenviar el mismo evento no crea duplicados
+    idempotency_key: Optional[str] = Field(None, max_length=64)
+
+    @field_validator("meta")
+    @classmethod
+    def check_symptom_names(cls, meta: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """meta.name y meta.names (texto o lista de textos) alimentan la analítica de síntomas."""
+        if not meta:
+            return meta
+        names = meta.get("names")
+        if isinstance(names, str):
+            names = [names]
+        elif names is not None and not isinstance(names, list):
+            raise ValueError("meta.names debe ser un texto o una lista de textos")
+        names = [meta.get("name")] + (names or [])
+        if len(names) > MAX_SYMPTOM_NAMES + 1:
+            raise ValueError(f"meta.names admite como mucho {MAX_SYMPTOM_NAMES} síntomas")
+        for name in names:
+            if name is not None and (not isinstance(name, str) or len(name) > MAX_SYMPTOM_NAME_LENGTH):
+                raise ValueError(f"cada síntoma debe ser un texto de hasta {MAX_SYMPTOM_NAME_LENGTH} caracteres")
+        return meta
+
+class CycleEventResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
 
-class CycleEventResponse(CycleEventCreate):
     id: int
     user_id: str
+    type: str
+    date: date
+    meta: Optional[Dict[str, Any]] = None
+
+class CycleHistoryPage(BaseModel):
+    events: List[CycleEventResponse]
+    next_cursor: Optional[str] = None
+
+class CycleSyncEvent(BaseModel):
+    id: int
+    type: str
+    date: date
+    meta: Optional[Dict[str, Any]] = None
+
+class CycleSyncResponse(BaseModel):
+    cursor: Optional[str] = None
+    more: bool
+    events: List[CycleSyncEvent]
+    deleted: List[int]
+
+class CalendarMonth(BaseModel):
+    month: str
+    flags: Dict[str, int]
+    days: List[int]  # una máscara de bits por día del mes
+
+class CycleEventBatch(BaseModel):
+    # Items sin validar: un evento inválido no debe rechazar el lote completo
+    events: List[Dict[str, Any]] = Field(..., min_length=1, max_length=MAX_BATCH_EVENTS)
+
+class CycleEventBatchItem(BaseModel):
+    index: int
+    status: str  # "created" | "duplicate" | "error"
+    event_id: Optional[int] = None
+    errors: Optional[List[Dict[str, Any]]] = None
 
-    class Config:
-        orm_mode = True
+class CycleEventBatchResult(BaseModel):
+    created: int
+    duplicates: int
+    errors: int
+    items: List[CycleEventBatchItem]
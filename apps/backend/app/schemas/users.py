@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import Optional
 
 class UserCreate(BaseModel):
@@ -10,8 +10,7 @@ class UserCreate(BaseModel):
     direccion: str
     edad: Optional[int] = None
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class UserOut(BaseModel):
     id: int
@@ -23,5 +22,4 @@ class UserOut(BaseModel):
     direccion: str
     edad: Optional[int] = None
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
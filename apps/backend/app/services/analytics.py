@@ -0,0 +1,311 @@
+"""
+Analítica de población con rollups precalculados (tabla `analytics_rollups`).
+
+Cada métrica es un histograma de contadores por cubo, agregado por dimensión:
+todos los usuarios, país, ciudad (país/ciudad) y franja de edad.
+
+- cycle_length: duración de los ciclos cerrados plausibles (un cubo por día).
+- period_length: duración de los periodos con period_end (un cubo por día).
+- symptom: frecuencia de cada síntoma registrado (meta "name" o "names").
+
+Los histogramas se pueden fusionar (se suman cubo a cubo), así que el trabajo
+derivado de las escrituras (app.services.derived) aplica deltas con INSERT ...
+ON CONFLICT DO UPDATE count = count + delta. Cada transacción escribe en un fragmento
+aleatorio de ANALYTICS_SHARDS, de modo que las filas más calientes ("all") no
+serializan todas las inserciones. La lectura suma los fragmentos: su coste
+depende del número de cubos, no de usuarios ni de eventos.
+
+Los contadores siguen el perfil actual del usuario, igual que `rebuild`.
+cycle_sync_state guarda el perfil con el que está contado cada usuario; cuando
+cambian su país, ciudad o edad, el trabajo derivado aplica lo pendiente con ese
+perfil y `reattribute` mueve su aportación a las dimensiones nuevas.
+
+Uso: python -m app.services.analytics rebuild
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from cachetools import TTLCache
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db import dialects
+from app.db.models import AnalyticsRollup, CycleEvent, CycleSummary, CycleSyncState
+from app.models.user import User
+from app.services.calendar_view import MAX_PERIOD_DAYS
+from app.services.prediction import MAX_CYCLE_LENGTH, MIN_CYCLE_LENGTH
+
+METRICS = ("cycle_length", "period_length", "symptom")
+DIMENSIONS = ("all", "pais", "ciudad", "edad")
+NUMERIC_METRICS = ("cycle_length", "period_length")
+SYMPTOM = "symptom"
+UNKNOWN = "?"
+AGE_BANDS = ((18, "<18"), (25, "18-24"), (35, "25-34"), (45, "35-44"))  # (hasta, etiqueta)
+MAX_BUCKET_LENGTH = 64
+STREAM_BATCH_SIZE = 5000
+
+# (métrica, cubo) -> cantidad, con signo
+Histogram = Counter
+# (pais, ciudad, edad)
+Profile = Tuple[Optional[str], Optional[str], Optional[int]]
+NO_PROFILE: Profile = (None, None, None)
+
+_reads: TTLCache = TTLCache(maxsize=1024, ttl=settings.ANALYTICS_CACHE_TTL)
+
+
+def age_band(edad: Optional[int]) -> str:
+    if edad is None:
+        return UNKNOWN
+    for limit, label in AGE_BANDS:
+        if edad < limit:
+            return label
+    return "45+"
+
+
+def dimension_keys(pais: Optional[str], ciudad: Optional[str], edad: Optional[int]) -> List[Tuple[str, str]]:
+    pais = (pais or "").strip() or UNKNOWN
+    ciudad = (ciudad or "").strip() or UNKNOWN
+    return [("all", ""), ("pais", pais[:128]), ("ciudad", f"{pais}/{ciudad}"[:128]), ("edad", age_band(edad))]
+
+
+def cycle_histogram(rows: Iterable[Tuple[Any, Any, Optional[int]]]) -> Histogram:
+    """Histograma de filas (start_date, end_date, cycle_length) de cycle_summaries."""
+    histogram = Counter()
+    for start, end, length in rows:
+        if length is not None and MIN_CYCLE_LENGTH <= length <= MAX_CYCLE_LENGTH:
+            histogram[("cycle_length", str(length))] += 1
+        if end is not None and 0 <= (end - start).days < MAX_PERIOD_DAYS:
+            histogram[("period_length", str((end - start).days + 1))] += 1
+    return histogram
+
+
+def symptom_names(meta: Optional[Dict[str, Any]]) -> List[str]:
+    """Nombres de síntoma de meta; tolera lo guardado antes de validarse (escalares, no textos)."""
+    meta = meta if isinstance(meta, dict) else {}
+    names = meta.get("names") or meta.get("name")
+    if not isinstance(names, list):
+        names = [names]
+    names = [name.strip().lower()[:MAX_BUCKET_LENGTH] for name in names if isinstance(name, str)]
+    return [name for name in names if name] or ["unspecified"]
+
+
+def symptom_histogram(events: Iterable[Tuple[str, Optional[Dict[str, Any]]]]) -> Histogram:
+    """Histograma de eventos (type, meta); solo cuentan los de tipo "symptom"."""
+    histogram = Counter()
+    for event_type, meta in events:
+        if event_type == SYMPTOM:
+            histogram.update((SYMPTOM, name) for name in symptom_names(meta))
+    return histogram
+
+
+async def load_cycle_histogram(db: AsyncSession, uid: str) -> Histogram:
+    return (await load_cycle_histograms(db, [uid]))[uid]
+
+
+async def load_cycle_histograms(db: AsyncSession, uids: Sequence[str]) -> Dict[str, Histogram]:
+    result = await db.execute(
+        select(CycleSummary.user_id, CycleSummary.start_date, CycleSummary.end_date, CycleSummary.cycle_length)
+        .where(CycleSummary.user_id.in_(uids))
+    )
+    rows_by_user: Dict[str, list] = {uid: [] for uid in uids}
+    for uid, *row in result.all():
+        rows_by_user[uid].append(row)
+    return {uid: cycle_histogram(rows) for uid, rows in rows_by_user.items()}
+
+
+async def load_symptom_histograms(db: AsyncSession, uids: Sequence[str]) -> Dict[str, Histogram]:
+    result = await db.execute(
+        select(CycleEvent.user_id, CycleEvent.meta)
+        .where(CycleEvent.user_id.in_(uids), CycleEvent.type == SYMPTOM, CycleEvent.deleted_at.is_(None))
+    )
+    histograms: Dict[str, Histogram] = {uid: Counter() for uid in uids}
+    for uid, meta in result.all():
+        histograms[uid].update(symptom_histogram([(SYMPTOM, meta)]))
+    return histograms
+
+
+async def load_profiles(db: AsyncSession, uids: Sequence[str]) -> Dict[str, Profile]:
+    """Perfil de cada usuario; NO_PROFILE si aún no está registrado."""
+    profiles = {
+        uid: (pais, ciudad, edad)
+        for uid, pais, ciudad, edad in (await db.execute(
+            select(User.firebase_uid, User.pais, User.ciudad, User.edad).where(User.firebase_uid.in_(list(uids)))
+        )).all()
+    }
+    return {uid: profiles.get(uid, NO_PROFILE) for uid in uids}
+
+
+def _add(totals: Counter, profile: Profile, histogram: Histogram, sign: int = 1) -> None:
+    for dimension, key in dimension_keys(*profile):
+        for (metric, bucket), count in histogram.items():
+            totals[(dimension, key, metric, bucket)] += sign * count
+
+
+async def record(db: AsyncSession, uid: str, delta: Histogram) -> None:
+    """Aplica `delta` a los rollups de todas las dimensiones del usuario (sin commit)."""
+    await record_many(db, {uid: delta})
+
+
+async def record_many(
+    db: AsyncSession, deltas: Dict[str, Histogram], profiles: Optional[Dict[str, Profile]] = None,
+) -> None:
+    """
+    Como record para varios usuarios: una lectura de perfiles y un solo upsert.
+    Con `profiles` se cuentan en esos perfiles en vez de en los actuales.
+    """
+    deltas = {uid: delta for uid, delta in deltas.items() if any(delta.values())}
+    if not deltas:
+        return
+    if profiles is None:
+        profiles = await load_profiles(db, list(deltas))
+    totals: Counter = Counter()
+    for uid, delta in deltas.items():
+        _add(totals, profiles[uid], delta)
+    await _apply(db, totals)
+
+
+async def reattribute(db: AsyncSession, moves: Dict[str, Tuple[Profile, Profile]]) -> None:
+    """
+    Mueve la aportación de cada usuario de las dimensiones del perfil anterior a
+    las del nuevo (sin commit). Lo llama derived.derive_users, con lo pendiente
+    del usuario ya aplicado y su fila de cycle_sync_state bloqueada.
+    """
+    moves = {uid: (old, new) for uid, (old, new) in moves.items() if dimension_keys(*old) != dimension_keys(*new)}
+    if not moves:
+        return
+    uids = sorted(moves)
+    cycles = await load_cycle_histograms(db, uids)
+    symptoms = await load_symptom_histograms(db, uids)
+    totals: Counter = Counter()
+    for uid, (old, new) in moves.items():
+        contribution = cycles[uid] + symptoms[uid]
+        _add(totals, old, contribution, -1)
+        _add(totals, new, contribution)
+    await _apply(db, totals)
+
+
+async def _apply(db: AsyncSession, totals: Counter) -> None:
+    shard = random.randrange(settings.ANALYTICS_SHARDS)
+    columns = ("dimension", "key", "metric", "bucket", "shard", "count")
+    # Filas en orden de clave: dos transacciones nunca se bloquean en orden inverso
+    rows = [dict(zip(columns, (*item, shard, count))) for item, count in sorted(totals.items()) if count]
+    if not rows:
+        return
+    stmt = dialects.insert(db, AnalyticsRollup).values(rows)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=list(columns[:-1]),
+        set_={"count": AnalyticsRollup.count + stmt.excluded.count},
+    ))
+
+
+# --- Lectura ---
+
+def _summary(metric: str, buckets: Dict[str, int]) -> dict:
+    total = sum(buckets.values())
+    if metric in NUMERIC_METRICS:
+        histogram = dict(sorted(buckets.items(), key=lambda item: int(item[0])))
+        mean = sum(int(bucket) * count for bucket, count in histogram.items()) / total if total else None
+        return {"histogram": histogram, "total": total, "mean": round(mean, 2) if mean is not None else None}
+    histogram = dict(sorted(buckets.items(), key=lambda item: -item[1]))
+    return {"histogram": histogram, "total": total}
+
+
+async def report(db: AsyncSession, metric: str, dimension: str = "all", key: Optional[str] = None) -> dict:
+    """
+    Histograma de `metric` por cada valor de `dimension` (o solo `key`). Lee como
+    mucho cubos x fragmentos filas por valor y se cachea ANALYTICS_CACHE_TTL segundos.
+    """
+    cache_key = (metric, dimension, key)
+    if cache_key in _reads:
+        return _reads[cache_key]
+
+    stmt = (
+        select(AnalyticsRollup.key, AnalyticsRollup.bucket, func.sum(AnalyticsRollup.count))
+        .where(AnalyticsRollup.dimension == dimension, AnalyticsRollup.metric == metric)
+        .group_by(AnalyticsRollup.key, AnalyticsRollup.bucket)
+    )
+    if key is not None:
+        stmt = stmt.where(AnalyticsRollup.key == key)
+    by_key: Dict[str, Dict[str, int]] = {}
+    for value, bucket, count in (await db.execute(stmt)).all():
+        if count:
+            by_key.setdefault(value, {})[bucket] = int(count)
+
+    result = {
+        "metric": metric,
+        "dimension": dimension,
+        "groups": {value: _summary(metric, buckets) for value, buckets in sorted(by_key.items())},
+    }
+    _reads[cache_key] = result
+    return result
+
+
+# --- Reconstrucción completa ---
+
+async def rebuild() -> int:
+    """Recalcula todos los rollups con los perfiles actuales y los reemplaza en una transacción."""
+    from app.db.session import AsyncSessionLocal, async_engine
+
+    started = time.perf_counter()
+    totals: Counter = Counter()
+
+    try:
+        async with AsyncSessionLocal() as db:
+            summaries = await db.stream(
+                select(CycleSummary.start_date, CycleSummary.end_date, CycleSummary.cycle_length,
+                       User.pais, User.ciudad, User.edad)
+                .outerjoin(User, User.firebase_uid == CycleSummary.user_id)
+                .execution_options(yield_per=STREAM_BATCH_SIZE)
+            )
+            async for rows in summaries.partitions():
+                for row in rows:
+                    _add(totals, row[3:], cycle_histogram([row[:3]]))
+
+            symptoms = await db.stream(
+                select(CycleEvent.meta, User.pais, User.ciudad, User.edad)
+                .outerjoin(User, User.firebase_uid == CycleEvent.user_id)
+                .where(CycleEvent.type == SYMPTOM, CycleEvent.deleted_at.is_(None))
+                .execution_options(yield_per=STREAM_BATCH_SIZE)
+            )
+            async for rows in symptoms.partitions():
+                for row in rows:
+                    _add(totals, row[1:], symptom_histogram([(SYMPTOM, row[0])]))
+
+            await db.execute(delete(AnalyticsRollup))
+            rows = [
+                {"dimension": d, "key": k, "metric": m, "bucket": b, "shard": 0, "count": n}
+                for (d, k, m, b), n in totals.items()
+            ]
+            for start in range(0, len(rows), STREAM_BATCH_SIZE):
+                await db.execute(insert(AnalyticsRollup), rows[start:start + STREAM_BATCH_SIZE])
+            # Todo queda contado con el perfil actual de cada usuario
+            owner = User.firebase_uid == CycleSyncState.user_id
+            await db.execute(update(CycleSyncState).values(
+                rollup_pais=select(User.pais).where(owner).scalar_subquery(),
+                rollup_ciudad=select(User.ciudad).where(owner).scalar_subquery(),
+                rollup_edad=select(User.edad).where(owner).scalar_subquery(),
+            ))
+            await db.commit()
+    finally:
+        await async_engine.dispose()
+
+    print(f"✅ {len(totals)} contadores de analítica en {time.perf_counter() - started:.1f} s")
+    return len(totals)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rollups de analítica (analytics_rollups)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild", help="Recalcula todos los rollups desde cycle_summaries y cycle_events")
+    args = parser.parse_args()
+    if args.command == "rebuild":
+        asyncio.run(rebuild())
+
+
+if __name__ == "__main__":
+    main()
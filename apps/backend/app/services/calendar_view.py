@@ -0,0 +1,160 @@
+"""
+Vista de calendario mensual: un entero por día con banderas de estado.
+
+Se construye a partir de los periodos registrados y los síntomas del mes, y de
+la predicción (periodos previstos y ventana fértil, proyectados ciclo a ciclo
+hacia meses futuros). Los periodos y síntomas salen de la timeline del usuario
+si ya está en memoria; si no, de cycle_summaries y de los síntomas del mes en
+cycle_events, sin leer el historial completo.
+"""
+import calendar
+from datetime import date, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import CycleEvent, CycleSummary
+from app.services.prediction import (
+    CYCLE_WINDOW, FERTILE_DAYS_AFTER, FERTILE_DAYS_BEFORE, LUTEAL_PHASE_DAYS,
+    PredictionError, load_period_starts, load_prediction, resolve_model,
+)
+from app.services.summaries import PERIOD_END, PERIOD_START, PERIOD_TYPES, summarize
+from app.services.timeline import Timeline, timelines
+
+PERIOD = 1
+PREDICTED_PERIOD = 2
+FERTILE = 4
+SYMPTOM = 8
+FLAGS = {"period": PERIOD, "predicted_period": PREDICTED_PERIOD, "fertile": FERTILE, "symptom": SYMPTOM}
+
+DEFAULT_PERIOD_DAYS = 5
+MAX_PERIOD_DAYS = 10  # un periodo sin period_end no se pinta más allá de esto
+
+
+def month_bounds(year: int, month: int) -> Tuple[date, date]:
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def _mark(days: List[int], first: date, start: date, end: date, flag: int) -> None:
+    """Activa `flag` en los días de [start, end] que caen dentro del mes."""
+    lo = max((start - first).days, 0)
+    hi = min((end - first).days, len(days) - 1)
+    for i in range(lo, hi + 1):
+        days[i] |= flag
+
+
+def period_length(summaries: Iterable[Tuple[date, Optional[date]]]) -> int:
+    lengths = [
+        (end - start).days + 1 for start, end in summaries
+        if end is not None and 0 <= (end - start).days < MAX_PERIOD_DAYS
+    ]
+    return round(sum(lengths) / len(lengths)) if lengths else DEFAULT_PERIOD_DAYS
+
+
+def day_states(
+    first: date,
+    last: date,
+    periods: Iterable[Tuple[date, Optional[date]]],
+    symptom_days: Iterable[date],
+    prediction: Optional[dict],
+    last_start: Optional[date],
+    period_days: int,
+) -> List[int]:
+    days = [0] * ((last - first).days + 1)
+    for start, end in periods:
+        _mark(days, first, start, end or start + timedelta(days=period_days - 1), PERIOD)
+    for day in symptom_days:
+        days[(day - first).days] |= SYMPTOM
+
+    if prediction and last_start:
+        next_start = date.fromisoformat(prediction["next_period_start"])
+        length = max((next_start - last_start).days, 1)
+        fertile_start, fertile_end = (date.fromisoformat(d) for d in prediction["fertile_window"])
+        # Ciclo previsto k: mismo desplazamiento que el siguiente, k ciclos más tarde
+        k = max(0, ((first - next_start).days - period_days) // length)
+        while True:
+            shift = timedelta(days=k * length)
+            start = next_start + shift
+            if start - timedelta(days=LUTEAL_PHASE_DAYS + FERTILE_DAYS_BEFORE) > last:
+                break
+            _mark(days, first, start, start + timedelta(days=period_days - 1), PREDICTED_PERIOD)
+            _mark(days, first, fertile_start + shift, fertile_end + shift, FERTILE)
+            k += 1
+    return days
+
+
+def month_from_timeline(timeline: Timeline, first: date, last: date):
+    """Periodos del mes, ciclos recientes, días con síntomas y último inicio, sin salir de la timeline."""
+    # Los mismos ciclos que materializa cycle_summaries
+    starts = [date.fromordinal(int(o)) for o in np.unique(timeline.ordinals_of(PERIOD_START))]
+    ends = [date.fromordinal(int(o)) for o in timeline.ordinals_of(PERIOD_END)]
+    cycles = [(row["start_date"], row["end_date"]) for row in summarize(starts, ends)]
+    periods = [
+        (start, end) for start, end in cycles
+        if first - timedelta(days=MAX_PERIOD_DAYS) <= start <= last
+    ]
+    lo, hi = timeline.span(first, last)
+    symptom_days = {
+        date.fromordinal(timeline.ordinals[i])
+        for i in range(lo, hi)
+        if timeline.type_of(i) not in PERIOD_TYPES
+    }
+    return periods, cycles[-CYCLE_WINDOW:], symptom_days, starts[-1] if starts else None
+
+
+async def month_from_db(db: AsyncSession, uid: str, first: date, last: date):
+    """Lo mismo que month_from_timeline con consultas acotadas al mes y a CYCLE_WINDOW ciclos."""
+    recent = (await db.execute(
+        select(CycleSummary.start_date, CycleSummary.end_date)
+        .where(CycleSummary.user_id == uid)
+        .order_by(CycleSummary.start_date.desc())
+        .limit(CYCLE_WINDOW)
+    )).all()
+    periods = (await db.execute(
+        select(CycleSummary.start_date, CycleSummary.end_date)
+        .where(
+            CycleSummary.user_id == uid,
+            CycleSummary.start_date <= last,
+            CycleSummary.start_date >= first - timedelta(days=MAX_PERIOD_DAYS),
+        )
+    )).all()
+    symptom_days = (await db.execute(
+        select(CycleEvent.date).distinct()
+        .where(
+            CycleEvent.user_id == uid,
+            CycleEvent.date >= first,
+            CycleEvent.date <= last,
+            CycleEvent.type.not_in(PERIOD_TYPES),
+            CycleEvent.deleted_at.is_(None),
+        )
+    )).scalars().all()
+    starts = await load_period_starts(db, uid)
+    last_start = date.fromordinal(int(starts.max())) if starts.size else None
+    return periods, recent, symptom_days, last_start
+
+
+async def build_month(db: AsyncSession, uid: str, year: int, month: int, model: str = "default") -> dict:
+    model = resolve_model(model)  # un modelo desconocido sí es un error del cliente
+    first, last = month_bounds(year, month)
+    timeline = await timelines.resident(db, uid)
+    if timeline is not None:
+        periods, recent, symptom_days, last_start = month_from_timeline(timeline, first, last)
+    else:
+        periods, recent, symptom_days, last_start = await month_from_db(db, uid, first, last)
+
+    try:
+        prediction = await load_prediction(db, uid, model)
+    except PredictionError:
+        prediction = None
+
+    days = day_states(
+        first, last,
+        periods,
+        symptom_days,
+        prediction,
+        last_start,
+        period_length(recent),
+    )
+    return {"month": f"{year:04d}-{month:02d}", "flags": FLAGS, "days": days}
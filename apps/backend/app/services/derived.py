@@ -0,0 +1,166 @@
+"""
+Trabajo derivado de las escrituras de eventos, fuera de la petición.
+
+Las rutas de escritura solo insertan o borran, confirman, invalidan la caché de
+respuestas y encolan un trabajo "derive" por usuario (app.services.jobs). El
+trabajo, en una transacción:
+
+- actualiza cycle_summaries (incremental para altas, reconstrucción si hubo borrados),
+- aplica a analytics_rollups el delta de ciclos (resúmenes antes/después) y de
+  síntomas (eventos con change_seq posterior a derived_seq),
+- recalcula las predicciones guardadas del usuario,
+
+y después publica la actualización en vivo si hay alguna conexión abierta.
+
+cycle_sync_state.derived_seq dice hasta qué change_seq está aplicado. La fila se
+bloquea como al escribir, y las escrituras de un usuario confirman en orden de
+secuencia, así que la ventana (derived_seq, change_seq] contiene exactamente lo
+pendiente: repetir un trabajo (reintento, entrega doble, trabajos fusionados o
+el importador) nunca cuenta dos veces un evento. Un evento que no se puede
+procesar se registra y se salta: nunca bloquea la ventana del usuario.
+"""
+import logging
+from collections import Counter
+from datetime import date
+from typing import Dict, Iterable, List, Sequence
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import CycleEvent, CyclePrediction, CycleSyncState
+from app.services import analytics, live, summaries
+from app.services.jobs import jobs
+from app.services.prediction import PredictionError, load_prediction, resolve_model
+
+logger = logging.getLogger(__name__)
+
+DERIVE = "derive"
+
+
+async def derive_users(db: AsyncSession, uids: Sequence[str]) -> List[str]:
+    """Aplica lo pendiente de cada usuario (sin commit); devuelve los que tenían algo."""
+    state = (await db.execute(
+        select(CycleSyncState.user_id, CycleSyncState.change_seq, CycleSyncState.derived_seq,
+               CycleSyncState.rollup_pais, CycleSyncState.rollup_ciudad, CycleSyncState.rollup_edad)
+        .where(CycleSyncState.user_id.in_(list(uids)))
+        .order_by(CycleSyncState.user_id)
+        .with_for_update()
+    )).all()
+    if not state:
+        return []
+    profiles = await analytics.load_profiles(db, [row.user_id for row in state])
+    # Perfil con el que está contado lo ya aplicado; sin nada aplicado, el actual
+    counted = {
+        row.user_id: (row.rollup_pais, row.rollup_ciudad, row.rollup_edad) if row.derived_seq else profiles[row.user_id]
+        for row in state
+    }
+    windows = {row.user_id: row.derived_seq for row in state if row.change_seq > row.derived_seq}
+    moves = {
+        uid: (counted[uid], profiles[uid]) for uid in counted
+        if analytics.dimension_keys(*counted[uid]) != analytics.dimension_keys(*profiles[uid])
+    }
+    if not windows and not moves:
+        return []
+
+    if windows:
+        await _apply_windows(db, windows, counted)
+    # Lo pendiente ya está contado con el perfil anterior: ahora se mueve todo al nuevo
+    await analytics.reattribute(db, moves)
+
+    uids = sorted(set(windows) | set(moves))
+    table = CycleSyncState.__table__
+    await db.execute(
+        update(table)
+        .where(table.c.user_id == bindparam("uid"))
+        .values(
+            derived_seq=table.c.change_seq,
+            rollup_pais=bindparam("pais"), rollup_ciudad=bindparam("ciudad"), rollup_edad=bindparam("edad"),
+        ),
+        [dict(zip(("uid", "pais", "ciudad", "edad"), (uid, *profiles[uid]))) for uid in uids],
+    )
+    return uids
+
+
+async def _apply_windows(db: AsyncSession, windows: Dict[str, int], profiles: Dict[str, analytics.Profile]) -> None:
+    """Resúmenes y rollups de los eventos con change_seq en (derived_seq, change_seq]."""
+    uids = sorted(windows)
+    changes = (await db.execute(
+        select(CycleEvent.user_id, CycleEvent.type, CycleEvent.date, CycleEvent.meta,
+               CycleEvent.created_seq, CycleEvent.deleted_at)
+        .join(CycleSyncState, CycleSyncState.user_id == CycleEvent.user_id)
+        .where(CycleEvent.user_id.in_(uids), CycleEvent.change_seq > CycleSyncState.derived_seq)
+    )).all()
+
+    deltas: Dict[str, Counter] = {uid: Counter() for uid in uids}
+    rebuild = set()
+    for row in changes:
+        try:
+            symptoms = analytics.symptom_histogram([(row.type, row.meta)])
+        except Exception as exc:
+            logger.error("Evento de %s sin analítica de síntomas (se salta): %s", row.user_id, exc)
+            symptoms = Counter()
+        if row.deleted_at is None:
+            deltas[row.user_id].update(symptoms)
+        else:
+            # Solo se descuenta si su alta ya estaba aplicada (NULL: anterior a esta cola)
+            if row.created_seq is None or row.created_seq <= windows[row.user_id]:
+                deltas[row.user_id].subtract(symptoms)
+            if row.type in summaries.PERIOD_TYPES:
+                rebuild.add(row.user_id)
+
+    before = await analytics.load_cycle_histograms(db, uids)
+    if len(uids) == 1 and not rebuild:
+        await summaries.apply_events(db, uids[0], [row for row in changes if row.deleted_at is None])
+    else:
+        await summaries.rebuild_users(db, uids)
+    after = await analytics.load_cycle_histograms(db, uids)
+    for uid in uids:
+        deltas[uid].update(after[uid])
+        deltas[uid].subtract(before[uid])
+    await analytics.record_many(db, deltas, profiles)
+
+
+async def refresh_predictions(db: AsyncSession, uid: str) -> None:
+    """Recalcula las predicciones guardadas del usuario y la del modelo por defecto (sin commit)."""
+    models = set((await db.execute(
+        select(CyclePrediction.model).where(CyclePrediction.user_id == uid)
+    )).scalars())
+    models.add(resolve_model("default"))
+    for model in sorted(models):
+        try:
+            await load_prediction(db, uid, model)
+        except PredictionError:
+            return  # sin inicios de periodo no hay nada que predecir
+
+
+def _payload(dates: Iterable[date]) -> Counter:
+    # Por mes: es lo que refresca la actualización en vivo, y acota la carga
+    return Counter(f"month:{d.year:04d}-{d.month:02d}" for d in dates)
+
+
+async def submit(uid: str, dates: Iterable[date]) -> None:
+    """Encola el trabajo derivado de una escritura ya confirmada en `dates`."""
+    await jobs.submit(DERIVE, uid, _payload(dates))
+
+
+async def ensure_derived(uid: str) -> None:
+    """Aplica ya lo pendiente del usuario, para lecturas de tablas derivadas."""
+    from app.db.session import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        if await derive_users(db, [uid]):
+            await db.commit()
+
+
+@jobs.handler(DERIVE)
+async def derive(uid: str, payload: Counter) -> None:
+    from app.db.session import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        await derive_users(db, [uid])
+        await refresh_predictions(db, uid)
+        await db.commit()
+
+    months = [date.fromisoformat(f"{field[len('month:'):]}-01") for field in payload if field.startswith("month:")]
+    if months and await live.watched(uid):
+        await live.push(uid, months)
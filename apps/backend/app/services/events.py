@@ -0,0 +1,127 @@
+import uuid
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import dialects
+from app.db.models import CycleEvent, CycleSyncState
+from app.schemas.cycles import CycleEventCreate
+
+_events_adapter = TypeAdapter(List[CycleEventCreate])
+
+
+def validate_events(raw: Sequence[Dict[str, Any]]) -> Tuple[Dict[int, CycleEventCreate], Dict[int, list]]:
+    """
+    Valida el lote en una sola llamada a pydantic-core.
+    Devuelve ({índice: evento válido}, {índice: errores}).
+    """
+    try:
+        return dict(enumerate(_events_adapter.validate_python(raw))), {}
+    except ValidationError as exc:
+        errors: Dict[int, list] = {}
+        for error in exc.errors(include_url=False, include_context=False):
+            index, *loc = error["loc"]
+            errors.setdefault(index, []).append({**error, "loc": loc})
+
+    valid = {
+        index: CycleEventCreate.model_validate(item)
+        for index, item in enumerate(raw)
+        if index not in errors
+    }
+    return valid, errors
+
+
+async def next_change_seq(db: AsyncSession, uid: str, count: int = 1) -> int:
+    """
+    Reserva `count` valores de la secuencia de cambios del usuario y devuelve el último.
+    El upsert bloquea la fila del usuario hasta el commit, así que las escrituras
+    concurrentes de un mismo usuario confirman en orden de secuencia y un cursor
+    de /cycle/sync nunca salta un cambio que aún no era visible.
+    """
+    stmt = dialects.insert(db, CycleSyncState).values(user_id=uid, change_seq=count)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id"],
+        set_={"change_seq": CycleSyncState.change_seq + count},
+    ).returning(CycleSyncState.change_seq)
+    return (await db.execute(stmt)).scalar_one()
+
+
+async def next_change_seqs(db: AsyncSession, counts: Dict[str, int]) -> Dict[str, int]:
+    """Como next_change_seq para varios usuarios en una sola sentencia (filas en orden de UID)."""
+    stmt = dialects.insert(db, CycleSyncState).values(
+        [{"user_id": uid, "change_seq": counts[uid]} for uid in sorted(counts)]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id"],
+        set_={"change_seq": CycleSyncState.change_seq + stmt.excluded.change_seq},
+    ).returning(CycleSyncState.user_id, CycleSyncState.change_seq)
+    return dict((await db.execute(stmt)).all())
+
+
+async def insert_events(db: AsyncSession, uid: str, events: Sequence[CycleEventCreate]) -> List[Tuple[int, bool]]:
+    """
+    Inserta los eventos con un único INSERT ... ON CONFLICT DO NOTHING RETURNING.
+    Devuelve (event_id, creado) alineado con `events`; no hace commit. Resúmenes,
+    rollups y predicciones los actualiza después el trabajo derivado (derived.submit).
+    """
+    keys = [event.idempotency_key or uuid.uuid4().hex for event in events]
+    rows = {}
+    for key, event in zip(keys, events):
+        # Una clave repetida dentro del mismo lote es un duplicado del primero
+        rows.setdefault(key, {
+            "user_id": uid,
+            "type": event.type,
+            "date": event.date,
+            "meta": event.meta,
+            "idempotency_key": key,
+        })
+    last_seq = await next_change_seq(db, uid, len(rows))
+    for seq, row in enumerate(rows.values(), start=last_seq - len(rows) + 1):
+        row["change_seq"] = row["created_seq"] = seq
+
+    stmt = (
+        dialects.insert(db, CycleEvent)
+        .values(list(rows.values()))
+        .on_conflict_do_nothing(index_elements=["user_id", "idempotency_key"])
+        .returning(CycleEvent.id, CycleEvent.idempotency_key)
+    )
+    created = {key: event_id for event_id, key in (await db.execute(stmt)).all()}
+
+    existing = {}
+    missing = [key for key in rows if key not in created]
+    if missing:
+        result = await db.execute(
+            select(CycleEvent.id, CycleEvent.idempotency_key).where(
+                CycleEvent.user_id == uid, CycleEvent.idempotency_key.in_(missing)
+            )
+        )
+        existing = {key: event_id for event_id, key in result.all()}
+
+    results, seen = [], set()
+    for key in keys:
+        if key in created and key not in seen:
+            results.append((created[key], True))
+        else:
+            results.append((created.get(key) or existing[key], False))
+        seen.add(key)
+    return results
+
+
+async def delete_event(db: AsyncSession, uid: str, event_id: int) -> Optional[Tuple[str, date]]:
+    """
+    Marca el evento como borrado (tombstone) con un nuevo change_seq para que
+    /cycle/sync lo propague. Devuelve (tipo, fecha) del evento o None si no existe; no hace
+    commit.
+    """
+    seq = await next_change_seq(db, uid)
+    result = await db.execute(
+        update(CycleEvent)
+        .where(CycleEvent.id == event_id, CycleEvent.user_id == uid, CycleEvent.deleted_at.is_(None))
+        .values(deleted_at=datetime.now(timezone.utc), change_seq=seq)
+        .returning(CycleEvent.type, CycleEvent.date)
+    )
+    deleted = result.first()
+    return tuple(deleted) if deleted is not None else None
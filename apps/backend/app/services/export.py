@@ -0,0 +1,271 @@
+"""
+Exportación de datos de usuario (portabilidad / RGPD): fila de `users`, eventos
+de ciclo y resúmenes.
+
+Los datos se leen con cursores del lado del servidor (yield_per) y pasan por un
+escritor incremental que devuelve bytes ya comprimidos tras cada lote, así que
+la memoria no depende del tamaño de la cuenta:
+
+- ndjson: una línea {"kind": ..., ...} por registro, comprimido con gzip.
+- csv: un zip con users.csv, cycle_events.csv y cycle_summaries.csv.
+
+Uso:
+    python -m app.services.export user <firebase_uid> [--format csv] [--out fichero]
+    python -m app.services.export all --out-dir exports [--chunk-size 1000] [--workers N]
+"""
+import argparse
+import asyncio
+import csv
+import io
+import os
+import time
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Iterable, List, Literal, Optional, Sequence, Tuple
+
+from pydantic_core import to_json
+from sqlalchemy import select, union
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import CycleEvent, CycleSummary
+from app.models.user import User
+
+Format = Literal["ndjson", "csv"]
+STREAM_BATCH_SIZE = 1000
+
+# (nombre de la sección, columnas) en el orden en que se exportan
+SECTIONS = {
+    "users": (User.id, User.firebase_uid, User.nombre, User.correo, User.ciudad, User.pais, User.direccion, User.edad),
+    "cycle_events": (CycleEvent.id, CycleEvent.user_id, CycleEvent.type, CycleEvent.date, CycleEvent.meta),
+    "cycle_summaries": (
+        CycleSummary.user_id, CycleSummary.start_date, CycleSummary.end_date,
+        CycleSummary.cycle_length, CycleSummary.average_length,
+    ),
+}
+FILENAMES = {"ndjson": "copa-uva-export.ndjson.gz", "csv": "copa-uva-export.zip"}
+MEDIA_TYPES = {"ndjson": "application/gzip", "csv": "application/zip"}
+
+
+def _queries(uids: Sequence[str]):
+    return {
+        "users": select(*SECTIONS["users"]).where(User.firebase_uid.in_(uids)).order_by(User.firebase_uid),
+        "cycle_events": (
+            select(*SECTIONS["cycle_events"])
+            .where(CycleEvent.user_id.in_(uids), CycleEvent.deleted_at.is_(None))
+            .order_by(CycleEvent.user_id, CycleEvent.date, CycleEvent.id)
+        ),
+        "cycle_summaries": (
+            select(*SECTIONS["cycle_summaries"])
+            .where(CycleSummary.user_id.in_(uids))
+            .order_by(CycleSummary.user_id, CycleSummary.start_date)
+        ),
+    }
+
+
+async def iter_sections(db: AsyncSession, uids: Sequence[str]) -> AsyncIterator[Tuple[str, List[tuple]]]:
+    """(sección, lote de filas) de todos los `uids`, sección por sección."""
+    for section, stmt in _queries(uids).items():
+        result = await db.stream(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for rows in result.partitions():
+            yield section, rows
+
+
+# --- Escritores incrementales ---
+
+class _Sink(io.RawIOBase):
+    """Destino no buscable para zipfile: acumula bytes hasta que se vacían con drain()."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class NdjsonGzipWriter:
+    def __init__(self):
+        self._gzip = zlib.compressobj(wbits=31)  # 16 + 15: cabecera y cola gzip
+
+    def write(self, section: str, rows: Iterable[tuple]) -> bytes:
+        kind = section[:-1] if section != "cycle_summaries" else "summary"
+        columns = [column.key for column in SECTIONS[section]]
+        data = b"".join(to_json({"kind": kind, **dict(zip(columns, row))}) + b"\n" for row in rows)
+        return self._gzip.compress(data)
+
+    def finish(self) -> bytes:
+        return self._gzip.flush()
+
+
+class CsvZipWriter:
+    def __init__(self):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, "w", compression=zipfile.ZIP_DEFLATED)
+        self._section: Optional[str] = None
+        self._text: Optional[io.TextIOWrapper] = None
+        self._csv = None
+
+    def _open(self, section: str) -> None:
+        self._close_entry()
+        entry = self._zip.open(f"{section}.csv", "w", force_zip64=True)
+        self._text = io.TextIOWrapper(entry, encoding="utf-8", newline="")
+        self._csv = csv.writer(self._text)
+        self._csv.writerow([column.key for column in SECTIONS[section]])
+        self._section = section
+
+    def _close_entry(self) -> None:
+        if self._text is not None:
+            self._text.close()  # cierra también la entrada del zip
+            self._text = None
+
+    def write(self, section: str, rows: Iterable[tuple]) -> bytes:
+        if section != self._section:
+            self._open(section)
+        self._csv.writerows(
+            [to_json(value).decode() if isinstance(value, (dict, list)) else value for value in row]
+            for row in rows
+        )
+        self._text.flush()
+        return self._sink.drain()
+
+    def finish(self) -> bytes:
+        for section in SECTIONS:
+            if self._section is None or list(SECTIONS).index(section) > list(SECTIONS).index(self._section):
+                self._open(section)  # secciones vacías también llevan su cabecera
+        self._close_entry()
+        self._zip.close()
+        return self._sink.drain()
+
+
+def writer_for(fmt: Format):
+    return CsvZipWriter() if fmt == "csv" else NdjsonGzipWriter()
+
+
+async def stream_export(uids: Sequence[str], fmt: Format) -> AsyncIterator[bytes]:
+    """Bytes del fichero de exportación, generados lote a lote en su propia sesión."""
+    from app.db.session import AsyncSessionLocal
+
+    writer = writer_for(fmt)
+    async with AsyncSessionLocal() as db:
+        async for section, rows in iter_sections(db, uids):
+            if chunk := writer.write(section, rows):
+                yield chunk
+    yield writer.finish()
+
+
+# --- CLI ---
+
+async def _export_to_file(uids: Sequence[str], fmt: Format, path: str) -> None:
+    with open(path, "wb") as f:
+        async for chunk in stream_export(uids, fmt):
+            f.write(chunk)
+
+
+async def _uid_chunks(chunk_size: int) -> AsyncIterator[List[str]]:
+    """Keyset sobre todos los UID con fila en users o con eventos."""
+    from app.db.session import AsyncSessionLocal
+
+    last = ""
+    async with AsyncSessionLocal() as db:
+        while True:
+            # Cada rama con su propio ORDER BY/LIMIT: el índice corta en `chunk_size` filas
+            users = (
+                select(User.firebase_uid.label("uid")).where(User.firebase_uid > last)
+                .order_by(User.firebase_uid).limit(chunk_size).subquery()
+            )
+            events = (
+                select(CycleEvent.user_id.label("uid")).distinct().where(CycleEvent.user_id > last)
+                .order_by(CycleEvent.user_id).limit(chunk_size).subquery()
+            )
+            branches = union(select(users.c.uid), select(events.c.uid)).subquery()
+            uids = (await db.execute(
+                select(branches.c.uid).order_by(branches.c.uid).limit(chunk_size)
+            )).scalars().all()
+            if not uids:
+                return
+            yield list(uids)
+            last = uids[-1]
+
+
+def _export_chunk(uids: List[str], fmt: Format, path: str) -> int:
+    """Se ejecuta en un proceso del pool, con su propio event loop y conexiones."""
+    from app.db.session import async_engine
+
+    async def run():
+        try:
+            await _export_to_file(uids, fmt, path)
+        finally:
+            await async_engine.dispose()
+
+    asyncio.run(run())
+    return len(uids)
+
+
+async def export_all(out_dir: str, fmt: Format, chunk_size: int, workers: int) -> int:
+    from app.db.session import async_engine, dispose_inherited_pools
+
+    os.makedirs(out_dir, exist_ok=True)
+    extension = FILENAMES[fmt].split(".", 1)[1]
+    started = time.perf_counter()
+    total, pending = 0, set()
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=workers, initializer=dispose_inherited_pools) as pool:
+        index = 0
+        async for uids in _uid_chunks(chunk_size):
+            index += 1
+            path = os.path.join(out_dir, f"users-{index:05d}.{extension}")
+            pending.add(loop.run_in_executor(pool, _export_chunk, uids, fmt, path))
+            if len(pending) >= 2 * workers:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                total += sum(task.result() for task in done)
+                print(f"✅ {total} usuarios exportados")
+        if pending:
+            done, _ = await asyncio.wait(pending)
+            total += sum(task.result() for task in done)
+    await async_engine.dispose()
+    print(f"✅ {total} usuarios en {index} ficheros ({out_dir}) en {time.perf_counter() - started:.1f} s")
+    return total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Exportación de datos de usuario")
+    sub = parser.add_subparsers(dest="command", required=True)
+    one = sub.add_parser("user", help="Exporta un usuario")
+    one.add_argument("uid")
+    one.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    one.add_argument("--out", help="Fichero de salida (por defecto <uid>.<extensión>)")
+    everyone = sub.add_parser("all", help="Exporta todos los usuarios en bloques paralelos")
+    everyone.add_argument("--out-dir", default="exports")
+    everyone.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    everyone.add_argument("--chunk-size", type=int, default=1000, help="Usuarios por fichero")
+    everyone.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    if args.command == "user":
+        from app.db.session import async_engine
+
+        out = args.out or f"{args.uid}.{FILENAMES[args.format].split('.', 1)[1]}"
+
+        async def run():
+            try:
+                await _export_to_file([args.uid], args.format, out)
+            finally:
+                await async_engine.dispose()
+
+        asyncio.run(run())
+        print(f"✅ Exportación en {out}")
+    else:
+        asyncio.run(export_all(args.out_dir, args.format, args.chunk_size, args.workers))
+
+
+if __name__ == "__main__":
+    main()
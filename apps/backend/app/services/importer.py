@@ -0,0 +1,452 @@
+"""
+Importación masiva de usuarios y eventos históricos desde JSONL o CSV.
+
+- El fichero se parte en tantos tramos de bytes (alineados a línea) como
+  workers; cada tramo se procesa en un proceso del pool con su propio event
+  loop y sus propias conexiones, leyendo línea a línea (generador).
+- Las filas se validan por lotes con UserCreate / CycleEventCreate; cada fila
+  inválida va al informe de errores con su offset en bytes, la fila original y
+  los errores de validación o de carga.
+- Usuarios: upsert multi-fila por lote (upsert_users); si el lote choca con un
+  correo de otra cuenta se reintenta fila a fila para aislar las culpables.
+  Tras el commit, en otra transacción, se mueven los rollups de los perfiles
+  que cambiaron (derived.derive_users).
+- Eventos: COPY a una tabla temporal + INSERT ... ON CONFLICT DO NOTHING en
+  PostgreSQL, INSERT multi-fila en otros motores. Solo las filas insertadas
+  reciben change_seq (reimportar no toca la secuencia de nadie). Tras el
+  commit se aplica el trabajo derivado de los usuarios afectados (resúmenes y
+  rollups, derived.derive_users) de una vez para el lote, o usuario a usuario si
+  falla; un usuario que no se puede derivar va al informe y queda pendiente.
+- Reanudable: tras cada commit el tramo guarda su offset en `<fichero>.import/`.
+  Los eventos sin idempotency_key reciben una derivada de su contenido, así
+  que repetir un lote ya confirmado (caída entre el commit y el checkpoint) no
+  duplica nada.
+
+En CSV las filas no pueden contener saltos de línea dentro de un campo; el meta
+de los eventos va como JSON en su columna. El UID del evento se lee de
+`user_id` o `firebase_uid`.
+
+Uso:
+    python -m app.services.importer users usuarios.jsonl [--workers N] [--batch-size N]
+    python -m app.services.importer events eventos.csv [--workers N] [--restart]
+"""
+import argparse
+import asyncio
+import csv
+import glob
+import hashlib
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from pydantic import ValidationError
+from pydantic_core import to_json
+from sqlalchemy import bindparam, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import cache
+from app.db import dialects
+from app.db.models import CycleEvent
+from app.schemas.cycles import CycleEventCreate
+from app.schemas.users import UserCreate
+from app.services import derived
+from app.services.events import next_change_seqs, validate_events
+from app.services.users import profile_changes, upsert_users, user_row
+
+KINDS = ("users", "events")
+INSERT_CHUNK_SIZE = 1000  # filas por INSERT multi-fila fuera de PostgreSQL
+EVENT_COLUMNS = ("user_id", "type", "date", "meta", "idempotency_key")
+
+# (offset de la línea, registro ya decodificado o None, error de lectura o None)
+Record = Tuple[int, Optional[Dict[str, Any]], Optional[str]]
+
+
+# --- Lectura por tramos ---
+
+def file_format(path: str) -> str:
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def split_ranges(path: str, workers: int) -> Tuple[List[str], List[Tuple[int, int]]]:
+    """Cabecera CSV (si la hay) y tramos [inicio, fin) alineados a comienzo de línea."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header: List[str] = []
+        if file_format(path) == "csv":
+            header = next(csv.reader([f.readline().decode("utf-8-sig")]), [])
+        start = f.tell()
+        bounds = [start]
+        for i in range(1, workers):
+            f.seek(max(start, size * i // workers))
+            f.readline()
+            bounds.append(max(bounds[-1], min(f.tell(), size)))
+    bounds.append(size)
+    ranges = [(lo, hi) for lo, hi in zip(bounds, bounds[1:]) if hi > lo]
+    return header, ranges
+
+
+def read_records(path: str, header: Sequence[str], start: int, end: int) -> Iterator[Record]:
+    """Genera los registros del tramo sin cargarlo en memoria."""
+    csv_format = file_format(path) == "csv"
+    with open(path, "rb") as f:
+        f.seek(start)
+        offset = start
+        while offset < end:
+            line = f.readline()
+            if not line:
+                break
+            line_offset, offset = offset, offset + len(line)
+            text = line.decode("utf-8", errors="replace").strip()
+            if not text:
+                continue
+            try:
+                if csv_format:
+                    values = next(csv.reader([text]))
+                    record = {column: value or None for column, value in zip(header, values)}
+                else:
+                    record = json.loads(text)
+                    if not isinstance(record, dict):
+                        raise ValueError("se esperaba un objeto JSON")
+                yield line_offset, record, None
+            except ValueError as exc:
+                yield line_offset, None, str(exc)
+
+
+# --- Validación ---
+
+def _error(offset: int, record: Any, errors: Any) -> dict:
+    return {"offset": offset, "row": record, "errors": errors}
+
+
+def validate_users(batch: Sequence[Record]) -> Tuple[List[Tuple[int, UserCreate]], List[dict]]:
+    valid, errors = [], []
+    for offset, record, problem in batch:
+        if problem:
+            errors.append(_error(offset, None, problem))
+            continue
+        try:
+            valid.append((offset, UserCreate.model_validate(record)))
+        except ValidationError as exc:
+            errors.append(_error(offset, record, exc.errors(include_url=False, include_context=False)))
+    return valid, errors
+
+
+def validate_event_rows(batch: Sequence[Record]) -> Tuple[List[Tuple[int, str, CycleEventCreate]], List[dict]]:
+    """Valida el lote de una vez con validate_events; el meta de CSV llega como texto JSON."""
+    candidates, errors = [], []
+    for offset, record, problem in batch:
+        if problem:
+            errors.append(_error(offset, None, problem))
+            continue
+        uid = record.get("user_id") or record.get("firebase_uid")
+        if not uid:
+            errors.append(_error(offset, record, "falta user_id / firebase_uid"))
+            continue
+        try:
+            meta = record.get("meta")
+            fields = {**record, "meta": json.loads(meta) if isinstance(meta, str) else meta}
+        except ValueError as exc:
+            errors.append(_error(offset, record, f"meta no es JSON válido: {exc}"))
+            continue
+        candidates.append((offset, str(uid), record, fields))
+
+    valid_events, invalid = validate_events([fields for _, _, _, fields in candidates])
+    valid = []
+    for index, (offset, uid, record, _) in enumerate(candidates):
+        if index in invalid:
+            errors.append(_error(offset, record, invalid[index]))
+        else:
+            valid.append((offset, uid, valid_events[index]))
+    return valid, errors
+
+
+# --- Carga ---
+
+def import_key(uid: str, event: CycleEventCreate) -> str:
+    """Clave de idempotencia derivada del contenido: reimportar no duplica."""
+    digest = hashlib.sha1(to_json([uid, event.type, event.date, event.meta])).hexdigest()
+    return f"import:{digest}"
+
+
+async def load_users(db: AsyncSession, users: Sequence[Tuple[int, UserCreate]]) -> Tuple[List[Any], List[dict]]:
+    """Devuelve las filas guardadas (upsert_users) y los errores de carga."""
+    rows = [user_row(user.firebase_uid, user.model_dump()) for _, user in users]
+    try:
+        saved = await upsert_users(db, rows)
+        await db.commit()
+        errors = []
+    except IntegrityError:
+        await db.rollback()
+
+        # Un correo de otra cuenta invalida el lote entero: fila a fila para aislarlo
+        saved, errors = [], []
+        for (offset, user), row in zip(users, rows):
+            try:
+                saved += await upsert_users(db, [row])
+                await db.commit()
+            except IntegrityError as exc:
+                await db.rollback()
+                errors.append(_error(offset, user.model_dump(), f"conflicto al guardar: {exc.orig}"))
+
+    # Perfiles confirmados que pueden haber cambiado: sus rollups se mueven aparte
+    moved = {row.firebase_uid for row in saved} & set(profile_changes(rows))
+    errors += await derive(db, {
+        user.firebase_uid: (offset, user.model_dump()) for offset, user in users if user.firebase_uid in moved
+    }, "perfil guardado, rollups sin actualizar")
+    return saved, errors
+
+
+async def derive(db: AsyncSession, users: Dict[str, Tuple[int, Any]], problem: str) -> List[dict]:
+    """
+    Trabajo derivado (derived.derive_users) de lo ya confirmado, en su propia
+    transacción: aquí no hay cola que lo haga. Primero todo el lote; si falla,
+    usuario a usuario, y cada fallo va al informe con `users[uid]` = (offset,
+    fila). Lo que no se aplica queda pendiente para el siguiente trabajo del usuario.
+    """
+    if not users:
+        return []
+    try:
+        await derived.derive_users(db, sorted(users))
+        await db.commit()
+        return []
+    except Exception:
+        await db.rollback()
+
+    errors = []
+    for uid in sorted(users):
+        try:
+            await derived.derive_users(db, [uid])
+            await db.commit()
+        except Exception as exc:
+            await db.rollback()
+            offset, record = users[uid]
+            errors.append(_error(offset, record, f"{problem}: {exc}"))
+    return errors
+
+
+async def _insert_copy(db: AsyncSession, rows: List[dict]) -> List[Tuple[int, str]]:
+    columns = ", ".join(EVENT_COLUMNS)
+    connection = await db.connection()
+    raw = (await connection.get_raw_connection()).driver_connection
+    # Solo las columnas cargadas: LIKE copiaría el NOT NULL de id y el COPY fallaría
+    await raw.execute(
+        f"CREATE TEMP TABLE cycle_events_load ON COMMIT DROP AS "
+        f"SELECT {columns} FROM cycle_events WITH NO DATA"
+    )
+    await raw.copy_records_to_table(
+        "cycle_events_load",
+        records=[
+            tuple(json.dumps(row[c]) if c == "meta" and row[c] is not None else row[c] for c in EVENT_COLUMNS)
+            for row in rows
+        ],
+        columns=list(EVENT_COLUMNS),
+    )
+    created = await raw.fetch(
+        f"INSERT INTO cycle_events ({columns}) SELECT {columns} FROM cycle_events_load "
+        "ON CONFLICT (user_id, idempotency_key) DO NOTHING RETURNING id, user_id"
+    )
+    return [(row["id"], row["user_id"]) for row in created]
+
+
+async def _insert_rows(db: AsyncSession, rows: List[dict]) -> List[Tuple[int, str]]:
+    created = []
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        stmt = (
+            dialects.insert(db, CycleEvent)
+            .values(rows[start:start + INSERT_CHUNK_SIZE])
+            .on_conflict_do_nothing(index_elements=["user_id", "idempotency_key"])
+            .returning(CycleEvent.id, CycleEvent.user_id)
+        )
+        created.extend((await db.execute(stmt)).all())
+    return created
+
+
+async def _number(db: AsyncSession, created: Sequence[Tuple[int, str]]) -> None:
+    """change_seq consecutivos por usuario, reservados en una sola sentencia, solo para las filas insertadas."""
+    counts = Counter(uid for _, uid in created)
+    last_seqs = await next_change_seqs(db, counts)
+    next_seq = {uid: last_seqs[uid] - count + 1 for uid, count in counts.items()}
+    params = []
+    for event_id, uid in sorted(created):
+        params.append({"event_id": event_id, "uid": uid, "seq": next_seq[uid]})
+        next_seq[uid] += 1
+    table = CycleEvent.__table__
+    await db.execute(
+        update(table)
+        .where(table.c.id == bindparam("event_id"), table.c.user_id == bindparam("uid"))
+        .values(change_seq=bindparam("seq"), created_seq=bindparam("seq")),
+        params,
+    )
+
+
+async def load_events(
+    db: AsyncSession, events: Sequence[Tuple[int, str, CycleEventCreate]],
+) -> Tuple[int, List[str], List[dict]]:
+    """Inserta el lote y después aplica sus derivados; devuelve (creados, UIDs afectados, errores)."""
+    rows: Dict[Tuple[str, str], dict] = {}
+    first_offset: Dict[str, int] = {}
+    for offset, uid, event in events:
+        key = event.idempotency_key or import_key(uid, event)
+        first_offset.setdefault(uid, offset)
+        rows.setdefault((uid, key), {
+            "user_id": uid, "type": event.type, "date": event.date,
+            "meta": event.meta, "idempotency_key": key,
+        })
+    if not rows:
+        return 0, [], []
+
+    # Primero el INSERT: los duplicados descartados no consumen change_seq
+    values = list(rows.values())
+    postgres = db.bind.dialect.name == "postgresql"
+    created = await (_insert_copy(db, values) if postgres else _insert_rows(db, values))
+    if created:
+        await _number(db, created)
+    await db.commit()
+
+    uids = sorted({uid for _, uid in created})
+    errors = await derive(
+        db, {uid: (first_offset[uid], {"user_id": uid}) for uid in uids}, "eventos guardados, derivados pendientes",
+    )
+    return len(created), uids, errors
+
+
+# --- Tramos, checkpoints e informe de errores ---
+
+def _write_json(path: str, data: dict) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+async def _import_range(
+    kind: str, path: str, header: List[str], start: int, end: int, state_dir: str, index: int, batch_size: int,
+) -> dict:
+    from app.db.session import AsyncSessionLocal
+
+    checkpoint_path = os.path.join(state_dir, f"chunk-{index:03d}.json")
+    state = {"start": start, "end": end, "offset": start, "rows": 0, "loaded": 0, "errors": 0}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            state = json.load(f)
+    if state["offset"] >= end:
+        return state
+
+    async def flush(batch: List[Record], resume_at: int, db: AsyncSession, report) -> None:
+        if kind == "users":
+            valid, errors = validate_users(batch)
+            saved, load_errors = await load_users(db, valid) if valid else ([], [])
+            loaded = len(saved)
+            # Un usuario recién creado no tiene nada en caché que invalidar
+            touched = [row.firebase_uid for row in saved if row.created is not True]
+        else:
+            valid, errors = validate_event_rows(batch)
+            loaded, touched, load_errors = await load_events(db, valid) if valid else (0, [], [])
+        for uid in touched:
+            await cache.bump(uid)
+        errors = sorted(errors + load_errors, key=lambda error: error["offset"])
+        report.writelines(json.dumps(error, default=str, ensure_ascii=False) + "\n" for error in errors)
+        report.flush()
+        state.update(
+            offset=resume_at,
+            rows=state["rows"] + len(batch),
+            loaded=state["loaded"] + loaded,
+            errors=state["errors"] + len(errors),
+        )
+        _write_json(checkpoint_path, state)
+
+    batch: List[Record] = []
+    with open(os.path.join(state_dir, f"errors-{index:03d}.jsonl"), "a") as report:
+        async with AsyncSessionLocal() as db:
+            for record in read_records(path, header, state["offset"], end):
+                # El offset de reanudación es el de la primera fila aún no confirmada
+                if len(batch) >= batch_size:
+                    await flush(batch, record[0], db, report)
+                    batch = []
+                batch.append(record)
+            if batch:
+                await flush(batch, end, db, report)
+    if state["offset"] < end:
+        state["offset"] = end
+        _write_json(checkpoint_path, state)
+    return state
+
+
+def import_range(*args) -> dict:
+    """Se ejecuta en un proceso del pool, con su propio event loop y conexiones."""
+    from app.db.session import async_engine
+
+    async def run():
+        try:
+            return await _import_range(*args)
+        finally:
+            await async_engine.dispose()
+
+    return asyncio.run(run())
+
+
+def run(kind: str, path: str, workers: int, batch_size: int, restart: bool = False) -> dict:
+    from app.db.session import dispose_inherited_pools
+
+    started = time.perf_counter()
+    state_dir = f"{path}.import"
+    manifest_path = os.path.join(state_dir, "manifest.json")
+    stat = os.stat(path)
+    identity = {"kind": kind, "size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+    if restart and os.path.isdir(state_dir):
+        for name in glob.glob(os.path.join(state_dir, "*")):
+            os.remove(name)
+    os.makedirs(state_dir, exist_ok=True)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if {k: manifest[k] for k in identity} != identity:
+            raise SystemExit(f"❌ {path} cambió desde la importación anterior; usa --restart")
+        print(f"↩️  Reanudando {path} ({len(manifest['ranges'])} tramos)")
+    else:
+        header, ranges = split_ranges(path, workers)
+        manifest = {**identity, "header": header, "ranges": ranges}
+        _write_json(manifest_path, manifest)
+
+    jobs = [
+        (kind, path, manifest["header"], start, end, state_dir, index, batch_size)
+        for index, (start, end) in enumerate(manifest["ranges"])
+    ]
+    with ProcessPoolExecutor(max_workers=workers, initializer=dispose_inherited_pools) as pool:
+        states = list(pool.map(import_range, *zip(*jobs))) if jobs else []
+
+    # Informe único con los errores de todos los tramos
+    report_path = os.path.join(state_dir, "errors.jsonl")
+    with open(report_path, "w") as report:
+        for name in sorted(glob.glob(os.path.join(state_dir, "errors-*.jsonl"))):
+            with open(name) as f:
+                report.writelines(f)
+
+    totals = {key: sum(state[key] for state in states) for key in ("rows", "loaded", "errors")}
+    print(
+        f"✅ {totals['rows']} filas leídas, {totals['loaded']} cargadas, {totals['errors']} con errores "
+        f"en {time.perf_counter() - started:.1f} s"
+    )
+    if totals["errors"]:
+        print(f"⚠️  Informe de errores: {report_path}")
+    return totals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Importación masiva (JSONL / CSV)")
+    parser.add_argument("kind", choices=KINDS)
+    parser.add_argument("path", help="Fichero .jsonl o .csv")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Tramos del fichero en paralelo")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Filas por lote y transacción")
+    parser.add_argument("--restart", action="store_true", help="Descarta los checkpoints y empieza de cero")
+    args = parser.parse_args()
+    run(args.kind, args.path, args.workers, args.batch_size, args.restart)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,468 @@
+"""
+Cola de trabajos en segundo plano (JOBS=memory|redis|off).
+
+Un trabajo es un (tipo, clave) —normalmente un UID— con una carga de contadores
+(Counter[str, int]). Encolar el mismo (tipo, clave) mientras espera suma las
+cargas en vez de añadir otro trabajo, y cada trabajo espera JOBS_COALESCE_DELAY
+desde su primer encolado antes de estar listo: diez eventos seguidos de un
+usuario producen un solo recálculo.
+
+- Exclusión: un mismo (tipo, clave) nunca se ejecuta en dos workers a la vez; lo
+  que se encola mientras se ejecuta queda listo al terminar.
+- Reintentos: si el handler falla se reprograma con espera exponencial
+  (JOBS_RETRY_DELAY, el doble en cada intento) y tras JOBS_MAX_ATTEMPTS pasa a
+  la lista de fallidos. La entrega es al menos una vez: los handlers tienen que
+  ser idempotentes.
+- Si la cola no responde al encolar, el trabajo se ejecuta en el acto; su fallo
+  se registra pero nunca llega a la petición, cuya escritura ya está confirmada.
+
+El backend `memory` vive en el proceso de la API (JOBS_WORKERS tareas asyncio) y
+es el sustituto local para desarrollo y tests; lo pendiente se vacía al parar.
+Con `redis` la cola es compartida y los workers pueden ir también aparte:
+
+Uso: python -m app.services.jobs worker [--concurrency N] [--processes P]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import signal
+import time
+import uuid
+from collections import Counter, deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "cu:jobs"
+POLL_INTERVAL = 0.1  # segundos entre consultas de un worker sin trabajo
+DEAD_LETTERS = 1000  # trabajos fallidos que se conservan para inspección
+
+Handler = Callable[[str, Counter], Awaitable[None]]
+
+
+class Job:
+    __slots__ = ("kind", "key", "payload", "attempts", "handle")
+
+    def __init__(self, kind: str, key: str, payload: Counter, attempts: int = 1, handle: Any = None):
+        self.kind = kind
+        self.key = key
+        self.payload = payload
+        self.attempts = attempts
+        self.handle = handle
+
+    @property
+    def member(self) -> str:
+        return f"{self.kind}:{self.key}"
+
+
+def _split(member: Any) -> List[str]:
+    member = member.decode() if isinstance(member, bytes) else member
+    return member.split(":", 1)
+
+
+class MemoryBackend:
+    """Cola en el proceso: un dict de cargas pendientes y su hora de vencimiento."""
+
+    def __init__(self):
+        self._pending: Dict[str, Counter] = {}
+        self._due: Dict[str, float] = {}
+        self._running: Dict[str, Job] = {}
+        self._attempts: Dict[str, int] = {}
+        self.dead: deque = deque(maxlen=DEAD_LETTERS)
+
+    async def enqueue(self, kind: str, key: str, payload: Counter, due: float) -> None:
+        member = f"{kind}:{key}"
+        self._pending.setdefault(member, Counter()).update(payload)
+        self._due.setdefault(member, due)
+
+    async def claim(self, limit: int, now: float) -> List[Job]:
+        ready = sorted(
+            (due, member) for member, due in self._due.items()
+            if due <= now and member not in self._running
+        )[:limit]
+        jobs = []
+        for _, member in ready:
+            del self._due[member]
+            self._attempts[member] = self._attempts.get(member, 0) + 1
+            job = Job(*_split(member), self._pending.pop(member), self._attempts[member])
+            self._running[member] = job
+            jobs.append(job)
+        return jobs
+
+    async def ack(self, job: Job) -> None:
+        del self._running[job.member]
+        self._attempts.pop(job.member, None)
+        if job.member in self._due:
+            self._due[job.member] = time.time()  # lo encolado mientras se ejecutaba
+
+    async def retry(self, job: Job, due: float) -> None:
+        del self._running[job.member]
+        job.payload.update(self._pending.get(job.member, Counter()))
+        self._pending[job.member] = job.payload
+        self._due[job.member] = due
+
+    async def bury(self, job: Job, error: str) -> None:
+        self.dead.append({"kind": job.kind, "key": job.key, "payload": dict(job.payload), "error": error})
+        await self.ack(job)
+
+    async def size(self) -> int:
+        return len(self._due) + len(self._running)
+
+
+class RedisBackend:
+    """
+    - `cu:jobs:due`: ZSET de trabajos pendientes por hora de vencimiento.
+    - `cu:jobs:p:<tipo>:<clave>`: HASH con la carga pendiente (HINCRBY la fusiona).
+    - `cu:jobs:r:<tipo>:<clave>`: carga en ejecución; sobrevive a la caída del worker.
+    - `cu:jobs:l:<tipo>:<clave>`: cerrojo con caducidad JOBS_LEASE.
+
+    Al reclamar, el vencimiento se aplaza JOBS_LEASE segundos: si el worker cae,
+    el trabajo vuelve a estar listo cuando caduca su cerrojo y el siguiente
+    funde la carga pendiente con la que quedó en ejecución.
+    """
+
+    def __init__(self, redis: Any, lease: float = 60.0):
+        self.redis = redis
+        self.lease = lease
+        self.due = f"{PREFIX}:due"
+        self.attempts = f"{PREFIX}:attempts"
+        self.dead = f"{PREFIX}:dead"
+
+    def _key(self, part: str, member: str) -> str:
+        return f"{PREFIX}:{part}:{member}"
+
+    async def enqueue(self, kind: str, key: str, payload: Counter, due: float) -> None:
+        member = f"{kind}:{key}"
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for field, count in payload.items():
+                pipe.hincrby(self._key("p", member), field, count)
+            pipe.zadd(self.due, {member: due}, nx=True)
+            await pipe.execute()
+
+    async def claim(self, limit: int, now: float) -> List[Job]:
+        members = await self.redis.zrangebyscore(self.due, "-inf", now, start=0, num=limit)
+        jobs = []
+        for member in members:
+            job = await self._take(member.decode() if isinstance(member, bytes) else member)
+            if job is not None:
+                jobs.append(job)
+        return jobs
+
+    async def _take(self, member: str) -> Optional[Job]:
+        token = uuid.uuid4().hex
+        if not await self.redis.set(self._key("l", member), token, nx=True, px=int(self.lease * 1000)):
+            return None  # en ejecución en otro worker
+        if await self.redis.zadd(self.due, {member: time.time() + self.lease}, xx=True, ch=True) == 0:
+            await self.redis.delete(self._key("l", member))  # otro worker lo terminó entretanto
+            return None
+        await self._fold(member)
+        try:
+            await self.redis.rename(self._key("p", member), self._key("t", member))
+        except Exception as exc:
+            if "no such key" not in str(exc).lower():
+                raise
+        await self._fold(member)
+        payload = Counter({
+            field.decode(): int(count)
+            for field, count in (await self.redis.hgetall(self._key("r", member))).items()
+        })
+        attempts = await self.redis.hincrby(self.attempts, member, 1)
+        return Job(*_split(member), payload, attempts, token)
+
+    async def _fold(self, member: str) -> None:
+        """Suma la carga apartada (`t`) a la de ejecución (`r`) en una transacción."""
+        moved = await self.redis.hgetall(self._key("t", member))
+        if not moved:
+            return
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for field, count in moved.items():
+                pipe.hincrby(self._key("r", member), field, int(count))
+            pipe.delete(self._key("t", member))
+            await pipe.execute()
+
+    async def _finish(self, job: Job, due: Optional[float] = None, dead: Optional[str] = None) -> None:
+        """
+        Suelta el trabajo: si `due` lo reprograma conservando su carga; si no, la
+        borra y deja listo lo encolado mientras se ejecutaba. WATCH sobre la carga
+        pendiente evita perder un encolado concurrente.
+        """
+        from redis.exceptions import WatchError
+
+        lock, pending = self._key("l", job.member), self._key("p", job.member)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(lock, pending)
+                    if (await pipe.get(lock) or b"").decode() != job.handle:
+                        return  # cerrojo caducado: el trabajo ya es de otro worker
+                    has_pending = await pipe.exists(pending)
+                    pipe.multi()
+                    if due is not None:
+                        pipe.zadd(self.due, {job.member: due})
+                    else:
+                        pipe.delete(self._key("r", job.member))
+                        pipe.hdel(self.attempts, job.member)
+                        if has_pending:
+                            pipe.zadd(self.due, {job.member: time.time()})
+                        else:
+                            pipe.zrem(self.due, job.member)
+                    if dead is not None:
+                        pipe.lpush(self.dead, dead)
+                        pipe.ltrim(self.dead, 0, DEAD_LETTERS - 1)
+                    pipe.delete(lock)
+                    await pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+    async def ack(self, job: Job) -> None:
+        await self._finish(job)
+
+    async def retry(self, job: Job, due: float) -> None:
+        await self._finish(job, due=due)
+
+    async def bury(self, job: Job, error: str) -> None:
+        entry = {"kind": job.kind, "key": job.key, "payload": dict(job.payload), "error": error}
+        await self._finish(job, dead=json.dumps(entry))
+
+    async def size(self) -> int:
+        return await self.redis.zcard(self.due)
+
+
+class JobQueue:
+    def __init__(
+        self,
+        backend: Optional[Any],
+        workers: int = 2,
+        coalesce_delay: float = 0.25,
+        max_attempts: int = 5,
+        retry_delay: float = 1.0,
+        retry_after: float = 5.0,
+    ):
+        self.backend = backend
+        self.workers = workers
+        self.coalesce_delay = coalesce_delay
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.retry_after = retry_after
+        self._down_until = 0.0
+        self.handlers: Dict[str, Handler] = {}
+        self._tasks: List[asyncio.Task] = []
+        self.enqueued = 0
+        self.inline = 0
+        self.inline_failed = 0
+        self.done = 0
+        self.retried = 0
+        self.buried = 0
+        self.errors = 0
+
+    # --- Cola con "circuit breaker" ---
+
+    def _available(self) -> bool:
+        return self.backend is not None and time.monotonic() >= self._down_until
+
+    def _failed(self, exc: Exception) -> None:
+        self.errors += 1
+        self._down_until = time.monotonic() + self.retry_after
+        logger.warning("Cola de trabajos no disponible, ejecutando en línea: %s", exc)
+
+    def handler(self, kind: str) -> Callable[[Handler], Handler]:
+        def register(fn: Handler) -> Handler:
+            self.handlers[kind] = fn
+            return fn
+        return register
+
+    async def submit(self, kind: str, key: str, payload: Optional[Counter] = None) -> None:
+        """Encola el trabajo (fusionándolo con uno pendiente); sin cola, lo ejecuta ya."""
+        payload = payload or Counter()
+        if self._available():
+            try:
+                await self.backend.enqueue(kind, key, payload, time.time() + self.coalesce_delay)
+                self.enqueued += 1
+                return
+            except Exception as exc:
+                self._failed(exc)
+        self.inline += 1
+        try:
+            await self.handlers[kind](key, payload)
+        except Exception as exc:
+            # La escritura ya está confirmada: un 5xx haría que el cliente la repitiera
+            self.inline_failed += 1
+            logger.error("Trabajo %s:%s en línea fallido: %s", kind, key, exc)
+
+    async def run(self, job: Job) -> None:
+        try:
+            await self.handlers[job.kind](job.key, job.payload)
+        except asyncio.CancelledError:
+            await self.backend.retry(job, time.time())
+            raise
+        except Exception as exc:
+            if job.attempts >= self.max_attempts:
+                logger.error("Trabajo %s descartado tras %d intentos: %s", job.member, job.attempts, exc)
+                self.buried += 1
+                await self.backend.bury(job, repr(exc))
+            else:
+                logger.warning("Trabajo %s fallido (intento %d), se reintentará: %s", job.member, job.attempts, exc)
+                self.retried += 1
+                await self.backend.retry(job, time.time() + self.retry_delay * 2 ** (job.attempts - 1))
+            return
+        self.done += 1
+        await self.backend.ack(job)
+
+    async def _work(self) -> None:
+        while True:
+            jobs = []
+            if self._available():
+                try:
+                    jobs = await self.backend.claim(1, time.time())
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:
+                    self._failed(exc)
+            if not jobs:
+                await asyncio.sleep(POLL_INTERVAL)
+            for job in jobs:
+                try:
+                    await self.run(job)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:
+                    # ack/retry/bury no llegaron a la cola: el cerrojo caduca y el
+                    # trabajo vuelve tras JOBS_LEASE; el worker sigue vivo
+                    logger.error("Trabajo %s sin confirmar: %s", job.member, exc)
+                    self._failed(exc)
+
+    async def drain(self) -> int:
+        """Ejecuta ya todo lo pendiente, sin esperar vencimientos; devuelve los trabajos."""
+        count = 0
+        while jobs := await self.backend.claim(100, float("inf")):
+            for job in jobs:
+                await self.run(job)
+            count += len(jobs)
+        return count
+
+    def start(self, workers: Optional[int] = None) -> None:
+        if self.backend is None or self._tasks:
+            return
+        for i in range(self.workers if workers is None else workers):
+            self._tasks.append(asyncio.create_task(self._work(), name=f"jobs-worker-{i}"))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        if isinstance(self.backend, MemoryBackend):
+            await self.drain()  # nada pendiente sobrevive al proceso
+
+    def stats(self) -> dict:
+        return {
+            "enqueued": self.enqueued,
+            "inline": self.inline,
+            "inline_failed": self.inline_failed,
+            "done": self.done,
+            "retried": self.retried,
+            "buried": self.buried,
+            "errors": self.errors,
+        }
+
+
+def _build() -> JobQueue:
+    if settings.JOBS == "redis":
+        import redis.asyncio as aioredis
+
+        backend = RedisBackend(
+            aioredis.from_url(
+                settings.REDIS_URL,
+                socket_timeout=settings.REDIS_TIMEOUT,
+                socket_connect_timeout=settings.REDIS_TIMEOUT,
+            ),
+            settings.JOBS_LEASE,
+        )
+    elif settings.JOBS == "memory":
+        backend = MemoryBackend()
+    else:
+        backend = None
+    return JobQueue(
+        backend, settings.JOBS_WORKERS, settings.JOBS_COALESCE_DELAY, settings.JOBS_MAX_ATTEMPTS,
+        settings.JOBS_RETRY_DELAY,
+    )
+
+
+jobs = _build()
+
+
+# --- Workers fuera de la API ---
+
+async def _serve(concurrency: int) -> None:
+    from app.db.session import async_engine
+    from app.services import derived  # noqa: F401  registra los handlers
+
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        asyncio.get_running_loop().add_signal_handler(signum, stop.set)
+    jobs.start(concurrency)
+    try:
+        await stop.wait()
+    finally:
+        await jobs.stop()
+        await async_engine.dispose()
+
+
+def _serve_process(concurrency: int) -> None:
+    from app.db.session import dispose_inherited_pools
+
+    dispose_inherited_pools()
+    asyncio.run(_serve(concurrency))
+
+
+def _interrupt(signum, frame) -> None:
+    raise KeyboardInterrupt
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Workers de la cola de trabajos (JOBS=redis)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    worker = sub.add_parser("worker", help="Ejecuta trabajos hasta recibir SIGINT o SIGTERM")
+    worker.add_argument("--concurrency", type=int, default=4, help="Workers asyncio por proceso")
+    worker.add_argument("--processes", type=int, default=1)
+    args = parser.parse_args()
+    if args.command == "worker":
+        if settings.JOBS != "redis":
+            print(f"❌ JOBS={settings.JOBS}: los workers aparte necesitan JOBS=redis")
+            raise SystemExit(1)
+        print(f"✅ {args.processes} proceso(s) x {args.concurrency} workers (Ctrl+C para parar)")
+        if args.processes <= 1:
+            asyncio.run(_serve(args.concurrency))
+            return
+        processes = [
+            multiprocessing.Process(target=_serve_process, args=(args.concurrency,), name=f"jobs-{i}")
+            for i in range(args.processes)
+        ]
+        signal.signal(signal.SIGTERM, _interrupt)
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            # Cada proceso termina sus trabajos en curso antes de salir
+            print("↩️  Parando workers")
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
+
+
+if __name__ == "__main__":
+    main()
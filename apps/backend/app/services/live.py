@@ -0,0 +1,67 @@
+"""
+Actualizaciones en vivo tras cada escritura de eventos (GET /cycle/live).
+
+Solo se calculan si el usuario tiene alguna conexión abierta en algún worker
+(`watched`), así que una escritura de un usuario sin la app abierta no paga
+nada. El mensaje SSE `update` lleva la predicción recalculada y, por cada mes
+afectado, sus días ({día: banderas}, ver calendar_view), que el cliente
+sustituye. Lo publica el trabajo derivado de la escritura (app.services.derived).
+"""
+import logging
+from datetime import date
+from typing import Dict, Iterable, List, Tuple
+
+from pydantic_core import to_json
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.pubsub import broker
+from app.services.calendar_view import build_month
+from app.services.prediction import PredictionError, load_prediction
+
+logger = logging.getLogger(__name__)
+
+MAX_MONTHS = 3  # un lote grande solo actualiza sus meses más recientes
+Snapshot = Dict[str, List[int]]
+
+
+def affected_months(dates: Iterable[date]) -> List[Tuple[int, int]]:
+    return sorted({(d.year, d.month) for d in dates})[-MAX_MONTHS:]
+
+
+async def watched(uid: str) -> bool:
+    return await broker.has_subscribers(uid)
+
+
+async def calendar_snapshot(db: AsyncSession, uid: str, dates: Iterable[date]) -> Snapshot:
+    return {
+        f"{year:04d}-{month:02d}": (await build_month(db, uid, year, month))["days"]
+        for year, month in affected_months(dates)
+    }
+
+
+def calendar_days(snapshot: Snapshot) -> Dict[str, Dict[str, int]]:
+    return {
+        month: {str(day): flags for day, flags in enumerate(days, start=1)}
+        for month, days in snapshot.items()
+    }
+
+
+async def push(uid: str, dates: Iterable[date]) -> None:
+    """
+    Publica la predicción y los meses afectados en su propia sesión, después del
+    commit de la escritura. Un fallo aquí nunca afecta a la escritura.
+    """
+    from app.db.session import AsyncSessionLocal
+
+    try:
+        async with AsyncSessionLocal() as db:
+            months = await calendar_snapshot(db, uid, dates)
+            try:
+                prediction = await load_prediction(db, uid, "default")
+            except PredictionError:
+                prediction = None
+            await db.commit()  # load_prediction puede guardar una predicción recalculada
+        message = {"prediction": prediction, "calendar": calendar_days(months)}
+        await broker.publish(uid, b"event: update\ndata: " + to_json(message) + b"\n\n")
+    except Exception as exc:
+        logger.warning("No se pudo publicar la actualización en vivo de %s: %s", uid, exc)
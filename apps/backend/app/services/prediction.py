@@ -0,0 +1,186 @@
+"""
+Motor de predicción del ciclo.
+
+Trabaja sobre arrays NumPy de ordinales de día (date.toordinal()) de los
+`period_start` del usuario: longitudes de ciclo con np.diff, media ponderada
+según el modelo pedido y confianza a partir de la varianza ponderada.
+"""
+import math
+from datetime import date, datetime, timezone
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import dialects
+from app.db.models import CycleEvent, CyclePrediction, CycleSummary, CycleSyncState
+from app.services.timeline import timelines
+
+DEFAULT_CYCLE_LENGTH = 28
+DEFAULT_CONFIDENCE_DAYS = 5  # con menos de dos ciclos no hay varianza que medir
+MAX_CONFIDENCE_DAYS = 14
+LUTEAL_PHASE_DAYS = 14  # la ovulación ocurre ~14 días antes del siguiente periodo
+FERTILE_DAYS_BEFORE = 5
+FERTILE_DAYS_AFTER = 1
+# Ciclos fuera de este rango suelen ser periodos olvidados o duplicados
+MIN_CYCLE_LENGTH = 15
+MAX_CYCLE_LENGTH = 60
+CYCLE_WINDOW = 6  # ciclos recientes que entran en la media
+EWMA_ALPHA = 0.5
+
+
+class PredictionError(ValueError):
+    """No se puede predecir (modelo desconocido o sin historial)."""
+
+
+def _uniform(n: int) -> np.ndarray:
+    return np.ones(n)
+
+
+def _linear(n: int) -> np.ndarray:
+    return np.arange(1, n + 1, dtype=np.float64)
+
+
+def _exponential(n: int) -> np.ndarray:
+    return (1 - EWMA_ALPHA) ** np.arange(n - 1, -1, -1, dtype=np.float64)
+
+
+# Pesos por modelo, del ciclo más antiguo al más reciente
+MODELS: Dict[str, Callable[[int], np.ndarray]] = {
+    "average": _uniform,
+    "wma": _linear,
+    "ewma": _exponential,
+}
+MODEL_ALIASES = {"default": "wma"}
+
+
+def cycle_lengths(starts: np.ndarray) -> np.ndarray:
+    """Longitudes de los últimos ciclos plausibles a partir de los ordinales de inicio."""
+    lengths = np.diff(np.unique(starts))
+    lengths = lengths[(lengths >= MIN_CYCLE_LENGTH) & (lengths <= MAX_CYCLE_LENGTH)]
+    return lengths[-CYCLE_WINDOW:]
+
+
+def resolve_model(model: str) -> str:
+    name = MODEL_ALIASES.get(model, model)
+    if name not in MODELS:
+        raise PredictionError(f"Modelo desconocido: {model!r}. Disponibles: {', '.join(MODELS)}")
+    return name
+
+
+def predict(starts: np.ndarray, model: str = "wma") -> dict:
+    """Predice el siguiente periodo a partir de un array de ordinales de `period_start`."""
+    weights_for = MODELS[resolve_model(model)]
+    if starts.size == 0:
+        raise PredictionError("No hay registros de periodo para predecir")
+
+    lengths = cycle_lengths(starts)
+    if lengths.size:
+        weights = weights_for(lengths.size)
+        mean = np.average(lengths, weights=weights)
+        length = int(round(mean))
+    else:
+        length = DEFAULT_CYCLE_LENGTH
+
+    if lengths.size >= 2:
+        variance = np.average((lengths - mean) ** 2, weights=weights)
+        confidence = min(MAX_CONFIDENCE_DAYS, max(1, math.ceil(math.sqrt(variance))))
+    else:
+        confidence = DEFAULT_CONFIDENCE_DAYS
+
+    next_start = int(starts.max()) + length
+    ovulation = next_start - LUTEAL_PHASE_DAYS
+    return {
+        "next_period_start": date.fromordinal(next_start).isoformat(),
+        "confidence_days": confidence,
+        "fertile_window": [
+            date.fromordinal(ovulation - FERTILE_DAYS_BEFORE).isoformat(),
+            date.fromordinal(ovulation + FERTILE_DAYS_AFTER).isoformat(),
+        ],
+    }
+
+
+def to_ordinals(dates: Sequence[date]) -> np.ndarray:
+    return np.fromiter((d.toordinal() for d in dates), dtype=np.int32, count=len(dates))
+
+
+async def load_period_starts(db: AsyncSession, uid: str) -> np.ndarray:
+    """
+    Solo los inicios recientes: la predicción nunca mira más de CYCLE_WINDOW ciclos.
+    Salen de la timeline si ya está en memoria; si no, de cycle_summaries (una fila
+    por ciclo) y, si aún no hay resumen, de los eventos.
+    """
+    limit = 2 * (CYCLE_WINDOW + 1)
+    timeline = await timelines.resident(db, uid)
+    if timeline is not None:
+        return timeline.ordinals_of("period_start")[-limit:]
+
+    result = await db.execute(
+        select(CycleSummary.start_date)
+        .where(CycleSummary.user_id == uid)
+        .order_by(CycleSummary.start_date.desc())
+        .limit(limit)
+    )
+    starts = result.scalars().all()
+    if starts:
+        return to_ordinals(starts)
+
+    result = await db.execute(
+        select(CycleEvent.date)
+        .where(CycleEvent.user_id == uid, CycleEvent.type == "period_start", CycleEvent.deleted_at.is_(None))
+        .order_by(CycleEvent.date.desc())
+        .limit(limit)
+    )
+    return to_ordinals(result.scalars().all())
+
+
+# --- Predicciones precalculadas (cycle_predictions) ---
+
+def prediction_row(uid: str, model: str, change_seq: int, result: dict) -> dict:
+    fertile_start, fertile_end = result["fertile_window"]
+    return {
+        "user_id": uid,
+        "model": model,
+        "next_period_start": date.fromisoformat(result["next_period_start"]),
+        "confidence_days": result["confidence_days"],
+        "fertile_start": date.fromisoformat(fertile_start),
+        "fertile_end": date.fromisoformat(fertile_end),
+        "change_seq": change_seq,
+        "computed_at": datetime.now(timezone.utc),
+    }
+
+
+def upsert_predictions_stmt(db, rows: List[dict]):
+    stmt = dialects.insert(db, CyclePrediction).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id", "model"],
+        set_={
+            column: stmt.excluded[column]
+            for column in ("next_period_start", "confidence_days", "fertile_start", "fertile_end", "change_seq", "computed_at")
+        },
+    )
+
+
+async def load_prediction(db: AsyncSession, uid: str, model: str) -> dict:
+    """
+    Sirve la predicción guardada si no hay cambios del usuario posteriores a su
+    cálculo; si no, la recalcula y la guarda (sin commit).
+    """
+    model = resolve_model(model)
+    change_seq = (await db.execute(
+        select(CycleSyncState.change_seq).where(CycleSyncState.user_id == uid)
+    )).scalar() or 0
+    stored = (await db.execute(
+        select(CyclePrediction).where(CyclePrediction.user_id == uid, CyclePrediction.model == model)
+    )).scalars().first()
+    if stored and stored.change_seq >= change_seq:
+        return {
+            "next_period_start": stored.next_period_start.isoformat(),
+            "confidence_days": stored.confidence_days,
+            "fertile_window": [stored.fertile_start.isoformat(), stored.fertile_end.isoformat()],
+        }
+
+    result = predict(await load_period_starts(db, uid), model)
+    await db.execute(upsert_predictions_stmt(db, [prediction_row(uid, model, change_seq, result)]))
+    return result
@@ -0,0 +1,155 @@
+"""
+Job nocturno de predicciones: recalcula `cycle_predictions` para todos los usuarios.
+
+- Lee los `period_start` de todos los usuarios en una sola consulta con cursor del
+  lado del servidor (engine síncrono, stream_results), ya ordenados por usuario.
+- Agrupa los usuarios en bloques y reparte el cálculo entre un ProcessPoolExecutor.
+- Escribe cada bloque de resultados con COPY a una tabla temporal + INSERT ... ON
+  CONFLICT en PostgreSQL, o con un upsert multi-fila en otros motores.
+
+Cada fila guarda el change_seq del usuario leído en la misma consulta, así que
+/predict sabe si hay eventos posteriores y solo entonces recalcula.
+
+Uso: python -m app.services.prediction_job run [--workers N] [--chunk-size N] [--models wma,ewma]
+"""
+import argparse
+import csv
+import io
+import itertools
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Iterator, List, Sequence, Set, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+
+from app.db.models import CycleEvent, CyclePrediction, CycleSyncState
+from app.services.prediction import (
+    CYCLE_WINDOW, MODELS, PredictionError, predict, prediction_row, resolve_model, upsert_predictions_stmt,
+)
+
+# (uid, change_seq, ordinales de los inicios más recientes)
+UserStarts = Tuple[str, int, List[int]]
+STREAM_BATCH_SIZE = 10_000
+# Igual que load_period_starts: la predicción nunca mira más atrás
+STARTS_PER_USER = 2 * (CYCLE_WINDOW + 1)
+WRITE_COLUMNS = [column.name for column in CyclePrediction.__table__.columns]
+
+
+def predict_chunk(users: Sequence[UserStarts], models: Sequence[str]) -> List[dict]:
+    """Se ejecuta en los procesos del pool: solo NumPy, sin base de datos."""
+    rows = []
+    for uid, change_seq, starts in users:
+        ordinals = np.asarray(starts, dtype=np.int32)
+        for model in models:
+            try:
+                rows.append(prediction_row(uid, model, change_seq, predict(ordinals, model)))
+            except PredictionError:
+                continue
+    return rows
+
+
+def stream_users(conn, chunk_size: int) -> Iterator[List[UserStarts]]:
+    """Bloques de `chunk_size` usuarios leídos de un único cursor del lado del servidor."""
+    stmt = (
+        select(CycleEvent.user_id, CycleEvent.date, func.coalesce(CycleSyncState.change_seq, 0))
+        .outerjoin(CycleSyncState, CycleSyncState.user_id == CycleEvent.user_id)
+        .where(CycleEvent.type == "period_start", CycleEvent.deleted_at.is_(None))
+        .order_by(CycleEvent.user_id, CycleEvent.date)
+    )
+    result = conn.execution_options(stream_results=True, yield_per=STREAM_BATCH_SIZE).execute(stmt)
+    users = (
+        (uid, rows)
+        for uid, rows in itertools.groupby(result, key=lambda row: row[0])
+    )
+    chunk: List[UserStarts] = []
+    for uid, rows in users:
+        rows = list(rows)[-STARTS_PER_USER:]
+        chunk.append((uid, rows[-1][2], [row[1].toordinal() for row in rows]))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def write_predictions(engine, rows: List[dict]) -> None:
+    if not rows:
+        return
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            _write_copy(conn, rows)
+        else:
+            conn.execute(upsert_predictions_stmt(conn, rows))
+
+
+def _write_copy(conn, rows: List[dict]) -> None:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] for column in WRITE_COLUMNS])
+    buffer.seek(0)
+
+    columns = ", ".join(WRITE_COLUMNS)
+    updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in WRITE_COLUMNS if c not in ("user_id", "model"))
+    cursor = conn.connection.dbapi_connection.cursor()
+    cursor.execute("CREATE TEMP TABLE cycle_predictions_load (LIKE cycle_predictions) ON COMMIT DROP")
+    cursor.copy_expert(f"COPY cycle_predictions_load ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+    cursor.execute(
+        f"INSERT INTO cycle_predictions ({columns}) SELECT {columns} FROM cycle_predictions_load "
+        f"ON CONFLICT (user_id, model) DO UPDATE SET {updates}"
+    )
+
+
+def run(workers: int, chunk_size: int, models: Sequence[str]) -> int:
+    from app.db.session import engine
+
+    started = time.perf_counter()
+    total_users = total_rows = 0
+    pending: Set[Future] = set()
+
+    def drain(block: bool) -> None:
+        nonlocal total_rows
+        done, _ = wait(pending, return_when=FIRST_COMPLETED) if block else (
+            {f for f in pending if f.done()}, None
+        )
+        for future in done:
+            pending.discard(future)
+            rows = future.result()
+            write_predictions(engine, rows)
+            total_rows += len(rows)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool, engine.connect() as conn:
+            for chunk in stream_users(conn, chunk_size):
+                # Como mucho 2 bloques por proceso en vuelo: memoria acotada
+                while len(pending) >= 2 * workers:
+                    drain(block=True)
+                pending.add(pool.submit(predict_chunk, chunk, models))
+                total_users += len(chunk)
+                drain(block=False)
+            while pending:
+                drain(block=True)
+    finally:
+        engine.dispose()
+
+    print(f"✅ {total_rows} predicciones de {total_users} usuarios en {time.perf_counter() - started:.1f} s")
+    return total_rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Predicciones precalculadas (cycle_predictions)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    job = sub.add_parser("run", help="Recalcula las predicciones de todos los usuarios")
+    job.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    job.add_argument("--chunk-size", type=int, default=2000, help="Usuarios por bloque enviado al pool")
+    job.add_argument("--models", default=",".join(MODELS), help="Modelos separados por comas")
+    args = parser.parse_args()
+    if args.command == "run":
+        models = list(dict.fromkeys(resolve_model(m.strip()) for m in args.models.split(",")))
+        run(args.workers, args.chunk_size, models)
+
+
+if __name__ == "__main__":
+    main()
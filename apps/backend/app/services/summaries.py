@@ -0,0 +1,190 @@
+"""
+Materialización incremental de `cycle_summaries`: una fila por ciclo.
+
+- start_date: el `period_start` que abre el ciclo.
+- end_date: último `period_end` registrado dentro del ciclo.
+- cycle_length: días hasta el siguiente `period_start` (NULL en el ciclo abierto).
+- average_length: media de los últimos CYCLE_WINDOW ciclos plausibles anteriores,
+  es decir, la duración esperada de este ciclo.
+
+Insertar un inicio solo toca el ciclo afectado, su predecesor y los
+CYCLE_WINDOW ciclos siguientes cuya media lo incluye.
+
+Uso: python -m app.services.summaries rebuild [--chunk-size N]
+"""
+import argparse
+import asyncio
+import itertools
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import CycleEvent, CycleSummary
+from app.services.prediction import CYCLE_WINDOW, MAX_CYCLE_LENGTH, MIN_CYCLE_LENGTH
+
+PERIOD_START = "period_start"
+PERIOD_END = "period_end"
+PERIOD_TYPES = (PERIOD_START, PERIOD_END)
+# Por encima de este número de inicios en un lote sale más barato reconstruir
+REBUILD_THRESHOLD = CYCLE_WINDOW
+
+
+def _average(lengths: Sequence[Optional[int]]) -> Optional[int]:
+    plausible = [n for n in lengths if n is not None and MIN_CYCLE_LENGTH <= n <= MAX_CYCLE_LENGTH]
+    return round(sum(plausible) / len(plausible)) if plausible else None
+
+
+def summarize(starts: Sequence[date], ends: Iterable[date] = ()) -> List[dict]:
+    """Calcula las filas de resumen para inicios ordenados y sin duplicados."""
+    rows = []
+    for i, start in enumerate(starts):
+        nxt = starts[i + 1] if i + 1 < len(starts) else None
+        rows.append({
+            "start_date": start,
+            "end_date": None,
+            "cycle_length": (nxt - start).days if nxt else None,
+        })
+    lengths = [row["cycle_length"] for row in rows]
+    for i, row in enumerate(rows):
+        row["average_length"] = _average(lengths[max(0, i - CYCLE_WINDOW):i])
+
+    for end in sorted(ends):
+        for row in reversed(rows):
+            if row["start_date"] <= end:
+                row["end_date"] = end
+                break
+    return rows
+
+
+async def rebuild_user(db: AsyncSession, uid: str) -> None:
+    result = await db.execute(
+        select(CycleEvent.type, CycleEvent.date)
+        .where(CycleEvent.user_id == uid, CycleEvent.type.in_(PERIOD_TYPES), CycleEvent.deleted_at.is_(None))
+        .order_by(CycleEvent.date)
+    )
+    await _replace(db, {uid: result.all()})
+
+
+async def rebuild_users(db: AsyncSession, uids: Sequence[str]) -> None:
+    """Reconstruye los resúmenes de varios usuarios con una sola lectura (sin commit)."""
+    result = await db.execute(
+        select(CycleEvent.user_id, CycleEvent.type, CycleEvent.date)
+        .where(
+            CycleEvent.user_id.in_(uids),
+            CycleEvent.type.in_(PERIOD_TYPES),
+            CycleEvent.deleted_at.is_(None),
+        )
+        .order_by(CycleEvent.user_id, CycleEvent.date)
+    )
+    events_by_user = {uid: [] for uid in uids}
+    for uid, rows in itertools.groupby(result.all(), key=lambda row: row.user_id):
+        events_by_user[uid] = [(row.type, row.date) for row in rows]
+    await _replace(db, events_by_user)
+
+
+async def _replace(db: AsyncSession, events_by_user: Dict[str, Sequence]) -> None:
+    await db.execute(delete(CycleSummary).where(CycleSummary.user_id.in_(list(events_by_user))))
+    rows = []
+    for uid, events in events_by_user.items():
+        starts = sorted({d for kind, d in events if kind == PERIOD_START})
+        ends = [d for kind, d in events if kind == PERIOD_END]
+        rows.extend({"user_id": uid, **row} for row in summarize(starts, ends))
+    if rows:
+        await db.execute(insert(CycleSummary), rows)
+
+
+async def _add_start(db: AsyncSession, uid: str, start: date) -> None:
+    by_user = select(CycleSummary).where(CycleSummary.user_id == uid)
+    before = (await db.execute(
+        by_user.where(CycleSummary.start_date <= start)
+        .order_by(CycleSummary.start_date.desc()).limit(CYCLE_WINDOW + 1)
+    )).scalars().all()
+    if before and before[0].start_date == start:
+        return
+    after = (await db.execute(
+        by_user.where(CycleSummary.start_date > start)
+        .order_by(CycleSummary.start_date).limit(CYCLE_WINDOW)
+    )).scalars().all()
+
+    window = list(reversed(before)) + [None] + list(after)
+    starts = [row.start_date if row else start for row in window]
+    fresh = summarize(starts)
+    new_index = len(before)
+
+    new_row = CycleSummary(user_id=uid, **fresh[new_index])
+    if before:
+        pred = before[0]
+        pred.cycle_length = fresh[new_index - 1]["cycle_length"]
+        # Un period_end posterior al nuevo inicio pasa a pertenecer al nuevo ciclo
+        if pred.end_date and pred.end_date >= start:
+            new_row.end_date, pred.end_date = pred.end_date, None
+    for row, values in zip(after, fresh[new_index + 1:]):
+        row.average_length = values["average_length"]
+    db.add(new_row)
+    await db.flush()
+
+
+async def _add_end(db: AsyncSession, uid: str, end: date) -> None:
+    row = (await db.execute(
+        select(CycleSummary)
+        .where(CycleSummary.user_id == uid, CycleSummary.start_date <= end)
+        .order_by(CycleSummary.start_date.desc()).limit(1)
+    )).scalars().first()
+    if row and (row.end_date is None or row.end_date < end):
+        row.end_date = end
+        await db.flush()
+
+
+async def apply_events(db: AsyncSession, uid: str, events: Iterable) -> None:
+    """Actualiza los resúmenes del usuario con eventos recién insertados (sin commit)."""
+    period_events = sorted((e for e in events if e.type in PERIOD_TYPES), key=lambda e: e.date)
+    if not period_events:
+        return
+    if sum(e.type == PERIOD_START for e in period_events) > REBUILD_THRESHOLD:
+        await rebuild_user(db, uid)
+        return
+    for event in period_events:
+        if event.type == PERIOD_START:
+            await _add_start(db, uid, event.date)
+        else:
+            await _add_end(db, uid, event.date)
+
+
+async def rebuild_all(chunk_size: int = 500) -> int:
+    """Backfill de todos los usuarios en bloques, un commit por bloque."""
+    from app.db.session import AsyncSessionLocal, async_engine
+
+    total, last_uid = 0, ""
+    try:
+        while True:
+            async with AsyncSessionLocal() as db:
+                uids = (await db.execute(
+                    select(CycleEvent.user_id).distinct()
+                    .where(CycleEvent.user_id > last_uid)
+                    .order_by(CycleEvent.user_id).limit(chunk_size)
+                )).scalars().all()
+                if not uids:
+                    return total
+                await rebuild_users(db, uids)
+                await db.commit()
+            total += len(uids)
+            last_uid = uids[-1]
+            print(f"✅ {total} usuarios resumidos (hasta {last_uid})")
+    finally:
+        await async_engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mantenimiento de cycle_summaries")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild = sub.add_parser("rebuild", help="Reconstruye los resúmenes de todos los usuarios")
+    rebuild.add_argument("--chunk-size", type=int, default=500)
+    args = parser.parse_args()
+    if args.command == "rebuild":
+        asyncio.run(rebuild_all(args.chunk_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Línea temporal compacta por usuario, en memoria.
+
+Un Timeline guarda los eventos vivos de un usuario ordenados por (fecha, id) en
+arrays planos: ids (int64), fechas como ordinales de día (int32) y tipos como
+códigos fijos (uint8) para los que interpreta el servidor. Cualquier otro tipo
+comparte el código OTHER y su nombre se guarda aparte en el propio timeline: no
+hay ninguna tabla global que crezca con lo que envían los clientes. El `meta` se
+guarda como el JSON original concatenado en un solo blob con offsets y solo se
+decodifica al pedir un evento concreto. Se construye directamente desde filas
+(tuplas), sin instancias ORM: unos 20 bytes por evento más su meta, frente a los
+~1-2 KB de un CycleEvent con su dict.
+
+TimelineStore es una LRU por UID acotada en bytes. Cada timeline lleva el
+change_seq con el que se leyó; si el de cycle_sync_state es otro (hubo
+inserciones o borrados en cualquier worker), se vuelve a cargar. Las rutas de
+lectura solo usan `resident()`: la timeline si ya está en memoria y al día. Si
+no lo está siguen con sus consultas SQL acotadas (keyset, últimos inicios,
+cycle_summaries) y la carga completa se hace en segundo plano, nunca dentro de
+la petición. Un usuario cuyo historial no cabe en la caché se recuerda para no
+volver a leerlo entero hasta que cambie.
+"""
+import asyncio
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from cachetools import LRUCache
+from sqlalchemy import Text, cast, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.models import CycleEvent, CycleSyncState
+
+logger = logging.getLogger(__name__)
+
+_TYPE_NAMES: List[str] = ["period_start", "period_end", "symptom"]
+_TYPE_CODES: Dict[str, int] = {name: code for code, name in enumerate(_TYPE_NAMES)}
+OTHER = len(_TYPE_NAMES)
+
+
+def type_code(name: str) -> int:
+    """Código fijo del tipo de evento; OTHER para los que el servidor no interpreta."""
+    return _TYPE_CODES.get(name, OTHER)
+
+
+class Timeline:
+    __slots__ = ("uid", "change_seq", "ids", "ordinals", "types", "_others", "_meta_blob", "_meta_offsets")
+
+    def __init__(self, uid: str, change_seq: int = 0):
+        self.uid = uid
+        self.change_seq = change_seq
+        self.ids = array("q")
+        self.ordinals = array("i")
+        self.types = array("B")
+        self._others: Dict[int, str] = {}  # índice -> tipo de los eventos OTHER
+        self._meta_blob = b""
+        self._meta_offsets = array("I", [0])
+
+    @classmethod
+    def from_rows(cls, uid: str, change_seq: int, rows: Iterable[Tuple[int, str, date, Optional[str]]]) -> "Timeline":
+        """Filas (id, type, date, meta como texto JSON) ya ordenadas por (date, id)."""
+        timeline = cls(uid, change_seq)
+        blob = bytearray()
+        for event_id, event_type, event_date, meta in rows:
+            timeline.ids.append(event_id)
+            timeline.ordinals.append(event_date.toordinal())
+            code = type_code(event_type)
+            if code == OTHER:
+                timeline._others[len(timeline.types)] = event_type
+            timeline.types.append(code)
+            if meta is not None and meta != "null":
+                blob += meta.encode()
+            timeline._meta_offsets.append(len(blob))
+        timeline._meta_blob = bytes(blob)
+        return timeline
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.ids, self.ordinals, self.types, self._meta_offsets)
+        others = sum(64 + len(name) for name in self._others.values())  # entrada del dict y su str
+        return sum(a.itemsize * len(a) for a in arrays) + len(self._meta_blob) + others
+
+    # --- Búsquedas ---
+
+    def span(self, start: Optional[date] = None, end: Optional[date] = None) -> Tuple[int, int]:
+        """Índices [lo, hi) de los eventos con start <= fecha <= end (búsqueda binaria)."""
+        lo = bisect_left(self.ordinals, start.toordinal()) if start else 0
+        hi = bisect_right(self.ordinals, end.toordinal()) if end else len(self)
+        return lo, max(lo, hi)
+
+    def position(self, event_date: date, event_id: int) -> int:
+        """Primer índice cuyo (fecha, id) es >= (event_date, event_id)."""
+        ordinal = event_date.toordinal()
+        lo = bisect_left(self.ordinals, ordinal)
+        hi = bisect_right(self.ordinals, ordinal, lo)
+        return bisect_left(self.ids, event_id, lo, hi)
+
+    def ordinals_of(self, event_type: str, lo: int = 0, hi: Optional[int] = None) -> np.ndarray:
+        """Ordinales de los eventos de un tipo en [lo, hi), sin copiar los arrays."""
+        hi = len(self) if hi is None else hi
+        if lo >= hi:
+            return np.empty(0, dtype=np.int32)
+        ordinals = np.frombuffer(self.ordinals, dtype=np.int32)
+        if event_type not in _TYPE_CODES:
+            indexes = sorted(i for i, name in self._others.items() if lo <= i < hi and name == event_type)
+            return ordinals[indexes]
+        types = np.frombuffer(self.types, dtype=np.uint8)[lo:hi]
+        return ordinals[lo:hi][types == _TYPE_CODES[event_type]]
+
+    # --- Acceso a eventos ---
+
+    def type_of(self, i: int) -> str:
+        code = self.types[i]
+        return self._others[i] if code == OTHER else _TYPE_NAMES[code]
+
+    def meta_json(self, i: int) -> Optional[bytes]:
+        start, end = self._meta_offsets[i], self._meta_offsets[i + 1]
+        return self._meta_blob[start:end] if end > start else None
+
+    def meta(self, i: int) -> Optional[dict]:
+        from pydantic_core import from_json
+
+        raw = self.meta_json(i)
+        return from_json(raw) if raw is not None else None
+
+    def event(self, i: int) -> dict:
+        """El evento i con la misma forma que una fila de /cycle/history."""
+        return {
+            "id": self.ids[i],
+            "user_id": self.uid,
+            "type": self.type_of(i),
+            "date": date.fromordinal(self.ordinals[i]),
+            "meta": self.meta(i),
+        }
+
+    def events(self, indexes: Sequence[int]) -> List[dict]:
+        return [self.event(i) for i in indexes]
+
+
+class TimelineStore:
+    def __init__(self, max_bytes: int, max_loading: int = 4):
+        self.max_bytes = max_bytes
+        self.max_loading = max_loading
+        self._lru: Optional[LRUCache] = (
+            LRUCache(maxsize=max_bytes, getsizeof=lambda timeline: timeline.nbytes or 1) if max_bytes > 0 else None
+        )
+        self._oversized: LRUCache = LRUCache(maxsize=10_000)  # uid -> change_seq con el que no cupo
+        self._loading: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    async def _change_seq(self, db: AsyncSession, uid: str) -> int:
+        return (await db.execute(
+            select(CycleSyncState.change_seq).where(CycleSyncState.user_id == uid)
+        )).scalar() or 0
+
+    async def resident(self, db: AsyncSession, uid: str) -> Optional[Timeline]:
+        """
+        La timeline del usuario solo si ya está en memoria y al día; si no, None
+        (el llamador usa sus consultas SQL) y se programa la carga en segundo plano.
+        """
+        if self._lru is None:
+            return None
+        change_seq = await self._change_seq(db, uid)
+        timeline = self._lru.get(uid)
+        if timeline is not None and timeline.change_seq == change_seq:
+            self.hits += 1
+            return timeline
+        self.misses += 1
+        self._warm(uid, change_seq)
+        return None
+
+    def _warm(self, uid: str, change_seq: int) -> None:
+        if uid in self._loading or len(self._loading) >= self.max_loading:
+            return
+        if self._oversized.get(uid) == change_seq:
+            return  # no cabía con estos datos; no se vuelve a leer hasta que cambien
+        task = asyncio.create_task(self._load_detached(uid), name=f"timeline-load-{uid}")
+        self._loading[uid] = task
+        task.add_done_callback(lambda _: self._loading.pop(uid, None))
+
+    async def _load_detached(self, uid: str) -> None:
+        from app.db.session import AsyncSessionLocal
+
+        try:
+            async with AsyncSessionLocal() as db:
+                await self.get(db, uid)
+        except Exception:
+            logger.exception("No se pudo cargar la timeline de %s", uid)
+
+    async def wait_loading(self) -> None:
+        """Espera a las cargas en segundo plano en curso (tests y apagado)."""
+        if self._loading:
+            await asyncio.gather(*self._loading.values(), return_exceptions=True)
+
+    async def get(self, db: AsyncSession, uid: str) -> Timeline:
+        """Timeline al día, leyendo el historial completo si no está en memoria."""
+        change_seq = await self._change_seq(db, uid)
+        timeline = self._lru.get(uid) if self._lru is not None else None
+        if timeline is not None and timeline.change_seq == change_seq:
+            self.hits += 1
+            return timeline
+
+        self.loads += 1
+        rows = await db.execute(
+            select(CycleEvent.id, CycleEvent.type, CycleEvent.date, cast(CycleEvent.meta, Text))
+            .where(CycleEvent.user_id == uid, CycleEvent.deleted_at.is_(None))
+            .order_by(CycleEvent.date, CycleEvent.id)
+        )
+        timeline = Timeline.from_rows(uid, change_seq, rows)
+        if self._lru is not None:
+            if timeline.nbytes <= self.max_bytes:
+                self._lru[uid] = timeline
+            else:
+                self._oversized[uid] = change_seq
+        return timeline
+
+    def clear(self) -> None:
+        if self._lru is not None:
+            self._lru.clear()
+        self._oversized.clear()
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "loads": self.loads,
+            "loading": len(self._loading),
+            "users": len(self._lru) if self._lru is not None else 0,
+            "bytes": self._lru.currsize if self._lru is not None else 0,
+        }
+
+
+timelines = TimelineStore(settings.TIMELINE_CACHE_MB * 1024 * 1024)
@@ -0,0 +1,72 @@
+from typing import Any, Dict, List, Mapping, Sequence
+
+from sqlalchemy import func, literal_column
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import dialects
+from app.models.user import User
+from app.services import derived
+
+PROFILE_FIELDS = ("nombre", "ciudad", "pais", "direccion", "edad")
+DIMENSION_FIELDS = ("pais", "ciudad", "edad")  # los que deciden sus dimensiones de analítica
+UPSERT_CHUNK_SIZE = 1000
+
+
+def user_row(firebase_uid: str, data: Mapping[str, Any]) -> Dict[str, Any]:
+    """Fila completa para el INSERT multi-fila (todas las filas con las mismas columnas)."""
+    row = {"firebase_uid": firebase_uid, "correo": data.get("correo")}
+    row.update({field: data.get(field) for field in PROFILE_FIELDS})
+    return row
+
+
+async def upsert_users(db: AsyncSession, rows: Sequence[Dict[str, Any]]) -> List[Row]:
+    """
+    Crea o sincroniza usuarios con INSERT ... ON CONFLICT (firebase_uid) DO UPDATE
+    ... RETURNING: un round trip por bloque y sin carreras entre logins simultáneos.
+    Un campo ausente (None) conserva el valor guardado; el correo solo se fija al crear.
+    Devuelve (id, firebase_uid, nombre, correo, created) por usuario; no hace commit.
+    `created` solo se conoce en PostgreSQL (xmax = 0); en otros motores es None.
+    Tras el commit, submit_profile_changes encola el movimiento de sus rollups.
+    """
+    # Un mismo UID dos veces en el mismo INSERT haría fallar el ON CONFLICT
+    by_uid: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        merged = by_uid.setdefault(row["firebase_uid"], dict(row))
+        merged.update({key: value for key, value in row.items() if value is not None})
+
+    values = list(by_uid.values())
+    postgres = db.bind.dialect.name == "postgresql"
+    created = literal_column("xmax = 0") if postgres else literal_column("NULL")
+
+    results: List[Row] = []
+    for start in range(0, len(values), UPSERT_CHUNK_SIZE):
+        stmt = dialects.insert(db, User).values(values[start:start + UPSERT_CHUNK_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[User.firebase_uid],
+            set_={field: func.coalesce(stmt.excluded[field], User.__table__.c[field]) for field in PROFILE_FIELDS},
+        ).returning(User.id, User.firebase_uid, User.nombre, User.correo, created.label("created"))
+        results.extend((await db.execute(stmt)).all())
+    return results
+
+
+def profile_changes(rows: Sequence[Mapping[str, Any]]) -> List[str]:
+    """UIDs de las filas que fijan país, ciudad o edad: sus rollups pueden tener que moverse."""
+    return sorted({
+        row["firebase_uid"] for row in rows
+        if any(row.get(field) is not None for field in DIMENSION_FIELDS)
+    })
+
+
+async def submit_profile_changes(rows: Sequence[Mapping[str, Any]]) -> None:
+    """
+    Tras confirmar upsert_users: encola el trabajo derivado de cada usuario que
+    pudo cambiar de perfil, que mueve su aportación a los rollups si hace falta.
+    """
+    for uid in profile_changes(rows):
+        await derived.submit(uid, ())
+
+
+async def sync_user(db: AsyncSession, firebase_uid: str, data: Mapping[str, Any]) -> Row:
+    [user] = await upsert_users(db, [user_row(firebase_uid, data)])
+    return user
@@ -0,0 +1,400 @@
+"""
+Modo write-behind para POST /cycle/events (WRITE_BEHIND=redis|file).
+
+El evento se confirma al cliente en cuanto queda guardado de forma durable en un
+log por usuario, y un flusher en segundo plano lo vuelca a Postgres en lotes:
+un INSERT multi-fila por usuario (insert_events) y un solo commit por lote de
+usuarios. El lote sale cuando hay WRITE_BEHIND_BATCH_USERS usuarios pendientes o
+cuando el más antiguo lleva WRITE_BEHIND_FLUSH_INTERVAL segundos esperando
+(el flusher lo comprueba cada medio intervalo).
+
+- Orden: cada usuario tiene su propio log (un stream de Redis o un fichero
+  JSONL) que se vuelca siempre en orden de llegada.
+- Idempotencia: la idempotency_key se fija al encolar, así que reintentos y
+  volcados concurrentes del mismo evento nunca lo duplican.
+- Leer lo propio: las rutas de lectura llaman a `ensure_flushed(uid)`, que
+  vuelca en el acto los pendientes de ese usuario antes de consultar.
+- Fallos: un usuario reclamado queda en préstamo (WRITE_BEHIND_LEASE) hasta que
+  se confirma, así que si el proceso cae otro flusher lo recupera. Si el lote
+  falla se vuelca usuario a usuario: uno que falla no retiene a los demás.
+
+El backend `file` es un sustituto local para desarrollo y tests, de un solo
+proceso: los pendientes y los cerrojos viven en memoria, así que dos procesos
+con el mismo directorio podrían perder eventos.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.core.cache import cache
+from app.core.config import settings
+from app.schemas.cycles import CycleEventCreate
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "cu:wb"
+
+
+class RedisEventLog:
+    """
+    Un stream por usuario (`cu:wb:s:<uid>`), un ZSET de usuarios pendientes por
+    antigüedad (`cu:wb:dirty`) y otro de usuarios en volcado por fin de préstamo
+    (`cu:wb:claimed`): lo vencido vuelve a pendientes en el siguiente claim.
+    """
+
+    def __init__(self, redis: Any, lease: float = 30.0):
+        self.redis = redis
+        self.lease = lease
+        self.dirty = f"{PREFIX}:dirty"
+        self.claimed = f"{PREFIX}:claimed"
+
+    def _stream(self, uid: str) -> str:
+        return f"{PREFIX}:s:{uid}"
+
+    async def append(self, uid: str, payloads: Sequence[str]) -> None:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for payload in payloads:
+                pipe.xadd(self._stream(uid), {"e": payload})
+            pipe.zadd(self.dirty, {uid: time.time()}, nx=True)
+            await pipe.execute()
+
+    async def has_pending(self, uid: str) -> bool:
+        return bool(await self.redis.xlen(self._stream(uid)))
+
+    async def recover(self) -> None:
+        """Al arrancar: vuelve a pendientes los streams que no figuran en ningún ZSET."""
+        async for key in self.redis.scan_iter(match=self._stream("*"), count=1000):
+            uid = (key.decode() if isinstance(key, bytes) else key)[len(self._stream("")):]
+            if await self.redis.zscore(self.claimed, uid) is None:
+                await self.redis.zadd(self.dirty, {uid: 0}, nx=True)
+
+    async def _expire_leases(self) -> None:
+        expired = await self.redis.zrangebyscore(self.claimed, "-inf", time.time())
+        for uid in expired:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.zrem(self.claimed, uid)
+                pipe.zadd(self.dirty, {uid: 0}, nx=True)
+                await pipe.execute()
+
+    async def claim(self, limit: int, older_than: float) -> List[str]:
+        """
+        Reclama usuarios pendientes con préstamo: ZREM garantiza que solo un flusher
+        se lleva cada uno, y en la misma transacción pasa a `claimed`.
+        """
+        await self._expire_leases()
+        if await self.redis.zcard(self.dirty) < limit:
+            uids = await self.redis.zrangebyscore(self.dirty, "-inf", older_than, start=0, num=limit)
+        else:
+            uids = await self.redis.zrange(self.dirty, 0, limit - 1)
+        if not uids:
+            return []
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for uid in uids:
+                pipe.zrem(self.dirty, uid)
+                pipe.zadd(self.claimed, {uid: time.time() + self.lease})
+            results = await pipe.execute()
+        # Quien no consiguió el ZREM solo alargó el préstamo del dueño (mismo miembro)
+        return [uid.decode() if isinstance(uid, bytes) else uid for uid, ok in zip(uids, results[::2]) if ok]
+
+    async def read(self, uid: str) -> Tuple[List[str], Any]:
+        entries = await self.redis.xrange(self._stream(uid))
+        return [fields[b"e"].decode() for _, fields in entries], [entry_id for entry_id, _ in entries]
+
+    async def ack(self, uid: str, handle: Any) -> None:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if handle:
+                pipe.xdel(self._stream(uid), *handle)
+            pipe.zrem(self.claimed, uid)
+            await pipe.execute()
+
+    async def release(self, uid: str, handle: Any) -> None:
+        pass
+
+    async def retry(self, uid: str) -> None:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(self.claimed, uid)
+            pipe.zadd(self.dirty, {uid: time.time()}, nx=True)
+            await pipe.execute()
+
+
+class FileEventLog:
+    """
+    Un fichero JSONL por usuario; cada línea es un evento y se hace fsync al
+    encolar. Para volcar se renombra a `.flushing`, así las escrituras nuevas
+    van a un fichero nuevo y nada se pierde si el proceso cae a medias.
+
+    Solo para un proceso. Encolar y renombrar comparten un cerrojo por usuario
+    (`_swaps`): un evento ya confirmado nunca acaba en un `.flushing` ya leído.
+    Otro cerrojo (`_locks`) impide dos volcados a la vez del mismo usuario.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._dirty: Dict[str, float] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._swaps: Dict[str, asyncio.Lock] = {}
+        # Pendientes de una ejecución anterior
+        for name in os.listdir(directory):
+            if name.endswith((".jsonl", ".flushing")):
+                with open(os.path.join(directory, name)) as f:
+                    first = f.readline()
+                if first:
+                    self._dirty.setdefault(json.loads(first)["uid"], 0.0)
+
+    def _path(self, uid: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(uid.encode()).hexdigest() + ".jsonl")
+
+    def _append_sync(self, uid: str, payloads: Sequence[str]) -> None:
+        with open(self._path(uid), "a") as f:
+            f.writelines(json.dumps({"uid": uid, "e": payload}) + "\n" for payload in payloads)
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def append(self, uid: str, payloads: Sequence[str]) -> None:
+        async with self._swaps.setdefault(uid, asyncio.Lock()):
+            await asyncio.to_thread(self._append_sync, uid, payloads)
+        self._dirty.setdefault(uid, time.time())
+
+    async def recover(self) -> None:
+        pass  # los pendientes de una ejecución anterior se leen al construirlo
+
+    async def has_pending(self, uid: str) -> bool:
+        path = self._path(uid)
+        return os.path.exists(path) or os.path.exists(path[:-len(".jsonl")] + ".flushing")
+
+    async def claim(self, limit: int, older_than: float) -> List[str]:
+        ready = sorted(self._dirty.items(), key=lambda item: item[1])
+        if len(ready) < limit:
+            ready = [item for item in ready if item[1] <= older_than]
+        uids = [uid for uid, _ in ready[:limit]]
+        for uid in uids:
+            del self._dirty[uid]
+        return uids
+
+    def _read_sync(self, uid: str) -> Tuple[List[str], Any]:
+        path = self._path(uid)
+        flushing = path[:-len(".jsonl")] + ".flushing"
+        if not os.path.exists(flushing):
+            if not os.path.exists(path):
+                return [], None
+            os.replace(path, flushing)
+        with open(flushing) as f:
+            return [json.loads(line)["e"] for line in f if line.strip()], flushing
+
+    async def read(self, uid: str) -> Tuple[List[str], Any]:
+        lock = self._locks.setdefault(uid, asyncio.Lock())
+        await lock.acquire()
+        try:
+            async with self._swaps.setdefault(uid, asyncio.Lock()):
+                payloads, handle = await asyncio.to_thread(self._read_sync, uid)
+        except Exception:
+            lock.release()
+            raise
+        return payloads, (lock, handle)
+
+    async def ack(self, uid: str, handle: Any) -> None:
+        lock, path = handle
+        try:
+            if path:
+                os.remove(path)
+            if await self.has_pending(uid):
+                self._dirty.setdefault(uid, time.time())
+        finally:
+            lock.release()
+
+    async def release(self, uid: str, handle: Any) -> None:
+        handle[0].release()
+
+    async def retry(self, uid: str) -> None:
+        self._dirty.setdefault(uid, time.time())
+
+
+class WriteBehind:
+    def __init__(self, log: Any, batch_users: int = 200, flush_interval: float = 0.5):
+        self.log = log
+        self.batch_users = batch_users
+        self.flush_interval = flush_interval
+        self._task: Optional[asyncio.Task] = None
+        self.enqueued = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.errors = 0
+
+    async def enqueue(self, uid: str, events: Sequence[CycleEventCreate]) -> List[str]:
+        """Guarda los eventos de forma durable y devuelve sus idempotency_key."""
+        events = [
+            event if event.idempotency_key else event.model_copy(update={"idempotency_key": uuid.uuid4().hex})
+            for event in events
+        ]
+        await self.log.append(uid, [event.model_dump_json() for event in events])
+        self.enqueued += len(events)
+        return [event.idempotency_key for event in events]
+
+    async def ensure_flushed(self, uid: str) -> None:
+        """
+        Read-your-writes: vuelca ya lo pendiente del usuario antes de leer. Si el
+        volcado falla la lectura sigue (sin lo pendiente) y el flusher lo reintenta.
+        """
+        try:
+            if await self.log.has_pending(uid):
+                await self.flush([uid])
+        except Exception as exc:
+            logger.warning("Write-behind: no se pudo volcar %s antes de leer: %s", uid, exc)
+
+    async def flush(self, uids: Sequence[str]) -> int:
+        """
+        Vuelca los usuarios dados en una sola transacción; si falla, usuario a
+        usuario. Devuelve los eventos creados; lanza si algún usuario no se volcó.
+        """
+        from app.services import derived
+
+        batches = []
+        try:
+            for uid in uids:
+                payloads, handle = await self.log.read(uid)
+                batches.append((uid, self._decode(uid, payloads), handle))
+        except Exception:
+            self.errors += 1
+            await self._give_back(batches)
+            await self._give_back([(uid, [], None) for uid in uids[len(batches):]], release=False)
+            raise
+
+        failures: List[Tuple[str, Exception]] = []
+        try:
+            created_by_user = await self._insert(batches)
+        except Exception as exc:
+            if len(batches) == 1:
+                failures.append((batches[0][0], exc))
+                created_by_user = {}
+            else:
+                logger.warning("Write-behind: lote fallido, volcando usuario a usuario: %s", exc)
+                created_by_user = {}
+                for batch in batches:
+                    try:
+                        created_by_user.update(await self._insert([batch]))
+                    except Exception as exc:
+                        failures.append((batch[0], exc))
+
+        failed = {uid for uid, _ in failures}
+        await self._give_back([batch for batch in batches if batch[0] in failed])
+        for uid, events, handle in batches:
+            if uid in failed:
+                continue
+            await self.log.ack(uid, handle)
+            if created_by_user.get(uid):
+                await cache.bump(uid)
+                await derived.submit(uid, [event.date for event in events])
+        self.flushes += 1
+        created = sum(created_by_user.values())
+        self.flushed += created
+        if failures:
+            self.errors += len(failures)
+            raise RuntimeError(f"{len(failures)} usuarios sin volcar; primero {failures[0][0]}: {failures[0][1]}")
+        return created
+
+    @staticmethod
+    def _decode(uid: str, payloads: Sequence[str]) -> List[CycleEventCreate]:
+        events = []
+        for payload in payloads:
+            try:
+                events.append(CycleEventCreate.model_validate_json(payload))
+            except ValueError as exc:
+                # Ilegible: reintentarlo nunca lo arreglaría; queda en el log de errores
+                logger.error("Write-behind: evento de %s descartado (%s): %s", uid, exc, payload)
+        return events
+
+    @staticmethod
+    async def _insert(batches: Sequence[Tuple[str, List[CycleEventCreate], Any]]) -> Dict[str, int]:
+        from app.db.session import AsyncSessionLocal
+        from app.services.events import insert_events
+
+        created_by_user: Dict[str, int] = {}
+        async with AsyncSessionLocal() as db:
+            for uid, events, _ in batches:
+                if events:
+                    results = await insert_events(db, uid, events)
+                    created_by_user[uid] = sum(created for _, created in results)
+            await db.commit()
+        return created_by_user
+
+    async def _give_back(self, batches: Sequence[Tuple[str, Any, Any]], release: bool = True) -> None:
+        for uid, _, handle in batches:
+            if release:
+                await self.log.release(uid, handle)
+            await self.log.retry(uid)
+
+    # --- Flusher en segundo plano ---
+
+    async def _run(self) -> None:
+        try:
+            await self.log.recover()
+        except Exception as exc:
+            logger.warning("Write-behind: no se pudieron recuperar los pendientes: %s", exc)
+        while True:
+            # Dos comprobaciones por intervalo: el claim ya aplica los dos disparadores
+            await asyncio.sleep(self.flush_interval / 2)
+            try:
+                while uids := await self.log.claim(self.batch_users, time.time() - self.flush_interval):
+                    await self.flush(uids)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Write-behind: fallo al volcar, se reintentará: %s", exc)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="write-behind-flusher")
+
+    async def stop(self) -> None:
+        """Detiene el flusher y vuelca todo lo pendiente de este proceso."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            while uids := await self.log.claim(self.batch_users, float("inf")):
+                await self.flush(uids)
+        except Exception as exc:
+            # Lo que falla sigue en el log y se vuelca en el siguiente arranque
+            logger.error("Write-behind: pendientes sin volcar al parar: %s", exc)
+
+    def stats(self) -> dict:
+        return {
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+            "errors": self.errors,
+        }
+
+
+def _build() -> Optional[WriteBehind]:
+    if settings.WRITE_BEHIND == "redis":
+        import redis.asyncio as aioredis
+
+        log = RedisEventLog(aioredis.from_url(
+            settings.REDIS_URL,
+            socket_timeout=settings.REDIS_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_TIMEOUT,
+        ), lease=settings.WRITE_BEHIND_LEASE)
+    elif settings.WRITE_BEHIND == "file":
+        log = FileEventLog(settings.WRITE_BEHIND_DIR)
+    else:
+        return None
+    return WriteBehind(log, settings.WRITE_BEHIND_BATCH_USERS, settings.WRITE_BEHIND_FLUSH_INTERVAL)
+
+
+write_behind = _build()
+
+
+async def ensure_flushed(uid: str) -> None:
+    if write_behind is not None:
+        await write_behind.ensure_flushed(uid)
@@ -0,0 +1,66 @@
+"""Datos sintéticos: usuarios con años de historial diario de CycleEvent."""
+import random
+from datetime import date, timedelta
+from typing import List
+
+from sqlalchemy import insert
+
+from app.db import Base, import_models  # noqa: F401  (registra todas las tablas)
+from app.db.models import CycleEvent, CycleSyncState
+from app.db.session import AsyncSessionLocal, async_engine
+from app.services import summaries
+from app.services.users import upsert_users, user_row
+
+SYMPTOMS = ("cramps", "headache", "mood", "bloating", "acne", "fatigue")
+INSERT_CHUNK = 5000
+
+
+def user_events(uid: str, years: int, rng: random.Random) -> List[dict]:
+    """Un periodo por ciclo (4-6 días) y 0-2 síntomas diarios durante `years` años."""
+    events = []
+    day = date.today() - timedelta(days=365 * years)
+    end = date.today()
+    while day < end:
+        cycle = rng.randint(25, 33)
+        period = rng.randint(4, 6)
+        events.append({"type": "period_start", "date": day})
+        events.append({"type": "period_end", "date": day + timedelta(days=period - 1)})
+        for offset in range(cycle):
+            current = day + timedelta(days=offset)
+            for symptom in rng.sample(SYMPTOMS, rng.randint(0, 2)):
+                events.append({"type": "symptom", "date": current, "meta": {"name": symptom}})
+        day += timedelta(days=cycle)
+    for i, event in enumerate(events):
+        event.setdefault("meta", None)
+        event.update(user_id=uid, idempotency_key=f"seed-{i}", change_seq=i + 1)
+    return events
+
+
+async def seed(users: int, years: int, seed_value: int = 42) -> List[str]:
+    """Crea el esquema (solo benchmarks; en producción es Alembic) y lo llena."""
+    rng = random.Random(seed_value)
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    uids = [f"bench-user-{i:05d}" for i in range(users)]
+    async with AsyncSessionLocal() as db:
+        await upsert_users(db, [
+            user_row(uid, {
+                "nombre": f"Usuaria {i}",
+                "correo": f"{uid}@bench.local",
+                "ciudad": rng.choice(["Bogotá", "Lima", "Quito", "CDMX"]),
+                "pais": rng.choice(["CO", "PE", "EC", "MX"]),
+                "direccion": "N/A",
+                "edad": rng.randint(16, 50),
+            })
+            for i, uid in enumerate(uids)
+        ])
+        for uid in uids:
+            rows = user_events(uid, years, rng)
+            for start in range(0, len(rows), INSERT_CHUNK):
+                await db.execute(insert(CycleEvent), rows[start:start + INSERT_CHUNK])
+            await db.execute(insert(CycleSyncState).values(user_id=uid, change_seq=len(rows)))
+            await summaries.rebuild_user(db, uid)
+        await db.commit()
+    return uids
@@ -0,0 +1,72 @@
+"""
+Entorno de los tests: SQLite en un directorio temporal, sin Redis (cada servicio
+usa su sustituto local) y el Firebase falso de los benchmarks. Las variables se
+fijan antes de importar `app`, que lee la configuración al importarse.
+"""
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+_tmp = tempfile.mkdtemp(prefix="copa-uva-tests-")
+for name, value in {
+    "POSTGRES_USER": "test",
+    "POSTGRES_PASSWORD": "test",
+    "POSTGRES_DB": "test",
+    "POSTGRES_URL": f"sqlite:///{_tmp}/test.db",
+    "SECRET_KEY": "test",
+    "FIREBASE_PROJECT_ID": "copa-uva-test",
+    "FIREBASE_CREDENTIALS": "unused.json",
+    "CACHE_REDIS_ENABLED": "false",
+    "LIVE_REDIS_ENABLED": "false",
+    "RATE_LIMIT_ENABLED": "false",
+    "WRITE_BEHIND": "off",
+    "JOBS": "memory",
+}.items():
+    os.environ[name] = value
+
+import httpx  # noqa: E402
+
+from benchmarks.fake_firebase import FakeFirebase  # noqa: E402
+
+firebase = FakeFirebase(os.environ["FIREBASE_PROJECT_ID"])
+firebase.install()
+
+
+def auth(uid: str) -> dict:
+    return {"Authorization": f"Bearer {firebase.mint(uid)}"}
+
+
+@pytest.fixture
+def api():
+    """Ejecuta `test(client)` contra la app con una base de datos recién creada."""
+    from app.db import Base, async_engine
+    from app.db import import_models  # noqa: F401
+    from app.core.cache import cache
+    from app.main import app
+    from app.services import analytics
+    from app.services.jobs import MemoryBackend, jobs
+    from app.services.timeline import timelines
+
+    def run(test):
+        async def main():
+            jobs.backend = MemoryBackend()
+            cache.clear()
+            analytics._reads.clear()
+            timelines.clear()
+            async with async_engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            try:
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                    return await test(client)
+            finally:
+                await timelines.wait_loading()
+                async with async_engine.begin() as conn:
+                    await conn.run_sync(Base.metadata.drop_all)
+                await async_engine.dispose()
+
+        return asyncio.run(main())
+
+    return run
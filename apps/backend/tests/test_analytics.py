@@ -0,0 +1,149 @@
+from datetime import date
+
+from app.services import analytics
+
+from .conftest import auth
+
+PROFILE = {"nombre": "Ana", "correo": "ana@example.com", "direccion": "Calle 1"}
+
+
+async def _reports():
+    from app.db.session import AsyncSessionLocal
+
+    analytics._reads.clear()
+    async with AsyncSessionLocal() as db:
+        return {
+            (metric, dimension): (await analytics.report(db, metric, dimension))["groups"]
+            for metric in analytics.METRICS
+            for dimension in analytics.DIMENSIONS
+        }
+
+
+def test_profile_change_moves_the_user_contribution(api):
+    from app.services.jobs import jobs
+
+    async def register(client, **profile):
+        response = await client.post(
+            "/api/v1/users/register",
+            json={"firebase_uid": "u1", **PROFILE, **profile},
+            headers=auth("u1"),
+        )
+        assert response.status_code == 200, response.text
+
+    async def post(client, event):
+        response = await client.post("/api/v1/cycle/events", json=event, headers=auth("u1"))
+        assert response.status_code == 200, response.text
+        return response.json()["event_id"]
+
+    async def test(client):
+        # Eventos antes del registro: se atribuyen a "?" hasta que hay perfil
+        await post(client, {"type": "period_start", "date": "2025-01-01"})
+        await jobs.drain()
+        await register(client, pais="CO", ciudad="Bogotá", edad=30)
+        await post(client, {"type": "period_start", "date": "2025-01-29"})
+        symptom = await post(client, {"type": "symptom", "date": "2025-01-02", "meta": {"name": "cólico"}})
+        await jobs.drain()
+
+        # Cambio de perfil con algo pendiente, y un borrado después
+        await post(client, {"type": "symptom", "date": "2025-01-03", "meta": {"name": "acné"}})
+        await register(client, pais="MX", ciudad="CDMX", edad=None)
+        await client.delete(f"/api/v1/cycle/events/{symptom}", headers=auth("u1"))
+        await jobs.drain()
+        incremental = await _reports()
+
+        await analytics.rebuild()
+        rebuilt = await _reports()
+        assert incremental == rebuilt
+        assert set(incremental[("symptom", "pais")]) == {"MX"}
+        assert incremental[("symptom", "pais")]["MX"]["histogram"] == {"acné": 1}
+        assert incremental[("cycle_length", "edad")]["25-34"]["histogram"] == {"28": 1}
+
+    api(test)
+
+
+def test_profile_change_alone_is_derived_off_the_request(api):
+    from app.db.models import CycleSyncState
+    from app.db.session import AsyncSessionLocal
+    from app.services.jobs import jobs
+
+    async def register(client, uid, **profile):
+        response = await client.post(
+            "/api/v1/users/register",
+            json={"firebase_uid": uid, **PROFILE, "correo": f"{uid}@example.com", **profile},
+            headers=auth(uid),
+        )
+        assert response.status_code == 200, response.text
+
+    async def test(client):
+        await register(client, "u1", pais="CO", ciudad="Bogotá")
+        response = await client.post(
+            "/api/v1/cycle/events",
+            json={"type": "symptom", "date": "2025-01-02", "meta": {"name": "cólico"}},
+            headers=auth("u1"),
+        )
+        assert response.status_code == 200, response.text
+        await jobs.drain()
+
+        await register(client, "u1", pais="MX", ciudad="CDMX")
+        assert set((await _reports())[("symptom", "pais")]) == {"CO"}  # el registro no deriva en línea
+        await jobs.drain()
+        assert set((await _reports())[("symptom", "pais")]) == {"MX"}
+
+        # Registrarse sin eventos no toca cycle_sync_state
+        await register(client, "u2", pais="CO", ciudad="Bogotá")
+        await jobs.drain()
+        async with AsyncSessionLocal() as db:
+            assert await db.get(CycleSyncState, "u2") is None
+
+    api(test)
+
+
+def test_symptom_names_tolerates_stored_meta():
+    assert analytics.symptom_names({"names": "Acné"}) == ["acné"]
+    assert analytics.symptom_names({"names": 5}) == ["unspecified"]
+    assert analytics.symptom_names({"names": ["x", 3, None, " Y "]}) == ["x", "y"]
+    assert analytics.symptom_names("raro") == ["unspecified"]
+
+
+def test_malformed_symptom_meta_is_rejected(api):
+    from app.db.models import CycleEvent
+    from app.db.session import AsyncSessionLocal
+    from app.services.jobs import jobs
+
+    async def test(client):
+        for meta in ({"names": 5}, {"names": [1, 2]}, {"name": {"a": 1}}, {"names": ["x" * 65]}):
+            response = await client.post(
+                "/api/v1/cycle/events",
+                json={"type": "symptom", "date": "2025-01-01", "meta": meta},
+                headers=auth("u1"),
+            )
+            assert response.status_code == 422, (meta, response.text)
+
+        response = await client.post(
+            "/api/v1/cycle/events/batch",
+            json={"events": [
+                {"type": "symptom", "date": "2025-01-01", "meta": {"names": 5}},
+                {"type": "symptom", "date": "2025-01-02", "meta": {"names": "acné"}},
+            ]},
+            headers=auth("u1"),
+        )
+        assert [item["status"] for item in response.json()["items"]] == ["error", "created"]
+
+        # Una fila anterior a la validación no rompe el trabajo derivado ni el registro
+        async with AsyncSessionLocal() as db:
+            db.add(CycleEvent(user_id="u1", type="symptom", date=date(2025, 1, 3), meta={"names": 5}))
+            await db.commit()
+        await client.post(
+            "/api/v1/cycle/events",
+            json={"type": "symptom", "date": "2025-01-04", "meta": {"name": "cólico"}},
+            headers=auth("u1"),
+        )
+        await jobs.drain()
+        response = await client.post(
+            "/api/v1/users/register", json={"firebase_uid": "u1", **PROFILE, "pais": "CO", "ciudad": "Cali"}, headers=auth("u1"),
+        )
+        assert response.status_code == 200, response.text
+        await analytics.rebuild()
+        assert (await _reports())[("symptom", "all")][""]["histogram"] == {"acné": 1, "cólico": 1, "unspecified": 1}
+
+    api(test)
@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+import fakeredis
+import fakeredis.aioredis
+
+from app.core.cache import ResponseCache
+
+
+def _cache():
+    server = fakeredis.FakeServer()
+    return ResponseCache(redis=fakeredis.aioredis.FakeRedis(server=server), retry_after=0), server
+
+
+def _loader(values):
+    async def load():
+        values["calls"] += 1
+        return {"value": values["value"]}
+    return load
+
+
+def test_reads_through_redis_and_bump_invalidates():
+    cache, _ = _cache()
+    values = {"value": "a", "calls": 0}
+
+    async def main():
+        first = await cache.get_or_set("u1", "me", "", _loader(values))
+        cached = await cache.get_or_set("u1", "me", "", _loader(values))
+        values["value"] = "b"
+        await cache.bump("u1")
+        return first, cached, await cache.get_or_set("u1", "me", "", _loader(values))
+
+    assert asyncio.run(main()) == ({"value": "a"}, {"value": "a"}, {"value": "b"})
+    assert values["calls"] == 2
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_shared_redis_invalidates_other_processes():
+    server = fakeredis.FakeServer()
+    api, worker = (ResponseCache(redis=fakeredis.aioredis.FakeRedis(server=server)) for _ in range(2))
+    values = {"value": "a", "calls": 0}
+
+    async def main():
+        await api.get_or_set("u1", "me", "", _loader(values))
+        values["value"] = "b"
+        await worker.bump("u1")
+        return await api.get_or_set("u1", "me", "", _loader(values))
+
+    assert asyncio.run(main()) == {"value": "b"}
+
+
+def test_bump_during_outage_is_replayed_after_recovery():
+    cache, server = _cache()
+    values = {"value": "a", "calls": 0}
+
+    async def main():
+        await cache.get_or_set("u1", "me", "", _loader(values))
+        server.connected = False
+        values["value"] = "b"
+        await cache.bump("u1")
+        assert cache.stats()["pending_bumps"] == 1
+        server.connected = True
+        return await cache.get_or_set("u1", "me", "", _loader(values))
+
+    assert asyncio.run(main()) == {"value": "b"}
+    assert cache.stats()["pending_bumps"] == 0
+
+
+def test_entries_under_local_versions_expire_quickly():
+    server = fakeredis.FakeServer()
+    api, worker = (
+        ResponseCache(redis=fakeredis.aioredis.FakeRedis(server=server), retry_after=60, local_ttl=0.05)
+        for _ in range(2)
+    )
+    values = {"value": "a", "calls": 0}
+
+    async def main():
+        server.connected = False
+        first = await api.get_or_set("u1", "me", "", _loader(values))
+        values["value"] = "b"
+        await worker.bump("u1")  # otro worker: este proceso no se entera
+        cached = await api.get_or_set("u1", "me", "", _loader(values))
+        time.sleep(0.1)
+        return first, cached, await api.get_or_set("u1", "me", "", _loader(values))
+
+    assert asyncio.run(main()) == ({"value": "a"}, {"value": "a"}, {"value": "b"})
+    assert values["calls"] == 2
+
+
+def test_lost_version_never_goes_back():
+    cache, _ = _cache()
+    values = {"value": "a", "calls": 0}
+
+    async def main():
+        await cache.get_or_set("u1", "me", "", _loader(values))
+        before = await cache.version("u1")
+        await cache.redis.flushall()  # la LRU local aún tiene la entrada
+        values["value"] = "b"
+        after = await cache.version("u1")
+        return before, after, await cache.get_or_set("u1", "me", "", _loader(values))
+
+    before, after, value = asyncio.run(main())
+    assert int(after[1:]) > int(before[1:])
+    assert value == {"value": "b"}
+
+
+def test_etag_is_per_user():
+    cache, _ = _cache()
+
+    async def main():
+        return await cache.etag("u1", "me", ""), await cache.etag("u2", "me", "")
+
+    first, second = asyncio.run(main())
+    assert first and second and first != second
@@ -0,0 +1,54 @@
+from unittest import mock
+
+from app.schemas.cycles import CycleEventCreate
+from app.services import derived, importer
+
+
+def _events(uid, days, offset=0):
+    return [
+        (offset + i, uid, CycleEventCreate(type="symptom", date=f"2025-01-{day:02d}", meta={"name": "cólico"}))
+        for i, day in enumerate(days)
+    ]
+
+
+def test_reimport_does_not_consume_change_seqs(api):
+    from app.db.models import CycleEvent, CycleSyncState
+    from app.db.session import AsyncSessionLocal
+    from sqlalchemy import select
+
+    async def test(client):
+        async with AsyncSessionLocal() as db:
+            assert (await importer.load_events(db, _events("u1", [1, 2])))[:2] == (2, ["u1"])
+            # El mismo lote otra vez, más un evento nuevo: solo ese recibe secuencia
+            assert (await importer.load_events(db, _events("u1", [1, 2, 3])))[:2] == (1, ["u1"])
+            state = await db.get(CycleSyncState, "u1")
+            seqs = (await db.execute(
+                select(CycleEvent.change_seq).where(CycleEvent.user_id == "u1").order_by(CycleEvent.date)
+            )).scalars().all()
+            return state.change_seq, state.derived_seq, seqs
+
+    assert api(test) == (3, 3, [1, 2, 3])
+
+
+def test_failing_derive_is_reported_per_user(api):
+    from app.db.models import CycleSyncState
+    from app.db.session import AsyncSessionLocal
+
+    real = derived.derive_users
+
+    async def derive_users(db, uids):
+        if "bad" in uids:
+            raise RuntimeError("fila imposible")
+        return await real(db, uids)
+
+    async def test(client):
+        async with AsyncSessionLocal() as db:
+            with mock.patch.object(derived, "derive_users", derive_users):
+                loaded, uids, errors = await importer.load_events(db, _events("good", [1]) + _events("bad", [2], 10))
+            states = {uid: await db.get(CycleSyncState, uid) for uid in uids}
+            return loaded, errors, {uid: (s.change_seq, s.derived_seq) for uid, s in states.items()}
+
+    loaded, errors, states = api(test)
+    assert loaded == 2
+    assert [(error["offset"], error["row"]) for error in errors] == [(10, {"user_id": "bad"})]
+    assert states == {"good": (1, 1), "bad": (1, 0)}  # guardado, derivado pendiente
@@ -0,0 +1,137 @@
+import asyncio
+from collections import Counter
+
+from app.services.jobs import JobQueue, MemoryBackend
+
+from .conftest import auth
+
+
+def _queue(**options) -> JobQueue:
+    return JobQueue(MemoryBackend(), workers=0, coalesce_delay=0, retry_delay=0, **options)
+
+
+def test_burst_of_submits_runs_once():
+    queue = _queue()
+    calls = []
+
+    @queue.handler("derive")
+    async def derive(uid, payload):
+        calls.append((uid, payload))
+
+    async def main():
+        for _ in range(10):
+            await queue.submit("derive", "u1", Counter({"month:2025-01": 1}))
+        await queue.submit("derive", "u2")
+        return await queue.drain()
+
+    assert asyncio.run(main()) == 2
+    assert calls == [("u1", Counter({"month:2025-01": 10})), ("u2", Counter())]
+    assert queue.stats()["done"] == 2
+
+
+def test_failing_handler_is_buried_after_max_attempts():
+    queue = _queue(max_attempts=3)
+    attempts = []
+
+    @queue.handler("derive")
+    async def derive(uid, payload):
+        attempts.append(uid)
+        raise RuntimeError("boom")
+
+    asyncio.run(queue.submit("derive", "u1", Counter({"month:2025-01": 1})))
+    asyncio.run(queue.drain())
+
+    assert attempts == ["u1"] * 3
+    assert [dead["key"] for dead in queue.backend.dead] == ["u1"]
+    assert queue.backend.dead[0]["payload"] == {"month:2025-01": 1}
+    assert asyncio.run(queue.backend.size()) == 0
+    assert (queue.retried, queue.buried) == (2, 1)
+
+
+def test_delete_inside_window_is_not_double_counted(api):
+    from app.db.session import AsyncSessionLocal
+    from app.services import analytics
+    from app.services.jobs import jobs
+
+    async def symptoms():
+        analytics._reads.clear()
+        async with AsyncSessionLocal() as db:
+            groups = (await analytics.report(db, "symptom"))["groups"]
+        return groups.get("", {}).get("histogram", {})
+
+    async def post(client, name, day):
+        response = await client.post(
+            "/api/v1/cycle/events",
+            json={"type": "symptom", "date": f"2025-01-{day:02d}", "meta": {"name": name}},
+            headers=auth("u1"),
+        )
+        assert response.status_code == 200, response.text
+        return response.json()["event_id"]
+
+    async def delete(client, event_id):
+        response = await client.delete(f"/api/v1/cycle/events/{event_id}", headers=auth("u1"))
+        assert response.status_code == 200, response.text
+
+    async def test(client):
+        counted = await post(client, "acné", 1)
+        await post(client, "cólico", 2)
+        await jobs.drain()
+        assert await symptoms() == {"acné": 1, "cólico": 1}
+
+        # Alta y borrado en la misma ventana, más el borrado de uno ya aplicado
+        fleeting = await post(client, "migraña", 3)
+        await delete(client, fleeting)
+        await delete(client, counted)
+        await jobs.drain()
+        await jobs.drain()  # repetir el trabajo no cambia nada
+        incremental = await symptoms()
+
+        await analytics.rebuild()
+        assert incremental == await symptoms() == {"cólico": 1}
+
+    api(test)
+
+
+def test_inline_fallback_never_raises_into_the_request():
+    queue = JobQueue(None, workers=0)
+
+    @queue.handler("derive")
+    async def derive(uid, payload):
+        raise RuntimeError("boom")
+
+    asyncio.run(queue.submit("derive", "u1"))
+    assert (queue.inline, queue.inline_failed) == (1, 1)
+
+
+def test_poison_event_does_not_block_the_window(api):
+    from unittest import mock
+
+    from app.db.models import CycleSyncState
+    from app.db.session import AsyncSessionLocal
+    from app.services import analytics
+    from app.services.jobs import jobs
+
+    real = analytics.symptom_histogram
+
+    def poisoned(events):
+        events = list(events)
+        if any((meta or {}).get("name") == "veneno" for _, meta in events):
+            raise ValueError("meta ilegible")
+        return real(events)
+
+    async def test(client):
+        for name in ("veneno", "cólico"):
+            response = await client.post(
+                "/api/v1/cycle/events",
+                json={"type": "symptom", "date": "2025-01-01", "meta": {"name": name}},
+                headers=auth("u1"),
+            )
+            assert response.status_code == 200
+        with mock.patch.object(analytics, "symptom_histogram", poisoned):
+            await jobs.drain()
+        assert not jobs.backend.dead
+        async with AsyncSessionLocal() as db:
+            state = await db.get(CycleSyncState, "u1")
+            assert state.derived_seq == state.change_seq
+
+    api(test)
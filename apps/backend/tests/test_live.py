@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+from app.core.tickets import StreamTickets, TicketError
+
+from .conftest import auth
+
+
+def test_ticket_opens_one_connection_only():
+    tickets = StreamTickets("secret", ttl=30)
+
+    async def main():
+        ticket = tickets.issue("u1")
+        assert await tickets.redeem(ticket) == "u1"
+        with pytest.raises(TicketError):
+            await tickets.redeem(ticket)
+        payload, _, signature = tickets.issue("u1").partition(".")
+        with pytest.raises(TicketError):
+            await tickets.redeem(f"{payload}x.{signature}")
+
+    asyncio.run(main())
+
+
+def test_expired_ticket_is_rejected():
+    tickets = StreamTickets("secret", ttl=-1)
+
+    async def main():
+        with pytest.raises(TicketError):
+            await tickets.redeem(tickets.issue("u1"))
+
+    asyncio.run(main())
+
+
+def test_live_requires_ticket_instead_of_token_in_url(api):
+    async def test(client):
+        assert (await client.get("/api/v1/cycle/live?access_token=x")).status_code == 401
+        response = await client.post("/api/v1/cycle/live/ticket", headers=auth("u1"))
+        assert response.status_code == 200
+        ticket = response.json()["ticket"]
+        assert (await client.get("/api/v1/cycle/live", params={"ticket": "bad.sig"})).status_code == 401
+        return ticket
+
+    ticket = api(test)
+    assert ticket.count(".") == 1
@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+import jwt
+import pytest
+
+from app.core.security import SigningKeys, TokenVerifier, UnknownKeyError
+from benchmarks.fake_firebase import KEY_ID, FakeFirebase
+
+
+class RotatingKeys(SigningKeys):
+    """Llaves que solo aparecen al refrescar, como tras una rotación de Google."""
+
+    def __init__(self, published):
+        super().__init__(url="", cooldown=0.2)
+        self.published = published
+        self.refreshes = 0
+
+    def refresh(self, force: bool = True) -> None:
+        self.refreshes += 1
+        self._keys = dict(self.published)
+
+
+def test_unknown_kid_forces_one_refresh_per_cooldown():
+    firebase = FakeFirebase("copa-uva")
+    public_key = firebase._private_key.public_key()
+    keys = RotatingKeys({KEY_ID: public_key})
+    verifier = TokenVerifier("copa-uva", keys=keys)
+    claims = jwt.decode(firebase.mint("u1"), options={"verify_signature": False})
+    rotated = jwt.encode(claims, firebase._private_key, algorithm="RS256", headers={"kid": "nueva"})
+
+    async def main():
+        # Sin llaves todavía (el arranque no pudo traerlas): el primer token las trae
+        assert (await verifier.verify_async(firebase.mint("u1")))["uid"] == "u1"
+        assert keys.refreshes == 1
+
+        # Un kid que Google aún no publica no vuelve a refrescar dentro del cooldown
+        for _ in range(3):
+            with pytest.raises(UnknownKeyError):
+                await verifier.verify_async(rotated)
+        assert keys.refreshes == 1
+
+        time.sleep(0.25)
+        keys.published["nueva"] = public_key
+        assert (await verifier.verify_async(rotated))["uid"] == "u1"
+        assert keys.refreshes == 2
+
+    asyncio.run(main())
@@ -0,0 +1,41 @@
+import ipaddress
+
+from starlette.requests import Request
+
+from app.core import throttling
+
+from .conftest import auth
+
+
+def _request(peer: str, *forwarded: str) -> Request:
+    headers = [(b"x-forwarded-for", value.encode()) for value in forwarded]
+    return Request({"type": "http", "headers": headers, "client": (peer, 1234)})
+
+
+def test_client_ip_ignores_forwarded_for_from_untrusted_peers(monkeypatch):
+    monkeypatch.setattr(throttling, "TRUSTED_NETWORKS", [])
+    assert throttling.client_ip(_request("203.0.113.7", "198.51.100.1")) == "203.0.113.7"
+
+
+def test_client_ip_takes_first_untrusted_hop_from_the_right(monkeypatch):
+    monkeypatch.setattr(throttling, "TRUSTED_NETWORKS", [ipaddress.ip_network("10.0.0.0/8")])
+    # El cliente falsea el primer salto; el balanceador añade su IP real
+    request = _request("10.0.0.2", "1.2.3.4, 198.51.100.1", "10.0.0.9")
+    assert throttling.client_ip(request) == "198.51.100.1"
+    assert throttling.client_ip(_request("10.0.0.2")) == "10.0.0.2"
+
+
+def test_batch_ingest_is_rate_limited_per_uid(api, monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(settings, "RATE_LIMIT_PER_UID", "2/60")
+    batch = {"events": [{"type": "symptom", "date": "2025-01-02", "meta": {"name": "cólico"}}]}
+
+    async def test(client):
+        return [
+            (await client.post("/api/v1/cycle/events/batch", json=batch, headers=auth("u1"))).status_code
+            for _ in range(3)
+        ]
+
+    assert api(test) == [200, 200, 429]
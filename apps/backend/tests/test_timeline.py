@@ -0,0 +1,78 @@
+from datetime import date
+
+from app.services import timeline as timeline_module
+from app.services.timeline import Timeline
+
+from .conftest import auth
+
+
+def test_unknown_types_share_one_code_and_keep_their_name():
+    rows = [
+        (1, "period_start", date(2025, 1, 1), None),
+        (2, "mood", date(2025, 1, 2), '{"v": 1}'),
+        (3, "symptom", date(2025, 1, 3), None),
+        (4, "mood", date(2025, 1, 4), None),
+    ] + [(10 + i, f"tipo-{i}", date(2025, 2, 1), None) for i in range(70_000)]
+    timeline = Timeline.from_rows("u1", 1, rows)
+
+    assert len(timeline_module._TYPE_NAMES) == 3  # nada global crece
+    assert [timeline.type_of(i) for i in range(4)] == ["period_start", "mood", "symptom", "mood"]
+    assert timeline.type_of(len(rows) - 1) == "tipo-69999"
+    assert [date.fromordinal(int(o)) for o in timeline.ordinals_of("mood")] == [date(2025, 1, 2), date(2025, 1, 4)]
+    assert list(timeline.ordinals_of("period_start")) == [date(2025, 1, 1).toordinal()]
+    assert timeline.event(1)["meta"] == {"v": 1}
+
+
+def test_cold_reads_use_sql_and_load_the_timeline_off_the_request(api):
+    from app.core.cache import cache
+    from app.services.timeline import timelines
+
+    async def read(client):
+        cache.clear()
+        history = await client.get("/api/v1/cycle/history?limit=2", headers=auth("u1"))
+        calendar = await client.get("/api/v1/cycle/calendar?month=2025-01", headers=auth("u1"))
+        assert history.status_code == calendar.status_code == 200, (history.text, calendar.text)
+        return history.json(), calendar.json()
+
+    async def test(client):
+        for event_type, day in [("period_start", 1), ("period_end", 5), ("symptom", 9), ("period_start", 29)]:
+            response = await client.post(
+                "/api/v1/cycle/events",
+                json={"type": event_type, "date": f"2025-01-{day:02d}", "meta": {"name": "cólico"}},
+                headers=auth("u1"),
+            )
+            assert response.status_code == 200, response.text
+
+        loads = timelines.loads
+        cold = await read(client)  # timeline fría: keyset y cycle_summaries
+        await timelines.wait_loading()
+        assert timelines.loads == loads + 1
+        hits = timelines.hits
+        assert await read(client) == cold  # misma respuesta desde la timeline
+        assert timelines.hits > hits and timelines.loads == loads + 1
+        return cold
+
+    history, calendar = api(test)
+    assert [event["date"] for event in history["events"]] == ["2025-01-29", "2025-01-09"]
+    assert history["next_cursor"]
+    assert calendar["days"][0] & 1 and calendar["days"][8] & 8
+
+
+def test_oversized_timeline_is_not_reloaded_until_it_changes(api):
+    from app.db.models import CycleEvent, CycleSyncState
+    from app.db.session import AsyncSessionLocal
+    from app.services.timeline import TimelineStore
+
+    store = TimelineStore(max_bytes=1)
+
+    async def test(client):
+        async with AsyncSessionLocal() as db:
+            db.add(CycleSyncState(user_id="u1", change_seq=1))
+            db.add(CycleEvent(user_id="u1", type="period_start", date=date(2025, 1, 1), change_seq=1))
+            await db.commit()
+            for _ in range(3):
+                assert await store.resident(db, "u1") is None
+                await store.wait_loading()
+        return store.loads
+
+    assert api(test) == 1
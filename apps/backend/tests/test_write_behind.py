@@ -0,0 +1,74 @@
+import asyncio
+from datetime import date
+from unittest import mock
+
+import fakeredis.aioredis
+import pytest
+
+from app.schemas.cycles import CycleEventCreate
+from app.services.write_behind import RedisEventLog, WriteBehind
+
+from .conftest import auth
+
+
+def _event(day: int) -> CycleEventCreate:
+    return CycleEventCreate(type="period_start", date=date(2025, 1, day))
+
+
+def test_claim_is_leased_and_recovered_after_a_crash():
+    log = RedisEventLog(fakeredis.aioredis.FakeRedis(), lease=0.05)
+
+    async def main():
+        await log.append("u1", ["{}"])
+        assert await log.claim(10, float("inf")) == ["u1"]
+        assert await log.claim(10, float("inf")) == []  # en préstamo
+        await asyncio.sleep(0.1)  # el flusher cayó sin confirmar
+        assert await log.claim(10, float("inf")) == ["u1"]
+        await log.ack("u1", (await log.read("u1"))[1])
+        assert await log.claim(10, float("inf")) == []
+
+    asyncio.run(main())
+
+
+def test_recover_requeues_orphan_streams():
+    redis = fakeredis.aioredis.FakeRedis()
+    log = RedisEventLog(redis)
+
+    async def main():
+        await log.append("u1", ["{}"])
+        await redis.delete(log.dirty)  # p. ej. un ZREM sin préstamo de una versión anterior
+        assert await log.claim(10, float("inf")) == []
+        await log.recover()
+        return await log.claim(10, float("inf"))
+
+    assert asyncio.run(main()) == ["u1"]
+
+
+def test_failing_user_does_not_hold_back_the_batch(api):
+    from app.services import events
+
+    log = RedisEventLog(fakeredis.aioredis.FakeRedis())
+    writer = WriteBehind(log)
+    real = events.insert_events
+
+    async def insert_events(db, uid, batch):
+        if uid == "bad":
+            raise RuntimeError("fila imposible")
+        return await real(db, uid, batch)
+
+    async def test(client):
+        await writer.enqueue("good", [_event(1), _event(29)])
+        await writer.enqueue("bad", [_event(2)])
+        await log.redis.xadd(log._stream("good"), {"e": "no es json"})
+        uids = await log.claim(10, float("inf"))
+        with mock.patch.object(events, "insert_events", insert_events), pytest.raises(RuntimeError):
+            await writer.flush(uids)
+
+        assert not await log.has_pending("good")
+        assert await log.has_pending("bad")
+        assert await log.claim(10, float("inf")) == ["bad"]  # vuelve a pendientes
+        response = await client.get("/api/v1/cycle/history", headers=auth("good"))
+        assert [event["date"] for event in response.json()["events"]] == ["2025-01-29", "2025-01-01"]
+
+    api(test)
+
@@ -62,6 +62,7 @@ export default function RegisterPage() {
             method: "POST",
             headers: {
               "Content-Type": "application/json",
+              Authorization: `Bearer ${await usuario.getIdToken()}`, // 👈 el backend exige el token del propio usuario
             },
             body: JSON.stringify({
               firebase_uid: usuario.uid, // 👈 añadimos el UID de Firebase